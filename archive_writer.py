@@ -0,0 +1,100 @@
+import io
+import os
+import zipfile
+from typing import Callable, List, Optional
+
+from output_store import DiskOutputStore
+
+
+class SplitArchiveWriter:
+    """
+    Streams split VCF files straight into ZIP archives, without writing the VCFs
+    to disk first. A new archive part is started whenever the next file could
+    push the current part past max_part_size.
+
+    A single archive is named "<name>.zip"; when parts are needed they are named
+    "<name>_part1.zip", "<name>_part2.zip", ... Parts are written through store
+    (disk by default).
+    """
+
+    CENTRAL_DIR_ENTRY_SIZE = 128
+
+    def __init__(self, output_dir: str, archive_name: str, max_part_size: int,
+                 on_part: Optional[Callable[[str], None]] = None, store=None):
+        self.output_dir = output_dir
+        self.store = store or DiskOutputStore()
+        self.archive_name = archive_name
+        self.max_part_size = max_part_size
+        self.on_part = on_part
+        self.parts: List[str] = []
+        self._zip: Optional[zipfile.ZipFile] = None
+        self._raw = None
+        self._members = 0
+        self._largest_member = 0
+        self._size_before_member = 0
+
+    def _part_path(self, number: int) -> str:
+        if number == 1:
+            return os.path.join(self.output_dir, f"{self.archive_name}.zip")
+        return os.path.join(self.output_dir, f"{self.archive_name}_part{number}.zip")
+
+    def _open_part(self) -> None:
+        path = self._part_path(len(self.parts) + 1)
+        self._raw = self.store.open(path, binary=True)
+        self._zip = zipfile.ZipFile(self._raw, 'w', compression=zipfile.ZIP_DEFLATED)
+        self._members = 0
+        self.parts.append(path)
+
+    def _close_part(self) -> str:
+        self._zip.close()
+        self._raw.close()
+        self._zip = self._raw = None
+        return self.parts[-1]
+
+    def _track_member_size(self) -> None:
+        if self._zip is not None and self._members:
+            self._largest_member = max(self._largest_member, self._raw.tell() - self._size_before_member)
+
+    def _projected_size(self) -> int:
+        """Part size if one more member as large as the largest so far is added."""
+        # Central directory entries are written on close, allow for them too
+        return (self._raw.tell() + self._largest_member
+                + self.CENTRAL_DIR_ENTRY_SIZE * (self._members + 1))
+
+    def open(self, path: str) -> io.TextIOWrapper:
+        """Open a text stream for the archive member named after path."""
+        self._track_member_size()
+        if self._zip is not None and self._members and self._projected_size() > self.max_part_size:
+            part = self._close_part()
+            if len(self.parts) == 1:
+                # More than one part is needed, so the first one gets a part number too
+                renamed = os.path.join(self.output_dir, f"{self.archive_name}_part1.zip")
+                self.store.rename(part, renamed)
+                self.parts[0] = part = renamed
+            if self.on_part is not None:
+                self.on_part(part)
+        if self._zip is None:
+            self._open_part()
+
+        self._size_before_member = self._raw.tell()
+        self._members += 1
+        member = self._zip.open(os.path.basename(path), 'w')
+        return io.TextIOWrapper(member, encoding='utf-8')
+
+    def close(self) -> List[str]:
+        """Finish the last part and return every archive part in order."""
+        if self._zip is not None:
+            part = self._close_part()
+            if self.on_part is not None:
+                self.on_part(part)
+        return self.parts
+
+    def abort(self) -> None:
+        """Close and delete every part written so far."""
+        if self._zip is not None:
+            try:
+                self._close_part()
+            except Exception:
+                pass
+        for part in self.parts:
+            self.store.discard(part)
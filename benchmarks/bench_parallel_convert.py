@@ -0,0 +1,79 @@
+"""
+Compare in-process and process-pool throughput of txt_to_vcf and excel_to_vcf.
+
+Usage:
+    python benchmarks/bench_parallel_convert.py --rows 2000000 --split 1000 --processes 8
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import vcf_converter  # noqa: E402
+
+
+def make_txt(path: str, rows: int) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(rows):
+            f.write(f"Contact {i},0812{i:08d}\n")
+
+
+def run(label, func, input_file, rows, split_size, parallel):
+    output_dir = tempfile.mkdtemp(prefix="bench_vcf_")
+    try:
+        start = time.perf_counter()
+        files = func(input_file, output_dir, vcf_converter.NamePattern("Kontak {index}"),
+                     split_size, "out", parallel=parallel)
+        elapsed = time.perf_counter() - start
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    print(f"{label:<18} {elapsed:8.3f}s  {rows / elapsed:>12,.0f} rows/s  {len(files)} files")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--split", type=int, default=1000, help="contacts per file, 0 for a single file")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--excel", action="store_true", help="also benchmark the Excel render stage")
+    args = parser.parse_args()
+
+    vcf_converter.configure_process_pool(args.processes)
+    vcf_converter.get_process_pool()
+    work_dir = tempfile.mkdtemp(prefix="bench_input_")
+    try:
+        txt_file = os.path.join(work_dir, "contacts.txt")
+        make_txt(txt_file, args.rows)
+        print(f"{args.rows:,} rows, split={args.split or 'none'}, processes={args.processes}")
+        thread = run("txt in-process", vcf_converter.txt_to_vcf, txt_file, args.rows, args.split, False)
+        process = run("txt process pool", vcf_converter.txt_to_vcf, txt_file, args.rows, args.split, True)
+        print(f"txt speedup: {thread / process:.1f}x")
+
+        if args.excel:
+            # Skip spreadsheet parsing so only the render stage is compared
+            df = pd.DataFrame({
+                "name": [f"Contact {i}" for i in range(args.rows)],
+                "phone": np.arange(args.rows) + 6281200000000,
+            })
+            read_contacts = vcf_converter.read_contacts
+            vcf_converter.read_contacts = lambda *args, **kwargs: df
+            try:
+                thread = run("xlsx in-process", vcf_converter.excel_to_vcf, txt_file, args.rows, args.split, False)
+                process = run("xlsx process pool", vcf_converter.excel_to_vcf, txt_file, args.rows, args.split, True)
+            finally:
+                vcf_converter.read_contacts = read_contacts
+            print(f"xlsx speedup: {thread / process:.1f}x")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        vcf_converter.shutdown_process_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Measure phone-number normalization throughput, alone and as part of TXT parsing.
+
+Usage:
+    python benchmarks/bench_phone_normalizer.py --rows 1000000
+"""
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import vcf_converter  # noqa: E402
+from phone_normalizer import PhoneNormalizer, RejectedRows  # noqa: E402
+
+FORMATS = ["0812-{:08d}", "+62 812 {:08d}", "62812{:08d}", "(0812) {:08d}", "0062812{:08d}"]
+
+
+def make_numbers(rows: int):
+    numbers = [FORMATS[i % len(FORMATS)].format(i) for i in range(rows)]
+    numbers[::100] = ["bukan nomor"] * len(numbers[::100])  # 1% rejected
+    return numbers
+
+
+def run(label, func, rows):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<18} {elapsed:8.3f}s  {rows / elapsed:>12,.0f} numbers/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    normalizer = PhoneNormalizer()
+    numbers = make_numbers(args.rows)
+    lines = [f"Contact {i},{number}" for i, number in enumerate(numbers)]
+    series = pd.Series(numbers, dtype=object)
+    print(f"{args.rows:,} numbers")
+
+    run("normalize_many", lambda: normalizer.normalize_many(numbers), args.rows)
+    run("normalize_series", lambda: normalizer.normalize_series(series), args.rows)
+    rejected = RejectedRows()
+    run("txt parse", lambda: sum(1 for _ in vcf_converter._parse_txt_lines(lines, 1, normalizer, rejected)),
+        args.rows)
+    print(f"rejected: {rejected.count:,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+Reproducible benchmark suite for txt_to_vcf, excel_to_vcf and merge_vcf.
+
+Synthetic inputs are generated from a fixed seed (and cached in --data-dir), every case runs
+in a fresh subprocess so its peak RSS is its own, and the best of --repeat runs is kept.
+Results (throughput, peak RSS, output size) are compared with a JSON baseline; the run
+fails when a case is slower or uses more memory than the baseline by more than --threshold,
+or when its output size changed. Baselines are machine specific, record one per machine.
+
+Cases: txt and xlsx, unsplit and split, with clean and messy rows (blank lines, odd
+formatting, invalid numbers); vcf merges with and without dedupe. XLSX stops at
+1,048,576 rows, the sheet size limit.
+
+Usage:
+    python benchmarks/bench_suite.py --save-baseline
+    python benchmarks/bench_suite.py --sizes 1k,10k,100k,1M,5M --threshold 0.15
+    python benchmarks/bench_suite.py --only txt --sizes 1M
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), "vcf_bench_data")
+XLSX_MAX_ROWS = 1_048_575  # one row is the header
+SPLIT_SIZE = 1000
+# Cases faster than this are dominated by timer noise, their throughput is not compared
+MIN_COMPARED_SECONDS = 0.05
+SEED = 20240601
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().lower()
+    scale = {'k': 1_000, 'm': 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip('km')) * scale)
+
+
+def format_size(rows: int) -> str:
+    if rows >= 1_000_000 and rows % 1_000_000 == 0:
+        return f"{rows // 1_000_000}M"
+    if rows >= 1_000 and rows % 1_000 == 0:
+        return f"{rows // 1_000}k"
+    return str(rows)
+
+
+# Input generation
+def contact_rows(rows: int, messy: bool):
+    """(name, phone) pairs; messy rows mix formats and include blanks and invalid numbers."""
+    rng = random.Random(SEED + rows)
+    for i in range(rows):
+        number = f"812{i:09d}"[-10:]
+        if not messy:
+            yield f"Contact {i}", f"0{number}"
+            continue
+        roll = rng.random()
+        if roll < 0.02:
+            yield "", ""  # blank line
+        elif roll < 0.05:
+            yield f"Contact {i}", rng.choice(["n/a", "12", "-", "tanpa nomor"])
+        elif roll < 0.30:
+            yield f"Contact {i}", f"+62 {number[:3]}-{number[3:7]}-{number[7:]}"
+        elif roll < 0.45:
+            yield f" Contact {i} ", f"(0{number[:3]}) {number[3:]} "
+        elif roll < 0.55:
+            yield f"Contact {i}", f"0062{number}"
+        else:
+            yield f"Contact {i}", f"62{number}"
+
+
+def make_txt(path: str, rows: int, messy: bool) -> None:
+    with open(path, 'w', encoding='utf-8', newline='\r\n' if messy else '\n') as f:
+        for name, phone in contact_rows(rows, messy):
+            f.write(f"{name},{phone}\n" if name else "\n")
+
+
+def make_xlsx(path: str, rows: int, messy: bool) -> None:
+    import pandas as pd
+    names, phones = [], []
+    for name, phone in contact_rows(rows, messy):
+        names.append(name or None)
+        phones.append(phone or None)
+    pd.DataFrame({"name": names, "phone": phones}).to_excel(path, index=False)
+
+
+def make_vcf(path: str, rows: int, messy: bool, offset: int = 0) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(offset, offset + rows):
+            phone = f"+62812{i:08d}" if not messy or i % 3 else f"0812-{i:08d}"
+            f.write(f"BEGIN:VCARD\nVERSION:3.0\nFN:Contact {i}\nTEL;TYPE=CELL:{phone}\nEND:VCARD\n\n")
+
+
+def input_files(kind: str, rows: int, messy: bool, data_dir: str):
+    """Generate (or reuse) the inputs of a case."""
+    os.makedirs(data_dir, exist_ok=True)
+    stem = os.path.join(data_dir, f"{kind}_{rows}_{'messy' if messy else 'clean'}_{SEED}")
+    if kind == "txt":
+        makers = {stem + ".txt": lambda path: make_txt(path, rows, messy)}
+    elif kind == "xlsx":
+        makers = {stem + ".xlsx": lambda path: make_xlsx(path, rows, messy)}
+    else:
+        # Half the contacts repeat across the two merge inputs, so dedupe has work to do
+        makers = {stem + "_a.vcf": lambda path: make_vcf(path, rows, messy),
+                  stem + "_b.vcf": lambda path: make_vcf(path, rows, messy, offset=rows // 2)}
+    for path, maker in makers.items():
+        if not os.path.exists(path):
+            temp_path = path + ".tmp" + os.path.splitext(path)[1]
+            maker(temp_path)
+            os.replace(temp_path, path)
+    return list(makers)
+
+
+# Cases
+def build_cases(sizes, only):
+    cases = []
+    for rows in sizes:
+        for kind in ("txt", "xlsx"):
+            if kind == "xlsx" and rows > XLSX_MAX_ROWS:
+                continue
+            for split in (0, SPLIT_SIZE):
+                for messy in (False, True):
+                    cases.append({"kind": kind, "rows": rows, "split": split, "messy": messy})
+        for dedupe in (False, True):
+            cases.append({"kind": "vcf", "rows": rows, "dedupe": dedupe, "messy": True})
+    if only:
+        cases = [case for case in cases if case["kind"] in only]
+    return cases
+
+
+def case_id(case) -> str:
+    parts = [case["kind"], format_size(case["rows"])]
+    if case["kind"] == "vcf":
+        parts.append("dedupe" if case["dedupe"] else "plain")
+    else:
+        parts.append(f"split{case['split']}" if case["split"] else "single")
+        parts.append("messy" if case["messy"] else "clean")
+    return "/".join(parts)
+
+
+def run_case(case, paths, repeat: int, parallel):
+    """Runs in the child process: the best of repeat runs, plus this process's peak RSS."""
+    import vcf_converter
+    from vcf_merger import merge_vcf
+
+    best, output_bytes = None, 0
+    for _ in range(repeat):
+        output_dir = tempfile.mkdtemp(prefix="bench_out_")
+        try:
+            start = time.perf_counter()
+            if case["kind"] == "vcf":
+                merge_vcf(paths, os.path.join(output_dir, "merged.vcf"), case["dedupe"])
+            else:
+                converter = vcf_converter.txt_to_vcf if case["kind"] == "txt" else vcf_converter.excel_to_vcf
+                converter(paths[0], output_dir, vcf_converter.NamePattern("Kontak {index}"),
+                          case["split"] or None, "out", parallel=parallel)
+            elapsed = time.perf_counter() - start
+            output_bytes = sum(entry.stat().st_size for entry in os.scandir(output_dir))
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+        best = elapsed if best is None else min(best, elapsed)
+    pool = vcf_converter._process_pool
+    if pool is not None:
+        # Reap the workers so their peak RSS shows up in RUSAGE_CHILDREN
+        pool.shutdown(wait=True)
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    rss_unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    rows = case["rows"] * (2 if case["kind"] == "vcf" else 1)
+    return {
+        "rows": rows,
+        "seconds": round(best, 4),
+        "rows_per_sec": round(rows / best, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / rss_unit, 1),
+        "worker_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / rss_unit, 1),
+        "output_bytes": output_bytes,
+    }
+
+
+def run_in_subprocess(case, paths, repeat: int, parallel):
+    payload = json.dumps({"case": case, "paths": paths, "repeat": repeat, "parallel": parallel})
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", payload],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{case_id(case)} failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+# Baseline comparison
+def compare(results, baseline, threshold: float):
+    """Return a list of regression descriptions; cases missing from the baseline are skipped."""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            continue
+        if previous["seconds"] >= MIN_COMPARED_SECONDS \
+                and result["rows_per_sec"] < previous["rows_per_sec"] * (1 - threshold):
+            regressions.append(f"{name}: throughput {result['rows_per_sec']:,.0f} rows/s "
+                               f"< baseline {previous['rows_per_sec']:,.0f}")
+        if result["peak_rss_mb"] > previous["peak_rss_mb"] * (1 + threshold):
+            regressions.append(f"{name}: peak RSS {result['peak_rss_mb']} MB > baseline {previous['peak_rss_mb']} MB")
+        if result["output_bytes"] != previous["output_bytes"]:
+            regressions.append(f"{name}: output size {result['output_bytes']} != baseline {previous['output_bytes']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1k,10k,100k,1M", help="comma separated row counts, e.g. 1k,1M,5M")
+    parser.add_argument("--only", default="", help="comma separated kinds to run: txt, xlsx, vcf")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case, the fastest is kept")
+    parser.add_argument("--mode", choices=("auto", "thread", "process"), default="auto",
+                        help="conversion path, like CONVERSION_MODE")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed slowdown / memory growth as a fraction of the baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="where generated inputs are cached")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        job = json.loads(args.child)
+        print(json.dumps(run_case(job["case"], job["paths"], job["repeat"], job["parallel"])))
+        return
+
+    parallel = {"thread": False, "process": True}.get(args.mode)
+    sizes = [parse_size(size) for size in args.sizes.split(",") if size.strip()]
+    only = {kind.strip() for kind in args.only.split(",") if kind.strip()}
+    results = {}
+    for case in build_cases(sizes, only):
+        name = case_id(case)
+        paths = input_files(case["kind"], case["rows"], case["messy"], args.data_dir)
+        results[name] = result = run_in_subprocess(case, paths, args.repeat, parallel)
+        print(f"{name:<28} {result['seconds']:9.3f}s {result['rows_per_sec']:>13,.0f} rows/s "
+              f"{result['peak_rss_mb']:>8.1f} MB RSS ({result['worker_peak_rss_mb']:.1f} MB workers) "
+              f"{result['output_bytes']:>13,} B out", flush=True)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "mode": args.mode,
+            "seed": SEED,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "results": results,
+    }
+    if args.save_baseline:
+        baseline = {"meta": report["meta"], "results": {}}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline["results"] = json.load(f).get("results", {})
+        baseline["results"].update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline first")
+        return
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+        for regression in regressions:
+            print(f"- {regression}")
+        sys.exit(1)
+    print(f"\nNo regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,466 @@
+"""
+Local stand-in for the Telegram Bot API, for load tests and for running the bot offline.
+
+Serves /bot<token>/<method> and /file/bot<token>/<path> on 127.0.0.1 with the subset of
+methods the bot uses (getMe, getUpdates, sendMessage, editMessageText, deleteMessage,
+sendDocument, getFile, answerCallbackQuery, ...). Tests drive it from the user side:
+FakeUser.send_text / send_document / press_button queue updates for getUpdates, and
+FakeUser.expect waits for the bot's next matching reply in that chat.
+
+Once the bot calls setWebhook, updates are POSTed to the webhook instead (with the secret
+token header and at most max_connections requests in flight), and getUpdates answers 409.
+
+With local_dir it behaves like a server started with --local: getFile answers with the
+absolute path of the file, written under local_dir, and files are not served over HTTP.
+
+Usage as a standalone server (point the bot at it with base_url / base_file_url, or BOT_API_URL):
+    python benchmarks/fake_bot_api.py --token 123:TEST --port 8081
+    python benchmarks/fake_bot_api.py --token 123:TEST --port 8081 --local-dir /tmp/bot-api
+"""
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import random
+import time
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List, Optional, Set
+
+from aiohttp import ClientError, ClientSession, web
+
+BOT_USER = {"id": 1000, "is_bot": True, "first_name": "Fake Bot", "username": "fake_vcf_bot"}
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Methods that may be answered with a 429 when error_rate is set
+FLOOD_METHODS = {"sendMessage", "editMessageText", "sendDocument"}
+
+
+class BotEvent:
+    """Something the bot did in a chat: a sent or edited message, a document, a deletion."""
+
+    def __init__(self, method: str, chat_id: int, message_id: int, text: str = "",
+                 reply_markup: Optional[dict] = None, document: Optional[dict] = None):
+        self.method = method
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.text = text
+        self.reply_markup = reply_markup
+        self.document = document
+        self.time = time.perf_counter()
+
+    def buttons(self) -> List[str]:
+        """callback_data of every inline button."""
+        rows = (self.reply_markup or {}).get("inline_keyboard", [])
+        return [button.get("callback_data") for row in rows for button in row]
+
+    def __repr__(self):
+        return f"BotEvent({self.method}, chat={self.chat_id}, text={self.text[:40]!r})"
+
+
+class FakeBotAPI:
+    """
+    In-memory Bot API. latency delays every answer; error_rate answers that fraction of
+    send/edit calls with a 429 "retry after retry_after" like Telegram's flood control.
+    Sends to chats in blocked_chats get a 403, like users who blocked the bot.
+    local_dir switches to local mode, where getFile stores the file there and returns its path.
+    """
+
+    def __init__(self, token: str, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 error_rate: float = 0.0, retry_after: int = 1, seed: int = 0, local_dir: Optional[str] = None):
+        self.token = token
+        self.local_dir = os.path.abspath(local_dir) if local_dir else None
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.calls: Counter = Counter()
+        self.flood_errors = 0
+        self.blocked_chats: Set[int] = set()
+        self.updates_delivered = 0
+        self._rng = random.Random(seed)
+        self._updates: List[dict] = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        self._new_update = asyncio.Event()
+        self._files: Dict[str, bytes] = {}
+        self._file_names: Dict[str, str] = {}
+        self._messages: Dict[tuple, dict] = {}
+        self._events: Dict[int, asyncio.Queue] = defaultdict(asyncio.Queue)
+        self._runner: Optional[web.AppRunner] = None
+        self.webhook_url: Optional[str] = None
+        self.webhook_failures = 0
+        self._webhook_secret: Optional[str] = None
+        self._webhook_task: Optional[asyncio.Task] = None
+
+    # Server lifecycle
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/bot"
+
+    @property
+    def base_file_url(self) -> str:
+        return f"http://{self.host}:{self.port}/file/bot"
+
+    def make_app(self) -> web.Application:
+        app = web.Application(client_max_size=2 * 1024 ** 3)
+        app.router.add_route("*", "/bot{token}/{method}", self._handle_method)
+        app.router.add_get("/file/bot{token}/{path:.+}", self._handle_file)
+        return app
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self) -> None:
+        await self._stop_webhook()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    # User side
+    def user(self, user_id: int, username: Optional[str] = None) -> "FakeUser":
+        return FakeUser(self, user_id, username or f"user{user_id}")
+
+    def push_update(self, update: dict) -> int:
+        update["update_id"] = next(self._update_ids)
+        self._updates.append(update)
+        self._new_update.set()
+        return update["update_id"]
+
+    def add_file(self, data: bytes) -> str:
+        file_id = f"file{next(self._file_ids)}"
+        self._files[file_id] = data
+        return file_id
+
+    def unique_id(self, file_id: str) -> str:
+        """Like Telegram, every upload of the same content shares one file_unique_id."""
+        return hashlib.sha1(self._files[file_id]).hexdigest()[:16]
+
+    def events(self, chat_id: int) -> asyncio.Queue:
+        return self._events[chat_id]
+
+    def message(self, chat_id: int, message_id: int) -> Optional[dict]:
+        return self._messages.get((chat_id, message_id))
+
+    # Bot side
+    async def _handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        if request.match_info["token"] != self.token:
+            return _error(401, "Unauthorized")
+        self.calls[method] += 1
+        params = await _read_params(request)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method in FLOOD_METHODS and self.error_rate and self._rng.random() < self.error_rate:
+            self.flood_errors += 1
+            return _error(429, f"Too Many Requests: retry after {self.retry_after}",
+                          {"retry_after": self.retry_after})
+        handler = getattr(self, f"_api_{method}", None)
+        if handler is None:
+            return _ok(True)  # setMyCommands, sendChatAction, ...
+        try:
+            return await handler(params)
+        except (KeyError, ValueError) as e:
+            return _error(400, f"Bad Request: {e}")
+
+    async def _handle_file(self, request: web.Request) -> web.StreamResponse:
+        if request.match_info["token"] != self.token:
+            return _error(401, "Unauthorized")
+        file_id = request.match_info["path"].rsplit("/", 1)[-1]
+        data = self._files.get(file_id)
+        self.calls["download"] += 1
+        if data is None or self.local_dir:
+            return _error(404, "Not Found")
+        if request.http_range.start:
+            # Resumed download: "Range: bytes=<offset>-"
+            start = request.http_range.start
+            if start >= len(data):
+                return web.Response(status=416, headers={"Content-Range": f"bytes */{len(data)}"})
+            return web.Response(status=206, body=data[start:],
+                                headers={"Content-Range": f"bytes {start}-{len(data) - 1}/{len(data)}"})
+        return web.Response(body=data)
+
+    async def _api_getMe(self, params):
+        return _ok(BOT_USER)
+
+    async def _api_setWebhook(self, params):
+        await self._stop_webhook()
+        if params.get("drop_pending_updates") in (True, "true", "True"):
+            self._updates.clear()
+        self.webhook_url = params["url"]
+        self._webhook_secret = params.get("secret_token")
+        max_connections = int(params.get("max_connections") or 40)
+        self._webhook_task = asyncio.get_running_loop().create_task(self._deliver_webhook(max_connections))
+        return _ok(True)
+
+    async def _api_deleteWebhook(self, params):
+        await self._stop_webhook()
+        if params.get("drop_pending_updates") in (True, "true", "True"):
+            self._updates.clear()
+        return _ok(True)
+
+    async def _api_getWebhookInfo(self, params):
+        return _ok({"url": self.webhook_url or "", "has_custom_certificate": False,
+                    "pending_update_count": len(self._updates)})
+
+    async def _stop_webhook(self) -> None:
+        self.webhook_url = None
+        if self._webhook_task is not None:
+            self._webhook_task.cancel()
+            await asyncio.gather(self._webhook_task, return_exceptions=True)
+            self._webhook_task = None
+
+    async def _deliver_webhook(self, max_connections: int) -> None:
+        """POST queued updates to the webhook in order, max_connections at a time; failed ones are retried."""
+        slots = asyncio.Semaphore(max_connections)
+        headers = {SECRET_HEADER: self._webhook_secret} if self._webhook_secret else {}
+        posts: Set[asyncio.Task] = set()
+
+        async def post(session, update):
+            try:
+                for attempt in range(5):
+                    try:
+                        async with session.post(self.webhook_url, json=update, headers=headers) as response:
+                            if response.status == 200:
+                                self.updates_delivered += 1
+                                return
+                    except ClientError:
+                        pass
+                    self.webhook_failures += 1
+                    await asyncio.sleep(0.1 * 2 ** attempt)
+            finally:
+                slots.release()
+
+        async with ClientSession() as session:
+            try:
+                while True:
+                    if not self._updates:
+                        self._new_update.clear()
+                        await self._new_update.wait()
+                        continue
+                    await slots.acquire()
+                    task = asyncio.get_running_loop().create_task(post(session, self._updates.pop(0)))
+                    posts.add(task)
+                    task.add_done_callback(posts.discard)
+            finally:
+                for task in posts:
+                    task.cancel()
+                await asyncio.gather(*posts, return_exceptions=True)
+
+    async def _api_getUpdates(self, params):
+        if self.webhook_url:
+            return _error(409, "Conflict: can't use getUpdates method while webhook is active; "
+                               "use deleteWebhook to delete the webhook first")
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        if offset:
+            # Telegram forgets every update below the offset
+            self._updates = [update for update in self._updates if update["update_id"] >= offset]
+        if not self._updates and timeout:
+            self._new_update.clear()
+            try:
+                await asyncio.wait_for(self._new_update.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        updates = self._updates[:limit]
+        self.updates_delivered += len(updates)
+        return _ok(updates)
+
+    async def _api_sendMessage(self, params):
+        if int(params["chat_id"]) in self.blocked_chats:
+            return _error(403, "Forbidden: bot was blocked by the user")
+        message = self._bot_message(int(params["chat_id"]), text=params.get("text", ""),
+                                    reply_markup=params.get("reply_markup"))
+        self._emit("sendMessage", message)
+        return _ok(message)
+
+    async def _api_editMessageText(self, params):
+        chat_id, message_id = int(params["chat_id"]), int(params["message_id"])
+        message = self._messages.get((chat_id, message_id))
+        if message is None:
+            return _error(400, "Bad Request: message to edit not found")
+        if message.get("text") == params.get("text") and message.get("reply_markup") == params.get("reply_markup"):
+            return _error(400, "Bad Request: message is not modified")
+        message = dict(message, text=params.get("text", ""), edit_date=int(time.time()))
+        if params.get("reply_markup"):
+            message["reply_markup"] = params["reply_markup"]
+        else:
+            message.pop("reply_markup", None)
+        self._messages[(chat_id, message_id)] = message
+        self._emit("editMessageText", message)
+        return _ok(message)
+
+    async def _api_deleteMessage(self, params):
+        message = self._messages.pop((int(params["chat_id"]), int(params["message_id"])), None)
+        if message is not None:
+            self._emit("deleteMessage", message)
+        return _ok(True)
+
+    async def _api_sendDocument(self, params):
+        document = params["document"]
+        if isinstance(document, str):
+            # Re-sent by file_id
+            if document not in self._files:
+                return _error(400, "Bad Request: wrong file identifier/HTTP URL specified")
+            # Telegram keeps the name the document was first uploaded with
+            file_id, data, filename = document, self._files[document], self._file_names.get(document, document)
+        else:
+            data, filename = document
+            file_id = self.add_file(data)
+            self._file_names[file_id] = filename
+        info = {"file_id": file_id, "file_unique_id": self.unique_id(file_id), "file_name": filename,
+                "file_size": len(data)}
+        message = self._bot_message(int(params["chat_id"]), document=info, caption=params.get("caption"))
+        self._emit("sendDocument", message)
+        return _ok(message)
+
+    async def _api_getFile(self, params):
+        file_id = params["file_id"]
+        if file_id not in self._files:
+            return _error(400, "Bad Request: invalid file_id")
+        file_path = f"documents/{file_id}"
+        if self.local_dir:
+            # Like telegram-bot-api --local, the file is on the server's disk under an absolute path
+            file_path = os.path.join(self.local_dir, self.token, file_path)
+            if not os.path.exists(file_path):
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                with open(file_path, "wb") as f:
+                    f.write(self._files[file_id])
+        return _ok({"file_id": file_id, "file_unique_id": self.unique_id(file_id), "file_size": len(self._files[file_id]),
+                    "file_path": file_path})
+
+    async def _api_answerCallbackQuery(self, params):
+        return _ok(True)
+
+    def _bot_message(self, chat_id: int, **fields) -> dict:
+        message = {"message_id": next(self._message_ids), "date": int(time.time()), "from": BOT_USER,
+                   "chat": {"id": chat_id, "type": "private"}}
+        message.update({key: value for key, value in fields.items() if value is not None})
+        self._messages[(chat_id, message["message_id"])] = message
+        return message
+
+    def _emit(self, method: str, message: dict) -> None:
+        chat_id = message["chat"]["id"]
+        self._events[chat_id].put_nowait(BotEvent(
+            method, chat_id, message["message_id"], message.get("text") or message.get("caption") or "",
+            message.get("reply_markup"), message.get("document")))
+
+
+class FakeUser:
+    """A private chat with the bot, seen from the user's side."""
+
+    def __init__(self, api: FakeBotAPI, user_id: int, username: str):
+        self.api = api
+        self.user_id = user_id
+        self.from_user = {"id": user_id, "is_bot": False, "first_name": username, "username": username}
+        self.chat = {"id": user_id, "type": "private", "first_name": username, "username": username}
+
+    def _message(self, **fields) -> dict:
+        message = {"message_id": next(self.api._message_ids), "date": int(time.time()),
+                   "chat": self.chat, "from": self.from_user}
+        message.update(fields)
+        return message
+
+    def send_text(self, text: str) -> int:
+        fields = {"text": text}
+        if text.startswith("/"):
+            fields["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return self.api.push_update({"message": self._message(**fields)})
+
+    def send_document(self, filename: str, data: bytes, mime_type: str = "application/octet-stream") -> int:
+        file_id = self.api.add_file(data)
+        document = {"file_id": file_id, "file_unique_id": self.api.unique_id(file_id), "file_name": filename,
+                    "mime_type": mime_type, "file_size": len(data)}
+        return self.api.push_update({"message": self._message(document=document)})
+
+    def press_button(self, message_id: int, data: str) -> int:
+        message = self.api.message(self.user_id, message_id)
+        if message is None:
+            raise KeyError(f"no message {message_id} in chat {self.user_id}")
+        return self.api.push_update({"callback_query": {
+            "id": str(next(self.api._update_ids)), "from": self.from_user, "message": message,
+            "chat_instance": str(self.user_id), "data": data,
+        }})
+
+    async def expect(self, match: Callable[[BotEvent], bool], timeout: float = 60) -> BotEvent:
+        """Wait for the next bot event in this chat that matches, skipping the others (e.g. progress edits)."""
+        queue = self.api.events(self.user_id)
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError
+            event = await asyncio.wait_for(queue.get(), remaining)
+            if match(event):
+                return event
+
+    async def expect_text(self, *fragments: str, timeout: float = 60) -> BotEvent:
+        """Wait for a message or edit containing any of fragments."""
+        return await self.expect(lambda event: event.method in ("sendMessage", "editMessageText")
+                                 and any(fragment in event.text for fragment in fragments), timeout)
+
+    async def expect_document(self, timeout: float = 60) -> BotEvent:
+        return await self.expect(lambda event: event.method == "sendDocument", timeout)
+
+    def drain(self) -> List[BotEvent]:
+        """Drop and return every event received so far."""
+        queue, events = self.api.events(self.user_id), []
+        while not queue.empty():
+            events.append(queue.get_nowait())
+        return events
+
+
+async def _read_params(request: web.Request) -> dict:
+    """Bot API parameters from a query string, JSON, form or multipart body; non-string values are JSON."""
+    params = dict(request.query)
+    if request.content_type == "application/json":
+        params.update(await request.json())
+        return params
+    if request.body_exists:
+        form = await request.post()
+        for key, value in form.items():
+            if hasattr(value, "file"):
+                params[key] = (value.file.read(), value.filename)
+            else:
+                params[key] = value
+    if isinstance(params.get("reply_markup"), str):
+        params["reply_markup"] = json.loads(params["reply_markup"])
+    return params
+
+
+def _ok(result) -> web.Response:
+    return web.json_response({"ok": True, "result": result})
+
+
+def _error(code: int, description: str, parameters: Optional[dict] = None) -> web.Response:
+    body = {"ok": False, "error_code": code, "description": description}
+    if parameters:
+        body["parameters"] = parameters
+    # Telegram answers flood errors and bad requests with the matching HTTP status
+    return web.json_response(body, status=code)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--token", default="123456:TEST")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--local-dir", help="behave like a --local server storing files in this directory")
+    args = parser.parse_args()
+
+    api = FakeBotAPI(args.token, port=args.port, latency=args.latency, error_rate=args.error_rate,
+                     local_dir=args.local_dir)
+    print(f"Fake Bot API on {api.base_url}<token>/, files on {api.base_file_url}<token>/")
+    web.run_app(api.make_app(), host=api.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+End-to-end load test: N simulated users walk through the bot's real conversation flows
+(txt_to_vcf, excel_to_vcf, merge_vcf, create_txt) against a local fake Bot API server.
+
+The bot is built with bot.build_application() and pointed at the fake server, and runs in
+a temporary working directory with its own whitelist, logs and output folders. The report
+gives updates/sec, Bot API calls/sec, per-flow job latency percentiles and error rates.
+Errors are failed steps (timeouts or error replies) and owner error notifications.
+
+Usage:
+    python benchmarks/load_test.py --users 50 --iterations 2 --rows 5000
+    python benchmarks/load_test.py --users 20 --flows txt,merge --latency 0.05 --error-rate 0.02
+    python benchmarks/load_test.py --users 20 --local-mode
+    python benchmarks/load_test.py --users 20 --webhook
+"""
+import argparse
+import asyncio
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+from collections import Counter, defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from fake_bot_api import FakeBotAPI  # noqa: E402
+
+TOKEN = "123456:LOADTEST"
+OWNER_ID = 1
+FLOWS = ("txt", "xlsx", "merge", "create_txt")
+ERROR_REPLIES = ("terjadi kesalahan", "Gagal", "antrian konversi penuh", "tidak memiliki akses",
+                 "Tidak ada kontak yang valid")
+
+
+class FlowError(Exception):
+    """A step of a flow got an error reply or no reply at all."""
+
+
+def make_txt(rows: int, seed: int) -> bytes:
+    lines = []
+    for i in range(rows):
+        if i % 50 == 49:
+            lines.append(f"Contact {i},bukan nomor")
+        else:
+            lines.append(f"Contact {i},0812-{seed % 10_000:04d}-{i:06d}")
+    return ("\n".join(lines) + "\n").encode()
+
+
+def make_xlsx(rows: int) -> bytes:
+    import pandas as pd
+    buffer = io.BytesIO()
+    pd.DataFrame({"name": [f"Contact {i}" for i in range(rows)],
+                  "phone": [f"0813{i:08d}" for i in range(rows)]}).to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def make_vcf(rows: int, offset: int) -> bytes:
+    return "".join(f"BEGIN:VCARD\nVERSION:3.0\nFN:Contact {i}\nTEL;TYPE=CELL:+62814{i:08d}\nEND:VCARD\n\n"
+                   for i in range(offset, offset + rows)).encode()
+
+
+async def expect_text(user, *fragments, timeout):
+    """Wait for one of fragments; an error reply ends the flow."""
+    try:
+        event = await user.expect_text(*(fragments + ERROR_REPLIES), timeout=timeout)
+    except asyncio.TimeoutError:
+        raise FlowError(f"timeout waiting for {fragments[0]!r}")
+    if not any(fragment in event.text for fragment in fragments):
+        raise FlowError(event.text.splitlines()[0])
+    return event
+
+
+async def expect_document(user, timeout):
+    try:
+        return await user.expect_document(timeout=timeout)
+    except asyncio.TimeoutError:
+        raise FlowError("timeout waiting for a document")
+
+
+async def conversion_flow(user, command, filename, data, split, timeout):
+    user.send_text(command)
+    await expect_text(user, "Silakan unggah file", timeout=timeout)
+    user.send_document(filename, data)
+    await expect_text(user, "Masukkan pola Nama kontak", timeout=timeout)
+    user.send_text("Kontak")
+    question = await expect_text(user, "membagi kontak", timeout=timeout)
+    if split:
+        user.press_button(question.message_id, "split")
+        await expect_text(user, "Berapa jumlah kontak", timeout=timeout)
+        user.send_text(str(split))
+        question = await expect_text(user, "mengkustomisasi nomor urut", timeout=timeout)
+        user.press_button(question.message_id, "default_sequence")
+    else:
+        user.press_button(question.message_id, "no_split")
+    await expect_text(user, "Masukkan nama file output", timeout=timeout)
+    user.send_text(os.path.splitext(filename)[0] + "_out")
+    await expect_text(user, "Konversi selesai", timeout=timeout)
+
+
+async def merge_flow(user, name, files, timeout):
+    user.send_text("/merge_vcf")
+    await expect_text(user, "Proses penggabungan", timeout=timeout)
+    for index, data in enumerate(files):
+        user.send_document(f"{name}_{index}.vcf", data)
+        await expect_text(user, "File VCF berhasil diunggah", timeout=timeout)
+    user.send_text("/done")
+    question = await expect_text(user, "Hapus kontak duplikat", timeout=timeout)
+    user.press_button(question.message_id, "dedupe")
+    await expect_text(user, "Masukkan nama file output", timeout=timeout)
+    user.send_text(name)
+    await expect_document(user, timeout)
+
+
+async def create_txt_flow(user, name, timeout):
+    user.send_text("/create_txt")
+    await expect_text(user, "Silakan kirim pesan", timeout=timeout)
+    user.send_text("\n".join(f"Contact {i},0815{i:08d}" for i in range(200)))
+    await expect_text(user, "Masukkan nama file", timeout=timeout)
+    user.send_text(name)
+    await expect_document(user, timeout)
+
+
+async def run_user(api, index, args, inputs, results):
+    user = api.user(OWNER_ID + 1 + index)
+    for iteration in range(args.iterations):
+        flow = args.flows[(index + iteration) % len(args.flows)]
+        # Unique names: the bot keeps inputs and outputs in shared folders
+        name = f"u{user.user_id}_{iteration}"
+        start = time.perf_counter()
+        try:
+            if flow == "txt":
+                await conversion_flow(user, "/txt_to_vcf", f"{name}.txt", inputs["txt"], args.split, args.timeout)
+            elif flow == "xlsx":
+                await conversion_flow(user, "/excel_to_vcf", f"{name}.xlsx", inputs["xlsx"], None, args.timeout)
+            elif flow == "merge":
+                await merge_flow(user, name, inputs["vcf"], args.timeout)
+            else:
+                await create_txt_flow(user, name, args.timeout)
+            results[flow]["latencies"].append(time.perf_counter() - start)
+        except FlowError as e:
+            results[flow]["errors"][str(e)] += 1
+        # Let the bot finish its last messages before the next flow starts
+        await asyncio.sleep(0.05)
+        user.drain()
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(percent / 100 * len(values))) - 1))]
+
+
+async def run(args):
+    from telegram.warnings import PTBUserWarning
+    # The per_message notice is printed for every ConversationHandler with buttons
+    warnings.filterwarnings("ignore", category=PTBUserWarning)
+    import bot
+
+    api = FakeBotAPI(TOKEN, latency=args.latency, error_rate=args.error_rate,
+                     local_dir="bot_api" if args.local_mode else None)
+    await api.start()
+    for index in range(args.users):
+        bot.user_manager.add_user(OWNER_ID + 1 + index, access_limit=10 ** 6)
+
+    inputs = {"txt": make_txt(args.rows, 1), "vcf": [make_vcf(args.rows, 0), make_vcf(args.rows, args.rows // 2)]}
+    if "xlsx" in args.flows:
+        inputs["xlsx"] = make_xlsx(args.rows)
+
+    application = bot.build_application(TOKEN, base_url=api.base_url, base_file_url=api.base_file_url,
+                                        concurrent_updates=args.concurrent_updates)
+    await application.initialize()
+    await bot.post_init(application)
+    await application.start()
+    if args.webhook:
+        # The fake API POSTs updates to the bot's webhook server instead of answering getUpdates
+        webhook = await bot.start_webhook(application, webhook_url="", listen="127.0.0.1", port=0)
+    else:
+        await application.updater.start_polling(poll_interval=0.0, timeout=5)
+
+    results = defaultdict(lambda: {"latencies": [], "errors": Counter()})
+    calls_before = sum(api.calls.values())
+    start = time.perf_counter()
+    await asyncio.gather(*(run_user(api, index, args, inputs, results) for index in range(args.users)))
+    elapsed = time.perf_counter() - start
+    owner_errors = [event.text for event in api.user(OWNER_ID).drain() if "Error" in event.text]
+
+    if args.webhook:
+        await webhook.stop()
+    else:
+        await application.updater.stop()
+    await application.stop()
+    await bot.post_shutdown(application)
+    await application.shutdown()
+    await api.stop()
+
+    jobs = sum(len(result["latencies"]) for result in results.values())
+    failures = sum(sum(result["errors"].values()) for result in results.values())
+    print(f"{args.users} users x {args.iterations} flows, {args.rows:,} rows per file, "
+          f"concurrent_updates={args.concurrent_updates}")
+    print(f"wall time          {elapsed:10.2f}s")
+    print(f"updates/sec        {api.updates_delivered / elapsed:10.1f}  ({api.updates_delivered} updates"
+          + (f" via webhook, {api.webhook_failures} failed posts)" if args.webhook else ")"))
+    print(f"Bot API calls/sec  {(sum(api.calls.values()) - calls_before) / elapsed:10.1f}  "
+          f"(429 injected: {api.flood_errors}, file downloads: {api.calls['download']})")
+    print(f"jobs/sec           {jobs / elapsed:10.2f}")
+    print(f"error rate         {failures / max(1, jobs + failures):10.1%}  "
+          f"({failures} failed flows, {len(owner_errors)} owner error reports)")
+    print(f"\n{'flow':<12}{'jobs':>6}{'errors':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for flow in args.flows:
+        latencies, errors = results[flow]["latencies"], results[flow]["errors"]
+        print(f"{flow:<12}{len(latencies):>6}{sum(errors.values()):>8}"
+              + "".join(f"{percentile(latencies, p):>8.2f}s" for p in (50, 95, 99))
+              + f"{max(latencies, default=0):>8.2f}s")
+    for flow in args.flows:
+        for error, count in results[flow]["errors"].most_common(5):
+            print(f"  {flow}: {count}x {error}")
+    for text in owner_errors[:5]:
+        print(f"  owner: {text.splitlines()[1] if len(text.splitlines()) > 1 else text}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--iterations", type=int, default=1, help="flows each user runs, one after another")
+    parser.add_argument("--flows", default=",".join(FLOWS), help="comma separated: " + ", ".join(FLOWS))
+    parser.add_argument("--rows", type=int, default=2000, help="contacts per generated input file")
+    parser.add_argument("--split", type=int, default=500, help="contacts per file in the txt flow, 0 for one file")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for each bot reply")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the fake API waits before answering")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of sends answered with a 429")
+    parser.add_argument("--concurrent-updates", type=int, default=0,
+                        help="updates the bot handles at once (0: one at a time, like production)")
+    parser.add_argument("--local-mode", action="store_true",
+                        help="fake a Bot API server started with --local, uploads are linked from its disk")
+    parser.add_argument("--webhook", action="store_true", help="deliver updates to the bot's webhook server")
+    parser.add_argument("--keep", action="store_true", help="keep the bot's working directory")
+    args = parser.parse_args()
+    args.flows = [flow.strip() for flow in args.flows.split(",") if flow.strip()]
+    unknown = set(args.flows) - set(FLOWS)
+    if unknown:
+        parser.error(f"unknown flows: {', '.join(sorted(unknown))}")
+
+    # The bot keeps its state relative to the working directory, give it a scratch one
+    work_dir = tempfile.mkdtemp(prefix="vcf_loadtest_")
+    os.chdir(work_dir)
+    os.environ.update({"BOT_TOKEN": TOKEN, "OWNER_ID": str(OWNER_ID), "OWNER_USERNAME": "owner",
+                       "USER_STORAGE": "json", "STATS_PORT": "", "BOT_API_LOCAL": "1" if args.local_mode else "0"})
+    try:
+        failures = asyncio.run(run(args))
+    finally:
+        if args.keep:
+            print(f"\nWorking directory kept at {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
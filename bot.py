@@ -1,5 +1,4 @@
 import os
-import pandas as pd
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
@@ -7,16 +6,42 @@ from telegram.ext import (
     filters, ContextTypes, ConversationHandler
 )
 from user_manager import UserManager
+from user_storage import JsonUserStorage, SQLiteUserStorage
+from job_scheduler import JobScheduler, QueueFullError
+from uploader import Uploader
+from archive_writer import SplitArchiveWriter
+from output_store import DiskOutputStore, MemoryBudget, MemoryOutputStore
+from vcf_merger import merge_vcf
+from phone_normalizer import PhoneNormalizer, RejectedRows
+from usage_logger import UsageLogger, TIMESTAMP_FORMAT
+from log_index import LogIndex, LogQuery
+from usage_stats import UsageStats, CONVERSION_COMMAND, format_conversion_message
+from job_trace import JobTracer
+from broadcaster import Broadcaster
+from result_cache import ResultCache, file_digest
+from file_id_cache import FileIdCache
+from sheet_reader import EXCEL_SUFFIXES, SPREADSHEET_SUFFIXES
+from webhook_server import WebhookServer
+from vcf_converter import (
+    NamePattern, ConversionStats, txt_to_vcf, excel_to_vcf, configure_process_pool, get_process_pool,
+    shutdown_process_pool
+)
 import async_timeout
 import asyncio
-import csv
+import concurrent.futures
+import functools
+import secrets
+import shutil
+import signal
 import time
-from concurrent.futures import ThreadPoolExecutor
 import sys
+from typing import Iterator, Optional
+from urllib.parse import urlparse
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from telegram.error import TelegramError
 import aiohttp
+from aiohttp import web
 
 # Load environment variables
 load_dotenv()
@@ -25,7 +50,45 @@ OWNER_ID = int(os.getenv('OWNER_ID', 0))
 OWNER_USERNAME = os.getenv('OWNER_USERNAME')
 
 # Initialize user manager
-user_manager = UserManager()
+# USER_STORAGE: 'json' (data/users.json) or 'sqlite' (WAL database, imports users.json on first start)
+if os.getenv('USER_STORAGE', 'json').lower() == 'sqlite':
+    user_storage = SQLiteUserStorage(os.getenv('USER_DB_FILE', 'data/users.db'))
+else:
+    user_storage = JsonUserStorage()
+# Changes are saved in the background at most once per USER_FLUSH_INTERVAL seconds (0 saves immediately);
+# the flush thread starts in post_init, after the conversion pool has been forked
+user_manager = UserManager(storage=user_storage, flush_interval=float(os.getenv('USER_FLUSH_INTERVAL', 5)))
+
+# Shared scheduler for conversion jobs
+CONVERSION_WORKERS = int(os.getenv('CONVERSION_WORKERS', min(4, os.cpu_count() or 1)))
+CONVERSION_QUEUE_SIZE = int(os.getenv('CONVERSION_QUEUE_SIZE', 20))
+job_scheduler = JobScheduler(max_workers=CONVERSION_WORKERS, max_queue_size=CONVERSION_QUEUE_SIZE)
+
+# Large inputs are rendered on a process pool: 'auto' by size, 'thread' or 'process' to force a path
+CONVERSION_MODE = os.getenv('CONVERSION_MODE', 'auto').lower()
+PARALLEL_THRESHOLD_MB = float(os.getenv('PARALLEL_THRESHOLD_MB', 8))
+PARALLEL_PROCESSES = int(os.getenv('PARALLEL_PROCESSES', os.cpu_count() or 1))
+configure_process_pool(PARALLEL_PROCESSES)
+
+# Spreadsheet reader: 'auto' uses calamine when installed, else openpyxl in read-only mode
+EXCEL_ENGINE = os.getenv('EXCEL_ENGINE', 'auto').lower()
+EXCEL_ALL_SHEETS = os.getenv('EXCEL_ALL_SHEETS', '0') == '1'  # read contacts from every sheet, not only the first
+
+# Telegram file_ids of uploaded outputs, so identical files are re-sent without another upload
+FILE_ID_TTL_HOURS = float(os.getenv('FILE_ID_TTL_HOURS', 168))
+file_id_cache = FileIdCache(
+    os.path.join('data', 'file_ids.db'),
+    ttl=FILE_ID_TTL_HOURS * 3600,
+    max_entries=int(os.getenv('FILE_ID_CACHE_SIZE', 10000))
+) if FILE_ID_TTL_HOURS > 0 else None
+
+# Shared uploader: bounded concurrency with per-chat and global flood-control pacing
+uploader = Uploader(
+    max_concurrency=int(os.getenv('UPLOAD_CONCURRENCY', 4)),
+    global_rate=float(os.getenv('UPLOAD_GLOBAL_RATE', 25)),
+    chat_rate=float(os.getenv('UPLOAD_CHAT_RATE', 1)),
+    file_id_cache=file_id_cache
+)
 
 # Constants for file operations
 DOWNLOAD_DIR = "downloads"
@@ -39,13 +102,40 @@ ERROR_MESSAGES = {
     "download_timeout": "Waktu unduh habis. Silakan coba lagi dengan file yang lebih kecil.",
     "processing_error": "Maaf, terjadi kesalahan saat memproses file. Admin telah diberitahu.",
     "unsupported_format": "Format file tidak didukung.",
-    "empty_filename": "Nama file tidak boleh kosong. Silakan masukkan nama file lagi."
+    "empty_filename": "Nama file tidak boleh kosong. Silakan masukkan nama file lagi.",
+    "queue_full": "Bot sedang sibuk dan antrian konversi penuh. Silakan coba lagi dalam beberapa menit."
 }
 
 # Constants
 MAX_DOWNLOAD_TIMEOUT = 300  # 5 minutes timeout for downloads
-MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB max file size
+# Self-hosted Bot API server (telegram-bot-api), e.g. http://localhost:8081; unset uses api.telegram.org
+BOT_API_URL = os.getenv('BOT_API_URL', '').rstrip('/')
+# The server runs with --local: files up to 2000MB, stored on its disk where the bot links them from
+BOT_API_LOCAL = os.getenv('BOT_API_LOCAL', '0') == '1'
+MAX_FILE_SIZE = int(float(os.getenv('MAX_FILE_MB', 2000 if BOT_API_LOCAL else 50)) * 1024 * 1024)
 FILE_UPLOAD_TIMEOUT = 60  # 1 minute timeout for file uploads
+PROGRESS_EDIT_INTERVAL = 2  # seconds between progress message edits
+# TXT uploads are converted while they download instead of being saved to INPUT_DIR first
+STREAM_TXT_UPLOADS = os.getenv('STREAM_TXT_UPLOADS', '1') != '0'
+# Streamed downloads wait on the converter, so only the connection and each read are bounded
+STREAM_DOWNLOAD_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60)
+# Longest a converter thread waits for the next streamed chunk (covers iter_download's own retries)
+STREAM_CHUNK_TIMEOUT = MAX_DOWNLOAD_TIMEOUT
+STREAM_CLOSE_TIMEOUT = 5
+DOWNLOAD_CONNECTIONS = int(os.getenv('DOWNLOAD_CONNECTIONS', 16))  # pooled connections for file downloads
+# Stay under the upload cap: 50MB, or 2000MB through a local Bot API server
+ARCHIVE_PART_MAX_SIZE = int(float(os.getenv('ARCHIVE_PART_MAX_MB', 1900 if BOT_API_LOCAL else 45)) * 1024 * 1024)
+
+# Conversion output: 'disk' writes to OUTPUT_DIR, 'memory' keeps outputs in capped spooled buffers
+OUTPUT_MODE = os.getenv('OUTPUT_MODE', 'disk').lower()
+MEMORY_OUTPUT_FILE_SIZE = int(float(os.getenv('MEMORY_OUTPUT_FILE_MB', 8)) * 1024 * 1024)
+memory_output_budget = MemoryBudget(int(float(os.getenv('MEMORY_OUTPUT_BUDGET_MB', 256)) * 1024 * 1024))
+
+# Created by get_http_session() and reused for every download
+http_session = None
+
+# Phone numbers starting with a trunk "0" get this country code
+phone_normalizer = PhoneNormalizer(os.getenv('DEFAULT_COUNTRY_CODE', '62'))
 
 # Create necessary directories
 for directory in [DOWNLOAD_DIR, OUTPUT_DIR, INPUT_DIR, 'data']:
@@ -54,26 +144,80 @@ for directory in [DOWNLOAD_DIR, OUTPUT_DIR, INPUT_DIR, 'data']:
 # Log user interactions
 LOG_FILE = os.path.join('data', 'usage_log.csv')
 
-# Ensure log file exists
-if not os.path.exists(LOG_FILE):
-    with open(LOG_FILE, 'w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(['timestamp', 'user_id', 'username', 'command', 'message'])
+# SQLite index over the log for /view_logs, filled from the CSV on first start
+log_index = LogIndex(os.path.join('data', 'usage_log.db'))
+LOG_PAGE_SIZE = 20
+
+# Rows are buffered and written in batches by a background task (started in post_init)
+usage_logger = UsageLogger(
+    LOG_FILE,
+    max_bytes=int(float(os.getenv('LOG_MAX_MB', 10)) * 1024 * 1024),
+    max_age=float(os.getenv('LOG_ROTATE_HOURS', 0)) * 3600,
+    compress=os.getenv('LOG_COMPRESS', '1') != '0',
+    on_batch=log_index.add_rows
+)
+
+# Live aggregates for /stats, rebuilt from the log index in post_init
+usage_stats = UsageStats(queue_depth=lambda: job_scheduler.queue_depth, running_jobs=lambda: job_scheduler.running)
+# Prometheus text endpoint on 127.0.0.1, disabled unless a port is set
+STATS_PORT = int(os.getenv('STATS_PORT') or 0)
+stats_server = None
+
+# 'polling', or 'webhook' to have Telegram POST updates to WEBHOOK_URL (served on WEBHOOK_LISTEN:WEBHOOK_PORT)
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8443))
+# Without a configured secret a random one is registered on every start
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or secrets.token_urlsafe(32)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', 40))  # parallel deliveries Telegram may open
+
+# Outputs of finished conversions, reused when the same input is converted with the same options
+RESULT_CACHE_MAX_BYTES = int(float(os.getenv('RESULT_CACHE_MB', 512)) * 1024 * 1024)
+result_cache = ResultCache(
+    os.getenv('RESULT_CACHE_DIR', os.path.join('data', 'result_cache')), RESULT_CACHE_MAX_BYTES
+) if RESULT_CACHE_MAX_BYTES > 0 else None
+
+# Per-stage timings of every conversion job, kept as latency histograms and appended to a JSON-lines trace
+job_tracer = JobTracer(
+    os.getenv('TRACE_FILE', os.path.join('data', 'job_trace.jsonl')) or None,
+    max_bytes=int(float(os.getenv('TRACE_MAX_MB', 10)) * 1024 * 1024)
+)
+
+def prune_blocked_user(user_id: int):
+    """Drop a user who blocked the bot from the whitelist; owners are never removed."""
+    if not user_manager.is_owner(user_id) and user_manager.remove_user(user_id):
+        print(f"Removed user {user_id}: the bot was blocked")
+
+# Broadcasts run in the background, paced under Telegram's flood limits and resumed after a restart
+broadcaster = Broadcaster(
+    os.path.join('data', 'broadcast.json'),
+    concurrency=int(os.getenv('BROADCAST_CONCURRENCY', 8)),
+    rate=float(os.getenv('BROADCAST_RATE', 20)),
+    on_blocked=prune_blocked_user
+)
 
 async def log_interaction(update: Update, command: str):
     user_id = update.effective_user.id
     username = update.effective_user.username
     message = update.message.text if update.message else ''
-    timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
-    
-    with open(LOG_FILE, 'a', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow([timestamp, user_id, username, command, message])
+    timestamp = time.strftime(TIMESTAMP_FORMAT, time.gmtime())
+
+    usage_logger.log([timestamp, user_id, username, command, message])
+    usage_stats.record_command(command)
+
+def log_conversion(update: Update, contacts: int, bytes_in: int, bytes_out: int):
+    """Record a finished conversion in the usage log and the live aggregates."""
+    timestamp = time.strftime(TIMESTAMP_FORMAT, time.gmtime())
+    usage_logger.log([timestamp, update.effective_user.id, update.effective_user.username,
+                      CONVERSION_COMMAND, format_conversion_message(contacts, bytes_in, bytes_out)])
+    usage_stats.record_conversion(update.effective_user.id, contacts, bytes_in, bytes_out)
 
 # State definitions for ConversationHandler
 ASK_PATTERN, ASK_SPLIT, ASK_SPLIT_SIZE, ASK_SEQUENCE, ASK_FILENAME = range(5)
 CREATE_TXT_MESSAGE, CREATE_TXT_FILENAME = range(5, 7)
 UPLOAD_VCF_FILES, ASK_VCF_FILENAME = range(7, 9)
+ASK_VCF_DEDUPE = 9
 
 def check_whitelist(user_id: int) -> bool:
     """Check if user is whitelisted and has remaining access"""
@@ -91,7 +235,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         "Halo! Pilih fitur yang ingin Anda gunakan:\n"
         "- /txt_to_vcf: Konversi file .txt ke .vcf\n"
-        "- /excel_to_vcf: Konversi file .xlsx ke .vcf\n"
+        "- /excel_to_vcf: Konversi file Excel/CSV (.xlsx, .xls, .ods, .csv) ke .vcf\n"
         "- /create_txt: Buat file txt dari pesan\n"
         "- /merge_vcf: Gabungkan file .vcf\n"
         "- /checklimit: Cek sisa limit Anda\n"
@@ -180,116 +324,6 @@ async def set_access_limit(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_manager.set_access_limit(user_id, limit)
     await update.message.reply_text(f"Batas akses untuk user ID {user_id} telah diatur menjadi {limit}.")
 
-# File conversion functions
-def txt_to_vcf(input_file, output_dir, custom_name_func, split_size, custom_filename, sequence_start=1):
-    try:
-        with open(input_file, 'r', encoding='utf-8') as txt_file:
-            lines = [line.strip() for line in txt_file if line.strip()]
-
-        os.makedirs(output_dir, exist_ok=True)
-        vcf_data = []
-        file_index = sequence_start
-
-        for index, line in enumerate(lines, start=1):
-            try:
-                name, phone = (line.split(',') + [None])[:2]
-                phone = phone.strip() if phone else name.strip()
-                if not phone.startswith('+'):
-                    phone = f"+{phone}"
-
-                # Use the custom name pattern and add sequence number
-                formatted_name = f"{custom_name_func(index)} {index}"
-                vcf_data.append(f"""BEGIN:VCARD
-VERSION:3.0
-FN:{formatted_name}
-TEL;TYPE=CELL:{phone}
-END:VCARD
-
-""")
-
-                if split_size and len(vcf_data) == split_size:
-                    output_file = os.path.join(output_dir, f"{custom_filename}{file_index}.vcf")
-                    with open(output_file, 'w', encoding='utf-8') as vcf_file:
-                        vcf_file.write(''.join(vcf_data))
-                    file_index += 1
-                    vcf_data = []
-            except ValueError as e:
-                print(f"Baris tidak valid, dilewati: {e}")
-
-        if vcf_data:
-            if split_size:
-                output_file = os.path.join(output_dir, f"{custom_filename}{file_index}.vcf")
-            else:
-                output_file = os.path.join(output_dir, f"{custom_filename}.vcf")
-            with open(output_file, 'w', encoding='utf-8') as vcf_file:
-                vcf_file.write(''.join(vcf_data))
-
-        # Return list of created files
-        if split_size:
-            return [os.path.join(output_dir, f"{custom_filename}{i}.vcf") 
-                    for i in range(sequence_start, file_index + (1 if vcf_data else 0))]
-        else:
-            return [output_file]
-    except Exception as e:
-        raise Exception(f"Error in txt_to_vcf: {str(e)}")
-
-def excel_to_vcf(input_file, output_dir, custom_name_func, split_size, custom_filename, sequence_start=1):
-    try:
-        df = pd.read_excel(input_file)
-        os.makedirs(output_dir, exist_ok=True)
-        vcf_data, file_index = [], sequence_start
-
-        for index, row in df.iterrows():
-            try:
-                # Get name and phone from DataFrame
-                name = str(row.iloc[0]).strip() if pd.notna(row.iloc[0]) else None
-                phone = str(row.iloc[1]).strip() if len(row) > 1 and pd.notna(row.iloc[1]) else name
-
-                # Skip if name or phone is NaN
-                if name is None or phone is None:
-                    print(f"Row {index} has NaN values, skipping.")
-                    continue
-
-                if not phone.startswith('+'):
-                    phone = f"+{phone}"
-
-                # Use the custom name pattern and add sequence number
-                current_index = index + 1  # Excel is 0-based, add 1 for consistency
-                formatted_name = f"{custom_name_func(current_index)} {current_index}"
-                vcf_data.append(f"""BEGIN:VCARD
-VERSION:3.0
-FN:{formatted_name}
-TEL;TYPE=CELL:{phone}
-END:VCARD
-
-""")
-
-                if split_size and len(vcf_data) == split_size:
-                    output_file = os.path.join(output_dir, f"{custom_filename}{file_index}.vcf")
-                    with open(output_file, 'w', encoding='utf-8') as vcf_file:
-                        vcf_file.write(''.join(vcf_data))
-                    file_index += 1
-                    vcf_data = []
-            except Exception as e:
-                print(f"Baris tidak valid, dilewati: {e}")
-
-        if vcf_data:
-            if split_size:
-                output_file = os.path.join(output_dir, f"{custom_filename}{file_index}.vcf")
-            else:
-                output_file = os.path.join(output_dir, f"{custom_filename}.vcf")
-            with open(output_file, 'w', encoding='utf-8') as vcf_file:
-                vcf_file.write(''.join(vcf_data))
-
-        # Return list of created files
-        if split_size:
-            return [os.path.join(output_dir, f"{custom_filename}{i}.vcf") 
-                    for i in range(sequence_start, file_index + (1 if vcf_data else 0))]
-        else:
-            return [output_file]
-    except Exception as e:
-        raise Exception(f"Error in excel_to_vcf: {str(e)}")
-
 # File handlers
 async def txt_to_vcf_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await log_interaction(update, '/txt_to_vcf')
@@ -305,7 +339,7 @@ async def excel_to_vcf_handler(update: Update, context: ContextTypes.DEFAULT_TYP
         await update.message.reply_text(ERROR_MESSAGES["access_denied"].format(OWNER_USERNAME))
         return
 
-    await update.message.reply_text("Silakan unggah file .xlsx untuk dikonversi ke .vcf.")
+    await update.message.reply_text("Silakan unggah file .xlsx, .xls, .ods atau .csv untuk dikonversi ke .vcf.")
 
 async def handle_txt_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle uploaded TXT files."""
@@ -315,10 +349,28 @@ async def handle_txt_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text(ERROR_MESSAGES["access_denied"].format(OWNER_USERNAME))
             return ConversationHandler.END
         
+        document = update.message.document
+        if should_stream_txt(document.file_size):
+            # Downloaded by the conversion job once the options are known, parsed as it arrives
+            if document.file_size > MAX_FILE_SIZE:
+                await update.message.reply_text(
+                    ERROR_MESSAGES["file_too_large"].format(MAX_FILE_SIZE // (1024*1024))
+                )
+                return ConversationHandler.END
+            context.user_data['input_document'] = document
+            context.user_data['input_unique_id'] = document.file_unique_id
+            context.user_data['input_file'] = os.path.join(INPUT_DIR, document.file_name)
+            await update.message.reply_text(
+                "Masukkan pola Nama kontak"
+            )
+            return ASK_PATTERN
+
         file_path, success = await safe_file_download(update, context, "TXT")
         if not success:
             return ConversationHandler.END
         
+        context.user_data['input_document'] = None
+        context.user_data['input_unique_id'] = update.message.document.file_unique_id
         context.user_data['input_file'] = file_path
         await update.message.reply_text(
             "Masukkan pola Nama kontak"
@@ -334,7 +386,7 @@ async def handle_txt_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
 
 async def handle_excel_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle uploaded Excel files."""
+    """Handle uploaded spreadsheets (Excel, OpenDocument or CSV)."""
     try:
         await log_interaction(update, 'handle_excel_file')
         if not check_whitelist(update.effective_user.id):
@@ -345,6 +397,8 @@ async def handle_excel_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if not success:
             return ConversationHandler.END
         
+        context.user_data['input_document'] = None
+        context.user_data['input_unique_id'] = update.message.document.file_unique_id
         context.user_data['input_file'] = file_path
         await update.message.reply_text(
             "Masukkan pola Nama kontak"
@@ -368,6 +422,9 @@ async def ask_split(update: Update, context: ContextTypes.DEFAULT_TYPE):
         [
             InlineKeyboardButton("Ya, Split File", callback_data='split'),
             InlineKeyboardButton("Tidak Perlu Split", callback_data='no_split')
+        ],
+        [
+            InlineKeyboardButton("Split & Kirim sebagai ZIP", callback_data='split_zip')
         ]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -383,10 +440,12 @@ async def handle_split_choice(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.answer()
     
     choice = query.data
-    if choice == 'split':
+    if choice in ('split', 'split_zip'):
+        context.user_data['delivery'] = 'zip' if choice == 'split_zip' else 'files'
         await query.message.edit_text("Berapa jumlah kontak per file (masukkan angka)?")
         return ASK_SPLIT_SIZE
     else:
+        context.user_data['delivery'] = 'files'
         context.user_data['split_size'] = None
         context.user_data['sequence_start'] = 1  # Set default sequence
         await ask_filename(update, context)  # Skip to filename question
@@ -464,10 +523,13 @@ async def generate_vcf(update: Update, context: ContextTypes.DEFAULT_TYPE):
         custom_name_pattern = context.user_data['custom_name_pattern']
         split_size = context.user_data.get('split_size')
         sequence_start = context.user_data.get('sequence_start', 1)
+        delivery = context.user_data.get('delivery', 'files')
 
         success = await process_file_conversion(
             update, context, input_file, custom_name_pattern, 
-            split_size, custom_filename, sequence_start
+            split_size, custom_filename, sequence_start, delivery,
+            document=context.user_data.pop('input_document', None),
+            source_id=context.user_data.pop('input_unique_id', None)
         )
         if not success:
             return ConversationHandler.END
@@ -487,6 +549,98 @@ async def notify_owner_error(context: ContextTypes.DEFAULT_TYPE, error_msg: str,
         error_text += f"User ID: {user_id}"
     await context.bot.send_message(chat_id=OWNER_ID, text=error_text)
 
+async def get_http_session() -> aiohttp.ClientSession:
+    """Shared keep-alive session for file downloads, created on first use and closed in post_shutdown."""
+    global http_session
+    if http_session is None or http_session.closed:
+        http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=DOWNLOAD_CONNECTIONS, keepalive_timeout=60)
+        )
+    return http_session
+
+def should_stream_txt(file_size: int) -> bool:
+    """TXT uploads are parsed while they download, unless they are large enough for the process pool."""
+    if not STREAM_TXT_UPLOADS or BOT_API_LOCAL:
+        # A local Bot API server already has the whole file on disk, nothing to overlap with
+        return False
+    if OUTPUT_MODE == 'memory' or CONVERSION_MODE == 'thread':
+        return True
+    if CONVERSION_MODE == 'process':
+        return False
+    return file_size < PARALLEL_THRESHOLD_MB * 1024 * 1024 or PARALLEL_PROCESSES <= 1
+
+async def iter_download(file_url: str, chunk_size: int = 1024 * 1024):
+    """
+    Yield the bytes of file_url as they arrive over the shared session.
+    A dropped connection is resumed with a Range request after the bytes already yielded.
+    """
+    MAX_RETRIES = 3
+    RETRY_DELAY = 2  # seconds
+    position = 0
+    for attempt in range(MAX_RETRIES):
+        try:
+            session = await get_http_session()
+            headers = {'Range': f'bytes={position}-'} if position else None
+            async with session.get(file_url, headers=headers, timeout=STREAM_DOWNLOAD_TIMEOUT) as response:
+                if response.status == 416 and position:
+                    return  # Everything arrived before the connection dropped
+                response.raise_for_status()
+                # Without Range support the body starts over, skip what was already yielded
+                skip = position if response.status != 206 else 0
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    if skip:
+                        skipped = min(skip, len(chunk))
+                        chunk, skip = chunk[skipped:], skip - skipped
+                        if not chunk:
+                            continue
+                    position += len(chunk)
+                    yield chunk
+            return
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if attempt == MAX_RETRIES - 1:
+                raise
+            await asyncio.sleep(RETRY_DELAY)
+
+def stream_download(file_url: str, loop: asyncio.AbstractEventLoop,
+                    timeout: float = STREAM_CHUNK_TIMEOUT) -> Iterator[bytes]:
+    """
+    Blocking iterator over iter_download() for a converter thread; the download itself runs on loop.
+    Raises TimeoutError when no chunk arrives within timeout seconds, e.g. because the loop stopped.
+    """
+    chunks = iter_download(file_url)
+    try:
+        while True:
+            future = asyncio.run_coroutine_threadsafe(chunks.__anext__(), loop)
+            try:
+                yield future.result(timeout)
+            except StopAsyncIteration:
+                return
+            except concurrent.futures.TimeoutError:
+                future.cancel()
+                raise TimeoutError(f"Download stalled: no data received for {timeout:g}s")
+    finally:
+        try:
+            asyncio.run_coroutine_threadsafe(chunks.aclose(), loop).result(STREAM_CLOSE_TIMEOUT)
+        except (concurrent.futures.TimeoutError, RuntimeError) as e:
+            # The loop is gone or stuck; the generator is dropped with it
+            print(f"Could not close download of {file_url}: {str(e) or type(e).__name__}")
+
+async def fetch_local_file(file, file_path: str) -> bool:
+    """
+    In local mode, hard-link the upload the Bot API server stored on disk to file_path (or copy
+    it from another filesystem). Returns False when the file has to be downloaded instead.
+    """
+    if not BOT_API_LOCAL or not file.file_path or not os.path.isabs(file.file_path):
+        return False
+    if os.path.exists(file_path):
+        os.remove(file_path)
+    try:
+        await asyncio.to_thread(os.link, file.file_path, file_path)
+    except OSError:
+        # Another filesystem, or links not supported
+        await asyncio.to_thread(shutil.copyfile, file.file_path, file_path)
+    return True
+
 async def safe_file_download(update: Update, context: ContextTypes.DEFAULT_TYPE, file_type: str) -> tuple[str, bool]:
     """
     Safely download file with proper error handling and chunked download
@@ -495,6 +649,7 @@ async def safe_file_download(update: Update, context: ContextTypes.DEFAULT_TYPE,
     MAX_RETRIES = 3
     RETRY_DELAY = 2  # seconds
     CHUNK_SIZE = 1024 * 1024  # 1MB chunks
+    started = time.perf_counter()
     
     try:
         # Validate file size
@@ -509,29 +664,47 @@ async def safe_file_download(update: Update, context: ContextTypes.DEFAULT_TYPE,
         file = await update.message.document.get_file()
         file_path = os.path.join(INPUT_DIR, update.message.document.file_name)
         temp_path = f"{file_path}.temp"
+
+        if await fetch_local_file(file, file_path):
+            # Picked up by the conversion job trace
+            context.user_data['download_seconds'] = time.perf_counter() - started
+            return file_path, True
         
         status_msg = await update.message.reply_text("Mengunduh file... 0%")
         
+        # A leftover from an earlier upload with the same name must not be resumed
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        last_progress_edit = time.monotonic()
+        
         for attempt in range(MAX_RETRIES):
             try:
-                downloaded_size = 0
-                last_progress = 0
-                
                 async with async_timeout.timeout(MAX_DOWNLOAD_TIMEOUT):
-                    # Download in chunks to temp file
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(file.file_path) as response:
-                            with open(temp_path, 'wb') as f:
+                    # Continue after the bytes a dropped attempt already wrote
+                    downloaded_size = os.path.getsize(temp_path) if os.path.exists(temp_path) else 0
+                    headers = {'Range': f'bytes={downloaded_size}-'} if downloaded_size else None
+                    session = await get_http_session()
+                    async with session.get(file.file_path, headers=headers) as response:
+                        if response.status == 416 and downloaded_size >= file_size:
+                            pass  # Everything arrived before the connection dropped
+                        else:
+                            response.raise_for_status()
+                            if response.status != 206:
+                                downloaded_size = 0  # Range not honoured, start over
+                            with open(temp_path, 'ab' if downloaded_size else 'wb') as f:
                                 async for chunk in response.content.iter_chunked(CHUNK_SIZE):
-                                    if chunk:
-                                        f.write(chunk)
-                                        downloaded_size += len(chunk)
-                                        progress = int((downloaded_size / file_size) * 100)
-                                        
-                                        # Update progress every 10%
-                                        if progress - last_progress >= 10:
+                                    f.write(chunk)
+                                    downloaded_size += len(chunk)
+                                    
+                                    # Update progress at most every PROGRESS_EDIT_INTERVAL seconds
+                                    now = time.monotonic()
+                                    if now - last_progress_edit >= PROGRESS_EDIT_INTERVAL and file_size:
+                                        last_progress_edit = now
+                                        progress = min(100, int((downloaded_size / file_size) * 100))
+                                        try:
                                             await status_msg.edit_text(f"Mengunduh file... {progress}%")
-                                            last_progress = progress
+                                        except TelegramError:
+                                            pass  # Progress is cosmetic, keep downloading
                 
                 # Rename temp file to final file
                 if os.path.exists(file_path):
@@ -539,6 +712,8 @@ async def safe_file_download(update: Update, context: ContextTypes.DEFAULT_TYPE,
                 os.rename(temp_path, file_path)
                 
                 await status_msg.edit_text("File berhasil diunduh!")
+                # Picked up by the conversion job trace
+                context.user_data['download_seconds'] = time.perf_counter() - started
                 return file_path, True
                 
             except asyncio.TimeoutError:
@@ -571,60 +746,233 @@ async def safe_file_download(update: Update, context: ContextTypes.DEFAULT_TYPE,
             os.remove(temp_path)
         return None, False
 
+def format_rejected_rows(rejected: RejectedRows) -> str:
+    """Short report of the rows skipped because of an invalid phone number."""
+    if not rejected.count:
+        return ""
+    report = f"\n\n{rejected.count} baris dilewati karena nomor telepon tidak valid:"
+    for row, value in rejected.samples:
+        report += f"\n- Baris {row}: {value}"
+    if rejected.count > len(rejected.samples):
+        report += f"\n- ... dan {rejected.count - len(rejected.samples)} baris lainnya"
+    return report
+
+async def result_cache_key(input_file: str, source_id: Optional[str], **params) -> Optional[str]:
+    """Result cache key of a conversion; None when the cache is off or the input cannot be identified."""
+    if result_cache is None:
+        return None
+    if source_id is not None:
+        source = f"tg:{source_id}"
+    elif os.path.exists(input_file):
+        source = f"sha256:{await asyncio.to_thread(file_digest, input_file)}"
+    else:
+        return None
+    kind = os.path.splitext(input_file)[1].lower()
+    return ResultCache.make_key(source, kind=kind, country_code=phone_normalizer.default_country_code, **params)
+
 async def process_file_conversion(update: Update, context: ContextTypes.DEFAULT_TYPE, input_file: str, 
                                 custom_name_pattern: str, split_size: int, custom_filename: str,
-                                sequence_start: int = 1) -> bool:
-    """Process file conversion with proper error handling and progress tracking"""
-    MAX_RETRIES = 3
-    RETRY_DELAY = 2
-    
+                                sequence_start: int = 1, delivery: str = 'files', document=None,
+                                source_id: Optional[str] = None) -> bool:
+    """
+    Process file conversion with proper error handling and progress tracking.
+    delivery: 'files' sends every split file, 'zip' sends them packed into ZIP archive parts.
+    document: the uploaded TXT document when it has not been downloaded yet; it is then
+    converted while it downloads and input_file only names it.
+    source_id: Telegram file_unique_id of the input, the result cache otherwise hashes input_file.
+    """
+    # A repeat of an earlier conversion is sent from the result cache without converting anything.
+    # Every setting that changes the outputs is part of the key.
+    engine = EXCEL_ENGINE if input_file.lower().endswith(EXCEL_SUFFIXES) else None
+    cache_key = await result_cache_key(input_file, source_id, name_pattern=custom_name_pattern,
+                                       split_size=split_size, filename=custom_filename,
+                                       sequence_start=sequence_start, delivery=delivery,
+                                       all_sheets=EXCEL_ALL_SHEETS, engine=engine,
+                                       part_max_size=ARCHIVE_PART_MAX_SIZE)
+    # Lookups read the manifest and stat every output file, keep that off the event loop
+    cached = await asyncio.to_thread(result_cache.get, cache_key) if cache_key is not None else None
+    # Outputs of a miss are kept as they are sent and published once all of them were delivered
+    cache_entry = (await asyncio.to_thread(result_cache.writer, cache_key)
+                   if cache_key is not None and cached is None else None)
+
+    if OUTPUT_MODE == 'memory' and cached is None:
+        output_store = MemoryOutputStore(memory_output_budget, MEMORY_OUTPUT_FILE_SIZE)
+        opener = output_store.open
+    else:
+        output_store = DiskOutputStore()
+        opener = None  # plain files, which also lets large inputs use the process pool
+    cache_reader = output_store.reader if opener is not None else None
+
+    trace = job_tracer.start(os.path.splitext(input_file)[1].lstrip('.').lower(), update.effective_user.id)
+    download_seconds = context.user_data.pop('download_seconds', None)
+    if download_seconds is not None:
+        trace.add_time('download', download_seconds)
+    conversion_stats = ConversionStats()
+
     try:
         status_msg = await update.message.reply_text("Sedang memproses file...")
 
+        # Finished split files are handed from the converter thread to the sender as they are written
+        loop = asyncio.get_running_loop()
+        ready_files = asyncio.Queue()
+
+        def on_file(file_path):
+            loop.call_soon_threadsafe(ready_files.put_nowait, file_path)
+
+        # Rows skipped because of an invalid phone number
+        rejected = cached.rejected if cached is not None else RejectedRows()
+        if document is not None:
+            file_url = (await document.get_file()).file_path if cached is None else None
+            bytes_in = document.file_size
+        else:
+            file_url = None
+            bytes_in = os.path.getsize(input_file)
+        bytes_out = 0
+
         # Process files in a separate thread
         def convert_file():
+            name_pattern = NamePattern(custom_name_pattern)
+            parallel = {'thread': False, 'process': True}.get(CONVERSION_MODE)
+            parallel_threshold = PARALLEL_THRESHOLD_MB * 1024 * 1024
             if input_file.lower().endswith('.txt'):
-                return txt_to_vcf(input_file, OUTPUT_DIR, lambda i: custom_name_pattern.replace("{index}", str(i)),
-                                split_size, custom_filename, sequence_start)
-            elif input_file.lower().endswith(('.xlsx', '.xls')):
-                return excel_to_vcf(input_file, OUTPUT_DIR, lambda i: custom_name_pattern.replace("{index}", str(i)),
-                                  split_size, custom_filename, sequence_start)
+                converter = txt_to_vcf
+            elif input_file.lower().endswith(SPREADSHEET_SUFFIXES):
+                converter = functools.partial(excel_to_vcf, engine=EXCEL_ENGINE, all_sheets=EXCEL_ALL_SHEETS)
             else:
                 raise ValueError("Format file tidak didukung")
+            # The download starts once the job leaves the queue
+            source = stream_download(file_url, loop) if file_url else input_file
+
+            if delivery != 'zip':
+                return converter(source, OUTPUT_DIR, name_pattern, split_size, custom_filename, sequence_start,
+                                 parallel=parallel, parallel_threshold=parallel_threshold, on_file=on_file,
+                                 opener=opener, normalizer=phone_normalizer, rejected=rejected,
+                                 stats=conversion_stats)
+
+            # Split files are streamed into the archive, only the finished parts are sent
+            archive = SplitArchiveWriter(OUTPUT_DIR, custom_filename, ARCHIVE_PART_MAX_SIZE, on_part=on_file,
+                                         store=output_store)
+            try:
+                converter(source, OUTPUT_DIR, name_pattern, split_size, custom_filename, sequence_start,
+                          opener=archive.open, normalizer=phone_normalizer, rejected=rejected,
+                          stats=conversion_stats)
+                return archive.close()
+            except BaseException:
+                archive.abort()
+                raise
+
+        async def show_queue_position(position):
+            if position:
+                await status_msg.edit_text(f"File Anda dalam antrian (posisi {position}). Mohon tunggu...")
+            else:
+                await status_msg.edit_text("Sedang memproses file...")
 
-        # Run conversion in thread pool
-        with ThreadPoolExecutor() as pool:
-            result_files = await asyncio.get_event_loop().run_in_executor(pool, convert_file)
+        if cached is not None:
+            conversion_stats.contacts = cached.contacts
+            trace.counts['cache_hit'] = 1
+            conversion = asyncio.ensure_future(asyncio.to_thread(cached.restore, OUTPUT_DIR, on_file))
+        else:
+            # Run conversion on the shared scheduler while the loop below sends its output
+            conversion = asyncio.ensure_future(job_scheduler.run(
+                update.effective_user.id, convert_file, on_position=show_queue_position
+            ))
+        conversion.add_done_callback(lambda _: ready_files.put_nowait(None))
+
+        chat_id = update.message.chat_id
+        sent_files = []
+        successful_sends = 0
+        failed_files = set()
+        last_progress_edit = 0.0
+        # Uploads overlap the conversion, the upload stage is the span from the first start to the last finish
+        upload_span = []
+
+        async def update_progress():
+            nonlocal last_progress_edit
+            now = time.monotonic()
+            if now - last_progress_edit < PROGRESS_EDIT_INTERVAL:
+                return
+            last_progress_edit = now
+            if conversion.done() and not conversion.exception():
+                text = f"Mengirim file ({successful_sends}/{len(conversion.result())})..."
+            else:
+                text = f"Memproses dan mengirim file ({successful_sends} terkirim)..."
+            try:
+                # Edits stay off the chat's upload bucket so they never delay the next file
+                await uploader.run(chat_id, lambda: status_msg.edit_text(text), max_retries=1, chat_limit=False)
+            except TelegramError:
+                pass  # Progress is best effort
+
+        async def keep_in_cache(file_path):
+            nonlocal cache_entry
+            entry = cache_entry
+            try:
+                await asyncio.to_thread(entry.add, file_path, cache_reader)
+            except Exception as e:
+                print(f"Failed to keep {file_path} in the result cache: {str(e)}")
+                entry.abort()
+                if cache_entry is entry:
+                    cache_entry = None
+
+        async def send_file(file_path):
+            nonlocal successful_sends, bytes_out
+            if not upload_span:
+                upload_span.append(time.perf_counter())
+            try:
+                await uploader.send_document(
+                    context.bot, chat_id, file_path, reader=output_store.reader,
+                    read_timeout=FILE_UPLOAD_TIMEOUT,
+                    write_timeout=FILE_UPLOAD_TIMEOUT,
+                    connect_timeout=30
+                )
+                bytes_out += output_store.size(file_path)
+            except Exception as e:
+                failed_files.add(file_path)
+                await notify_owner_error(context, f"Error sending file {file_path}: {str(e)}", update.effective_user.id)
+                return
+            finally:
+                if cache_entry is not None and file_path not in failed_files:
+                    await keep_in_cache(file_path)
+                # Free each output as soon as it has been handled
+                output_store.discard(file_path)
+                upload_span[1:] = [time.perf_counter()]
+            successful_sends += 1
+            await update_progress()
+
+        send_tasks = []
+        while True:
+            file_path = await ready_files.get()
+            if file_path is None:
+                break
+            sent_files.append(file_path)
+            send_tasks.append(asyncio.ensure_future(send_file(file_path)))
+        await asyncio.gather(*send_tasks)
+        if len(upload_span) == 2:
+            trace.add_time('upload', upload_span[1] - upload_span[0])
+        trace.counts.update(rows=conversion_stats.contacts, rejected=rejected.count, bytes_in=bytes_in,
+                            bytes_out=bytes_out, files=successful_sends, failed_files=len(failed_files))
+
+        try:
+            result_files = conversion.result()
+        except QueueFullError:
+            trace.status = 'queue_full'
+            if os.path.exists(input_file):
+                os.remove(input_file)
+            await status_msg.edit_text(ERROR_MESSAGES["queue_full"])
+            return False
+        except Exception:
+            # Drop whatever was produced before the converter failed
+            for file_path in sent_files:
+                output_store.discard(file_path)
+            raise
+
+        if not result_files:
+            trace.status = 'empty'
+            if os.path.exists(input_file):
+                os.remove(input_file)
+            await status_msg.edit_text("Tidak ada kontak yang valid di dalam file." + format_rejected_rows(rejected))
+            return False
 
         total_files = len(result_files)
-        await status_msg.edit_text(f"File telah diproses, sedang mengirim (0/{total_files})...")
-        
-        successful_sends = 0
-        failed_files = []
-        
-        for i, file_path in enumerate(result_files, 1):
-            for attempt in range(MAX_RETRIES):
-                try:
-                    with open(file_path, 'rb') as f:
-                        await context.bot.send_document(
-                            chat_id=update.message.chat_id,
-                            document=f,
-                            filename=os.path.basename(file_path),
-                            read_timeout=60,
-                            write_timeout=60,
-                            connect_timeout=30
-                        )
-                        successful_sends += 1
-                        await status_msg.edit_text(f"Mengirim file ({successful_sends}/{total_files})...")
-                        break  # Success, break retry loop
-                        
-                except Exception as e:
-                    if attempt < MAX_RETRIES - 1:
-                        await asyncio.sleep(RETRY_DELAY)
-                        continue
-                    else:
-                        failed_files.append(os.path.basename(file_path))
-                        await notify_owner_error(context, f"Error sending file {file_path}: {str(e)}", update.effective_user.id)
 
         # Report results
         if successful_sends == total_files:
@@ -633,32 +981,53 @@ async def process_file_conversion(update: Update, context: ContextTypes.DEFAULT_
             failed_count = len(failed_files)
             final_message = f"Konversi selesai! {successful_sends}/{total_files} file berhasil dikirim."
             if failed_count > 0:
-                final_message += f"\n{failed_count} file gagal dikirim: {', '.join(failed_files)}"
+                failed_names = [os.path.basename(path) for path in sent_files if path in failed_files]
+                final_message += f"\n{failed_count} file gagal dikirim: {', '.join(failed_names)}"
                 final_message += "\nSilakan coba konversi ulang untuk file yang gagal."
+        final_message += format_rejected_rows(rejected)
+        if failed_files:
+            trace.status = 'partial' if successful_sends else 'failed'
+        elif cache_entry is not None:
+            try:
+                await asyncio.to_thread(cache_entry.commit, result_files, conversion_stats.contacts, rejected)
+            except Exception as e:
+                print(f"Failed to store the result in the cache: {str(e)}")
+                cache_entry.abort()
+            cache_entry = None
 
         # Cleanup
         try:
-            # Clean up input files
-            if os.path.exists(input_file):
-                os.remove(input_file)
-            # Clean up output files
-            for file_path in result_files:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
+            with trace.stage('cleanup'):
+                # Clean up input files
+                if os.path.exists(input_file):
+                    os.remove(input_file)
+                # Clean up output files
+                for file_path in result_files:
+                    output_store.discard(file_path)
         except Exception as e:
             await notify_owner_error(context, f"Error during cleanup: {str(e)}", update.effective_user.id)
 
         # Update access limit only if at least one file was sent successfully
         if successful_sends > 0:
             user_manager.decrement_access_limit(update.effective_user.id)
+            log_conversion(update, conversion_stats.contacts, bytes_in, bytes_out)
         
         await status_msg.edit_text(final_message)
         return successful_sends > 0
 
     except Exception as e:
+        trace.status = 'error'
         await notify_owner_error(context, f"Error in file conversion: {str(e)}", update.effective_user.id)
         await update.message.reply_text(ERROR_MESSAGES["processing_error"])
         return False
+    finally:
+        with trace.stage('cleanup'):
+            output_store.close()
+            if cache_entry is not None:
+                cache_entry.abort()
+        for stage, seconds in dict(conversion_stats.stages).items():
+            trace.add_time(stage, seconds)
+        await job_tracer.finish(trace)
 
 # Merge functions
 def merge_txt_files(file1_path, file2_path, output_dir, custom_filename="merged"):
@@ -699,7 +1068,8 @@ async def merge_vcf_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "2. Kirim file VCF kedua\n"
         "3. Kirim file VCF tambahan jika ada\n"
         "4. Ketik /done ketika semua file telah diunggah\n"
-        "5. Masukkan nama file output yang diinginkan"
+        "5. Pilih apakah kontak duplikat ingin dihapus\n"
+        "6. Masukkan nama file output yang diinginkan"
     )
     context.user_data['vcf_files'] = []
     return UPLOAD_VCF_FILES
@@ -725,7 +1095,8 @@ async def handle_vcf_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         # Download file
-        await file.download_to_drive(file_path)
+        if not await fetch_local_file(file, file_path):
+            await file.download_to_drive(file_path)
         
         # Store file path
         context.user_data['vcf_files'].append(file_path)
@@ -740,13 +1111,32 @@ async def handle_vcf_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return UPLOAD_VCF_FILES
 
 async def finish_vcf_upload(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Finish uploading VCF files and ask for output file name."""
+    """Finish uploading VCF files and ask whether duplicates should be removed."""
     await log_interaction(update, '/done')
     if not context.user_data.get('vcf_files'):
         await update.message.reply_text("Anda belum mengunggah file VCF apapun.")
         return UPLOAD_VCF_FILES
 
-    await update.message.reply_text("Masukkan nama file output untuk file VCF yang digabungkan (tanpa ekstensi):")
+    keyboard = [
+        [
+            InlineKeyboardButton("Ya, Hapus Duplikat", callback_data='dedupe'),
+            InlineKeyboardButton("Tidak", callback_data='no_dedupe')
+        ]
+    ]
+    await update.message.reply_text(
+        "Hapus kontak duplikat (nomor telepon yang sama)?",
+        reply_markup=InlineKeyboardMarkup(keyboard)
+    )
+    return ASK_VCF_DEDUPE
+
+async def handle_dedupe_choice(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Store the duplicate removal choice and ask for output file name."""
+    await log_interaction(update, 'handle_dedupe_choice')
+    query = update.callback_query
+    await query.answer()
+
+    context.user_data['vcf_dedupe'] = query.data == 'dedupe'
+    await query.message.edit_text("Masukkan nama file output untuk file VCF yang digabungkan (tanpa ekstensi):")
     return ASK_VCF_FILENAME
 
 async def merge_vcf_files(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -758,45 +1148,214 @@ async def merge_vcf_files(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ASK_VCF_FILENAME
 
     vcf_files = context.user_data.get('vcf_files', [])
+    dedupe = context.user_data.get('vcf_dedupe', False)
     output_file_path = f"output_vcf/{custom_filename}.vcf"
     os.makedirs("output_vcf", exist_ok=True)
 
-    # Merge VCF files
-    with open(output_file_path, 'w') as outfile:
-        for file_path in vcf_files:
-            with open(file_path, 'r') as infile:
-                outfile.write(infile.read())
-                outfile.write('\n')  # Ensure new line between files
-
-    await update.message.reply_text(f"File VCF berhasil digabungkan dengan nama {custom_filename}.vcf")
-    with open(output_file_path, 'rb') as f:
-        await context.bot.send_document(
-            chat_id=update.message.chat_id,
-            document=f,
-            filename=os.path.basename(output_file_path),
+    try:
+        # Merge off the event loop, through the same queue as conversions
+        result = await job_scheduler.run(update.effective_user.id, merge_vcf, vcf_files, output_file_path, dedupe)
+
+        report = f"File VCF berhasil digabungkan dengan nama {custom_filename}.vcf\n{result.merged} kontak digabungkan"
+        if dedupe:
+            report += f", {result.duplicates} duplikat dihapus"
+        await update.message.reply_text(report)
+        await uploader.send_document(
+            context.bot, update.message.chat_id, output_file_path,
             read_timeout=30,
             write_timeout=30
         )
-
-    # Cleanup
-    for file_path in vcf_files:
-        os.remove(file_path)
-    os.remove(output_file_path)
+    except QueueFullError:
+        await update.message.reply_text(ERROR_MESSAGES["queue_full"])
+    except Exception as e:
+        await notify_owner_error(context, f"Error merging VCF files: {str(e)}", update.effective_user.id)
+        await update.message.reply_text(ERROR_MESSAGES["processing_error"])
+    finally:
+        # Cleanup
+        for file_path in vcf_files + [output_file_path]:
+            if os.path.exists(file_path):
+                os.remove(file_path)
 
     return ConversationHandler.END
 
+def parse_log_query(args) -> LogQuery:
+    """Parse "/view_logs user=<id> since=<date> cmd=<name>" arguments."""
+    query = LogQuery()
+    for arg in args:
+        key, sep, value = arg.partition('=')
+        if not sep or not value:
+            raise ValueError(f"Invalid filter: {arg}")
+        key = key.lower()
+        if key == 'user':
+            query.user_id = int(value)
+        elif key == 'since':
+            for fmt in ('%Y-%m-%d', '%Y-%m-%dT%H:%M', '%Y-%m-%dT%H:%M:%S'):
+                try:
+                    query.since = time.strftime(TIMESTAMP_FORMAT, time.strptime(value, fmt))
+                    break
+                except ValueError:
+                    continue
+            else:
+                raise ValueError(f"Invalid date: {value}")
+        elif key == 'cmd':
+            query.command = value
+        else:
+            raise ValueError(f"Unknown filter: {key}")
+    return query
+
+def render_log_page(token: str, query: LogQuery, rows, has_older: bool, has_newer: bool):
+    """Format one page of log rows with its navigation buttons."""
+    title = f"Logs ({query.describe()})" if query.describe() else "Logs"
+    if not rows:
+        return f"{title}:\nNo matching log entries.", None
+
+    lines = []
+    for _, timestamp, user_id, username, command, message in rows:
+        message = (message or '').replace('\n', ' ')
+        if len(message) > 60:
+            message = message[:57] + '...'
+        lines.append(f"{timestamp} | {user_id} @{username} | {command} | {message}")
+
+    navigation = []
+    if has_newer:
+        navigation.append(InlineKeyboardButton("« Newer", callback_data=f"logs:{token}:newer:{rows[0][0]}"))
+    if has_older:
+        navigation.append(InlineKeyboardButton("Older »", callback_data=f"logs:{token}:older:{rows[-1][0]}"))
+    keyboard = [navigation] if navigation else []
+    keyboard.append([InlineKeyboardButton("Export CSV", callback_data=f"logs:{token}:export:0")])
+    return f"{title}:\n" + "\n".join(lines), InlineKeyboardMarkup(keyboard)
+
 async def view_logs(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /view_logs command to view user interaction logs."""
+    """Handle /view_logs [user=<id>] [since=<YYYY-MM-DD>] [cmd=<name>] to browse the usage log."""
     await log_interaction(update, '/view_logs')
     user_id = update.effective_user.id
     if user_id != OWNER_ID:
         await update.message.reply_text("You are not authorized to view the logs.")
         return
 
-    with open(LOG_FILE, 'r') as file:
-        logs = file.read()
+    try:
+        query = parse_log_query(context.args or [])
+    except ValueError as e:
+        await update.message.reply_text(
+            f"{str(e)}\nUsage: /view_logs [user=<id>] [since=<YYYY-MM-DD>] [cmd=<name>]"
+        )
+        return
+
+    # Button callbacks only carry a short token, the filters stay here
+    queries = context.user_data.setdefault('log_queries', {})
+    token = str(context.user_data.get('log_query_token', 0) + 1)
+    context.user_data['log_query_token'] = int(token)
+    queries[token] = query
+    for old_token in list(queries)[:-10]:
+        del queries[old_token]
+
+    await usage_logger.flush()
+    rows, has_older, has_newer = await asyncio.to_thread(log_index.page, query, LOG_PAGE_SIZE)
+    text, reply_markup = render_log_page(token, query, rows, has_older, has_newer)
+    await update.message.reply_text(text, reply_markup=reply_markup)
+
+async def handle_log_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle the newer/older/export buttons of /view_logs."""
+    query = update.callback_query
+    if update.effective_user.id != OWNER_ID:
+        await query.answer("You are not authorized to view the logs.")
+        return
 
-    await update.message.reply_text(f"Logs:\n{logs}")
+    _, token, action, row_id = query.data.split(':')
+    log_query = context.user_data.get('log_queries', {}).get(token)
+    if log_query is None:
+        await query.answer("This log view has expired, run /view_logs again.")
+        return
+    await query.answer()
+
+    if action == 'export':
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        export_file = os.path.join(OUTPUT_DIR, f"usage_log_{int(time.time())}.csv")
+        try:
+            await usage_logger.flush()
+            await asyncio.to_thread(log_index.export_csv, log_query, export_file)
+            await uploader.send_document(context.bot, query.message.chat_id, export_file,
+                                         read_timeout=FILE_UPLOAD_TIMEOUT, write_timeout=FILE_UPLOAD_TIMEOUT)
+        finally:
+            if os.path.exists(export_file):
+                os.remove(export_file)
+        return
+
+    if action == 'older':
+        rows, has_older, has_newer = await asyncio.to_thread(
+            log_index.page, log_query, LOG_PAGE_SIZE, before_id=int(row_id))
+    else:
+        rows, has_older, has_newer = await asyncio.to_thread(
+            log_index.page, log_query, LOG_PAGE_SIZE, after_id=int(row_id))
+    text, reply_markup = render_log_page(token, log_query, rows, has_older, has_newer)
+    await query.message.edit_text(text, reply_markup=reply_markup)
+
+def format_bytes(size: float) -> str:
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /stats to show live usage and throughput aggregates."""
+    await log_interaction(update, '/stats')
+    if not user_manager.is_owner(update.effective_user.id):
+        await update.message.reply_text("You are not authorized to view the stats.")
+        return
+
+    stats = usage_stats.snapshot()
+    uptime = int(stats['uptime_seconds'])
+    lines = [
+        f"Uptime: {uptime // 3600}h {uptime % 3600 // 60}m",
+        f"Commands: {stats['commands_last_minute']} last minute, "
+        f"{stats['commands_per_minute_avg']:.1f}/min over the last hour, {stats['commands_total']} total",
+        f"Conversions: {stats['conversions']} ({stats['contacts']} contacts)",
+        f"Bytes: {format_bytes(stats['bytes_in'])} in, {format_bytes(stats['bytes_out'])} out",
+        f"Jobs: {stats['running_jobs']} running, {stats['queue_depth']} queued",
+    ]
+    if stats['top_commands']:
+        lines.append("\nTop commands:")
+        lines += [f"- {command}: {count}" for command, count in stats['top_commands']]
+    if stats['top_users']:
+        lines.append("\nTop users:")
+        lines += [f"- {user_id}: {count} conversions, {stats['contacts_by_user'].get(user_id, 0)} contacts"
+                  for user_id, count in stats['top_users']]
+    if result_cache is not None:
+        cache = result_cache.snapshot()
+        lookups = cache['hits'] + cache['misses']
+        lines.append(f"Result cache: {cache['hits']}/{lookups} hits, {cache['entries']} entries "
+                     f"({format_bytes(cache['bytes'])}), {cache['evictions']} evicted")
+    if file_id_cache is not None:
+        file_ids = file_id_cache.snapshot()
+        lines.append(f"Re-sent by file_id: {file_ids['hits']}/{file_ids['hits'] + file_ids['misses']} documents, "
+                     f"{file_ids['entries']} file_ids kept")
+    if usage_logger.dropped:
+        lines.append(f"Usage log rows dropped (queue full): {usage_logger.dropped}")
+    latencies = job_tracer.percentiles()
+    if latencies:
+        lines.append("\nStage latency p50/p95/p99:")
+        lines += [f"- {stage} [{kind}]: " + " / ".join(f"{seconds:.2f}s" for seconds in values.values())
+                  + f" ({jobs} jobs)" for stage, kind, jobs, values in latencies]
+    await update.message.reply_text("\n".join(lines))
+
+async def handle_metrics(request):
+    metrics = usage_stats.render_prometheus() + job_tracer.render_prometheus() + usage_logger.render_prometheus()
+    if result_cache is not None:
+        metrics += result_cache.render_prometheus()
+    if file_id_cache is not None:
+        metrics += file_id_cache.render_prometheus()
+    return web.Response(body=metrics.encode(),
+                        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+async def start_stats_server():
+    """Serve /metrics for Prometheus on 127.0.0.1:STATS_PORT."""
+    global stats_server
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    stats_server = web.AppRunner(app)
+    await stats_server.setup()
+    await web.TCPSite(stats_server, '127.0.0.1', STATS_PORT).start()
+    print(f"Metrics tersedia di http://127.0.0.1:{STATS_PORT}/metrics")
 
 async def broadcast_startup(application):
     """Broadcast startup message to all whitelisted users"""
@@ -807,18 +1366,16 @@ async def broadcast_startup(application):
         "Fitur yang tersedia:\n"
         "- /start - Melihat menu utama\n"
         "- /txt_to_vcf - Konversi file .txt ke .vcf\n"
-        "- /excel_to_vcf - Konversi file .xlsx ke .vcf\n"
+        "- /excel_to_vcf - Konversi file Excel/CSV (.xlsx, .xls, .ods, .csv) ke .vcf\n"
         "- /merge_vcf - Gabungkan file .vcf\n"
         "- /create_txt - Buat file txt dari pesan\n"
         "- /checklimit - Cek sisa limit Anda\n\n"
         "Jika ada pertanyaan, silakan hubungi admin @{}"
     ).format(OWNER_USERNAME)
     
-    for user_id in users:
-        try:
-            await application.bot.send_message(chat_id=int(user_id), text=startup_message)
-        except Exception as e:
-            print(f"Failed to send startup message to user {user_id}: {str(e)}")
+    # An unfinished startup broadcast from before a restart is replaced by this one
+    await broadcaster.submit(application.bot, startup_message, users, progress_chat_id=OWNER_ID or None,
+                             key='startup')
 
 async def broadcast_bot_dead(application):
     """Broadcast a message to all whitelisted users that the bot is dead"""
@@ -828,16 +1385,42 @@ async def broadcast_bot_dead(application):
         "\nSilakan coba lagi nanti atau hubungi admin @{} jika Anda memerlukan bantuan."
     ).format(OWNER_USERNAME)
     
-    for user_id in users:
-        try:
-            await application.bot.send_message(chat_id=int(user_id), text=dead_message)
-        except Exception as e:
-            print(f"Failed to send dead message to user {user_id}: {str(e)}")
+    await broadcaster.submit(application.bot, dead_message, users, progress_chat_id=OWNER_ID or None,
+                             key='status')
 
 async def post_init(application):
     """Post initialization hook to send startup broadcast"""
+    # Index the existing log before new rows are added to it
+    imported = await asyncio.to_thread(log_index.build_if_empty, usage_logger.segments())
+    if imported:
+        print(f"Indexed {imported} usage log rows")
+    await asyncio.to_thread(usage_stats.rebuild, log_index.iter_rows())
+    usage_logger.start()
+    user_manager.start()
+    if STATS_PORT:
+        await start_stats_server()
+    # Broadcasts only get queued here, sending happens in the background
+    resumed = await broadcaster.resume(application.bot)
+    if resumed:
+        print(f"Resuming {resumed} interrupted broadcast(s)")
     await broadcast_startup(application)
 
+async def post_shutdown(application):
+    """Post shutdown hook to release shared workers"""
+    # Unsent broadcasts stay in the checkpoint for the next start
+    await broadcaster.stop()
+    job_scheduler.shutdown()
+    shutdown_process_pool()
+    user_manager.close()
+    await usage_logger.close()
+    log_index.close()
+    if file_id_cache is not None:
+        file_id_cache.close()
+    if stats_server is not None:
+        await stats_server.cleanup()
+    if http_session is not None:
+        await http_session.close()
+
 async def clean_junk_files_and_logs():
     """Clean up junk files and logs."""
     junk_files = ["/path/to/junk1", "/path/to/junk2"]  # Example paths
@@ -848,25 +1431,24 @@ async def clean_junk_files_and_logs():
         except Exception as e:
             print(f"Failed to remove {file_path}: {str(e)}")
 
-async def restart_bot():
-    """Restart the bot."""
+def restart_bot():
+    """Save pending user changes and usage rows, then restart the bot in place."""
+    # Synchronous: also called from the file watcher thread, and nothing runs after execv
     print("Restarting bot...")
+    try:
+        user_manager.flush()
+    except Exception as e:
+        print(f"Failed to save users before restart: {str(e)}")
+    try:
+        print(f"Wrote {usage_logger.flush_now()} queued usage log rows before restart")
+    except Exception as e:
+        print(f"Failed to write usage log before restart: {str(e)}")
     os.execv(__file__, sys.argv)  # Restart the script
 
-async def broadcast_message(application, message):
-    """Broadcast a custom message to all whitelisted users."""
+async def broadcast_message(application, message, progress_chat_id=None):
+    """Queue a custom message to all whitelisted users; progress is reported to progress_chat_id."""
     users = user_manager.get_all_users()
-    for user_id in users:
-        try:
-            await application.bot.send_message(chat_id=int(user_id), text=message)
-        except TelegramError as e:
-            # Log the error and continue with the next user
-            print(f"Skipping user {user_id}: {str(e)}")
-            continue
-        except Exception as e:
-            # Log any other exceptions and continue
-            print(f"Failed to send message to user {user_id}: {str(e)}")
-            continue
+    return await broadcaster.submit(application.bot, message, users, progress_chat_id=progress_chat_id)
 
 # Example usage of broadcast_message
 # await broadcast_message(application, "This is a broadcast message from the owner.")
@@ -877,8 +1459,8 @@ async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if user_manager.is_owner(user_id):
         if context.args:
             message = ' '.join(context.args)
-            await broadcast_message(context.application, message)
-            await update.message.reply_text("Broadcast message sent.")
+            job = await broadcast_message(context.application, message, progress_chat_id=update.effective_chat.id)
+            await update.message.reply_text(f"Broadcast to {len(job.user_ids)} users started in the background.")
         else:
             await update.message.reply_text("Please provide a message to broadcast.")
     else:
@@ -1042,73 +1624,187 @@ async def list_owners(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     owners_text = "Current owners:\n" + "\n".join([f"- {owner_id}" for owner_id in owners])
     await update.message.reply_text(owners_text)
 
+async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle errors in the bot."""
+    error = context.error
+    try:
+        if update:
+            user_id = update.effective_user.id if update.effective_user else "Unknown"
+        else:
+            user_id = "Unknown"
+        
+        error_msg = f"An error occurred:\nError: {str(error)}\nUser ID: {user_id}"
+        await notify_owner_error(context, error_msg, user_id if isinstance(user_id, int) else None)
+        
+        if update and update.effective_message:
+            await update.effective_message.reply_text(
+                "Sorry, an error occurred while processing your request. The bot owner has been notified."
+            )
+    except Exception as e:
+        print(f"Error in error handler: {str(e)}")
+
+# Uploads that start the spreadsheet conversion, without a preceding /excel_to_vcf
+SPREADSHEET_FILTER = functools.reduce(
+    lambda combined, suffix: combined | filters.Document.FileExtension(suffix[1:]),
+    SPREADSHEET_SUFFIXES[1:], filters.Document.FileExtension(SPREADSHEET_SUFFIXES[0][1:])
+)
+
+def register_handlers(application) -> None:
+    """Add the error handler and every command and conversation handler to application."""
+    # Add error handler
+    application.add_error_handler(error_handler)
+
+    # Registered first so conversations waiting for a button press do not swallow log navigation
+    application.add_handler(CallbackQueryHandler(handle_log_page, pattern=r'^logs:'))
+
+    conv_handler = ConversationHandler(
+        entry_points=[
+            CommandHandler("txt_to_vcf", txt_to_vcf_handler),
+            CommandHandler("excel_to_vcf", excel_to_vcf_handler),
+            MessageHandler(filters.Document.FileExtension("txt"), handle_txt_file),
+            MessageHandler(SPREADSHEET_FILTER, handle_excel_file),
+        ],
+        states={
+            ASK_PATTERN: [MessageHandler(filters.TEXT & ~filters.COMMAND, ask_split)],
+            ASK_SPLIT: [CallbackQueryHandler(handle_split_choice)],
+            ASK_SPLIT_SIZE: [MessageHandler(filters.TEXT & ~filters.COMMAND, ask_filename)],
+            ASK_SEQUENCE: [
+                CallbackQueryHandler(handle_sequence_choice),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_sequence_number)
+            ],
+            ASK_FILENAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, generate_vcf)]
+        },
+        fallbacks=[],
+    )
+
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("getid", get_id))
+    application.add_handler(CommandHandler("checklimit", checklimit))
+    application.add_handler(CommandHandler("add", add_to_whitelist))
+    application.add_handler(CommandHandler("remove", remove_from_whitelist))
+    application.add_handler(CommandHandler("setlimit", set_access_limit))
+    application.add_handler(CommandHandler("whitelist", show_whitelist))
+    application.add_handler(conv_handler)
+
+    create_txt_conv_handler = ConversationHandler(
+        entry_points=[CommandHandler("create_txt", create_txt_handler)],
+        states={
+            CREATE_TXT_MESSAGE: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_txt_message)],
+            CREATE_TXT_FILENAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_txt_message)]
+        },
+        fallbacks=[],
+    )
+    application.add_handler(create_txt_conv_handler)
+
+    merge_vcf_conv_handler = ConversationHandler(
+        entry_points=[CommandHandler("merge_vcf", merge_vcf_handler)],
+        states={
+            UPLOAD_VCF_FILES: [
+                MessageHandler(filters.Document.FileExtension("vcf") & filters.ChatType.PRIVATE, handle_vcf_file),
+                CommandHandler("done", finish_vcf_upload)
+            ],
+            ASK_VCF_DEDUPE: [CallbackQueryHandler(handle_dedupe_choice)],
+            ASK_VCF_FILENAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, merge_vcf_files)]
+        },
+        fallbacks=[],
+    )
+    application.add_handler(merge_vcf_conv_handler)
+
+    application.add_handler(CommandHandler("view_logs", view_logs))
+    application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CommandHandler("restart", restart_command))
+    application.add_handler(CommandHandler("broadcast", broadcast_command))
+    application.add_handler(CommandHandler("add_owner", add_owner))
+    application.add_handler(CommandHandler("remove_owner", remove_owner))
+    application.add_handler(CommandHandler("list_owners", list_owners))
+
+def build_application(token: str = BOT_TOKEN, base_url: Optional[str] = None,
+                      base_file_url: Optional[str] = None, concurrent_updates: int = 0,
+                      local_mode: bool = BOT_API_LOCAL):
+    """
+    Create the Application with every handler registered.
+    base_url / base_file_url point the bot at another Bot API server, e.g. a local fake for load tests;
+    they default to BOT_API_URL when it is set.
+    concurrent_updates: how many updates are handled at once, 0 handles them one at a time.
+    local_mode: the server runs with --local, uploads are read from its disk instead of downloaded.
+    """
+    if BOT_API_URL:
+        base_url = base_url or f"{BOT_API_URL}/bot"
+        base_file_url = base_file_url or f"{BOT_API_URL}/file/bot"
+    builder = ApplicationBuilder().token(token).post_init(post_init).post_shutdown(post_shutdown)
+    if concurrent_updates:
+        builder = builder.concurrent_updates(concurrent_updates)
+    if local_mode:
+        builder = builder.local_mode(True)
+    if base_url:
+        builder = builder.base_url(base_url)
+    if base_file_url:
+        builder = builder.base_file_url(base_file_url)
+    application = builder.build()
+    register_handlers(application)
+    return application
+
+async def start_webhook(application, webhook_url: str = WEBHOOK_URL, listen: str = WEBHOOK_LISTEN,
+                        port: int = WEBHOOK_PORT) -> WebhookServer:
+    """
+    Serve the webhook and register it with Telegram. The server listens on the path of
+    webhook_url; an empty webhook_url registers the local address instead (for local tests).
+    Updates Telegram queued while the bot was down are delivered, not dropped.
+    """
+    path = urlparse(webhook_url).path or '/webhook'
+    server = WebhookServer(application, path, WEBHOOK_SECRET,
+                           health=lambda: {'queue_depth': job_scheduler.queue_depth,
+                                           'running_jobs': job_scheduler.running})
+    await server.start(listen, port)
+    try:
+        await application.bot.set_webhook(webhook_url or f"http://{listen}:{server.port}{path}",
+                                          secret_token=WEBHOOK_SECRET, max_connections=WEBHOOK_MAX_CONNECTIONS,
+                                          allowed_updates=Update.ALL_TYPES)
+    except BaseException:
+        await server.stop()
+        raise
+    return server
+
+async def run_webhook(application):
+    """Webhook counterpart of application.run_polling(): same hooks and handlers, until SIGINT/SIGTERM."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        server = await start_webhook(application)
+        print(f"Webhook aktif di {WEBHOOK_URL} (port {server.port})")
+        try:
+            await stop.wait()
+        finally:
+            # The webhook stays registered, Telegram keeps updates until the bot is back
+            await server.stop()
+    finally:
+        # Same teardown order as run_polling
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
 if __name__ == "__main__":
     def main():
         """Start the bot."""
-        # Create the Application
-        application = ApplicationBuilder().token(BOT_TOKEN).post_init(post_init).build()
-        
-        # Add error handler
-        application.add_error_handler(error_handler)
-
-        conv_handler = ConversationHandler(
-            entry_points=[
-                CommandHandler("txt_to_vcf", txt_to_vcf_handler),
-                CommandHandler("excel_to_vcf", excel_to_vcf_handler),
-                MessageHandler(filters.Document.FileExtension("txt"), handle_txt_file),
-                MessageHandler(filters.Document.FileExtension("xlsx"), handle_excel_file),
-            ],
-            states={
-                ASK_PATTERN: [MessageHandler(filters.TEXT & ~filters.COMMAND, ask_split)],
-                ASK_SPLIT: [CallbackQueryHandler(handle_split_choice)],
-                ASK_SPLIT_SIZE: [MessageHandler(filters.TEXT & ~filters.COMMAND, ask_filename)],
-                ASK_SEQUENCE: [
-                    CallbackQueryHandler(handle_sequence_choice),
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, handle_sequence_number)
-                ],
-                ASK_FILENAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, generate_vcf)]
-            },
-            fallbacks=[],
-        )
+        if BOT_MODE == 'webhook' and not WEBHOOK_URL:
+            sys.exit("WEBHOOK_URL is required when BOT_MODE=webhook")
 
-        application.add_handler(CommandHandler("start", start))
-        application.add_handler(CommandHandler("getid", get_id))
-        application.add_handler(CommandHandler("checklimit", checklimit))
-        application.add_handler(CommandHandler("add", add_to_whitelist))
-        application.add_handler(CommandHandler("remove", remove_from_whitelist))
-        application.add_handler(CommandHandler("setlimit", set_access_limit))
-        application.add_handler(CommandHandler("whitelist", show_whitelist))
-        application.add_handler(conv_handler)
-
-        create_txt_conv_handler = ConversationHandler(
-            entry_points=[CommandHandler("create_txt", create_txt_handler)],
-            states={
-                CREATE_TXT_MESSAGE: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_txt_message)],
-                CREATE_TXT_FILENAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, save_txt_message)]
-            },
-            fallbacks=[],
-        )
-        application.add_handler(create_txt_conv_handler)
-
-        merge_vcf_conv_handler = ConversationHandler(
-            entry_points=[CommandHandler("merge_vcf", merge_vcf_handler)],
-            states={
-                UPLOAD_VCF_FILES: [
-                    MessageHandler(filters.Document.FileExtension("vcf") & filters.ChatType.PRIVATE, handle_vcf_file),
-                    CommandHandler("done", finish_vcf_upload)
-                ],
-                ASK_VCF_FILENAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, merge_vcf_files)]
-            },
-            fallbacks=[],
-        )
-        application.add_handler(merge_vcf_conv_handler)
+        # Create the Application
+        application = build_application(BOT_TOKEN)
 
-        application.add_handler(CommandHandler("view_logs", view_logs))
-        application.add_handler(CommandHandler("restart", restart_command))
-        application.add_handler(CommandHandler("broadcast", broadcast_command))
-        application.add_handler(CommandHandler("add_owner", add_owner))
-        application.add_handler(CommandHandler("remove_owner", remove_owner))
-        application.add_handler(CommandHandler("list_owners", list_owners))
+        # Fork conversion workers before the file watcher and polling threads start
+        if CONVERSION_MODE != 'thread':
+            get_process_pool()
 
         print("Bot berjalan...")
         
@@ -1118,29 +1814,13 @@ if __name__ == "__main__":
         observer.start()
 
         try:
-            # Start the bot
-            application.run_polling(drop_pending_updates=True)
+            # Start the bot; both modes feed the same handlers
+            if BOT_MODE == 'webhook':
+                asyncio.run(run_webhook(application))
+            else:
+                application.run_polling(drop_pending_updates=True)
         finally:
             observer.stop()
             observer.join()
 
-    async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        """Handle errors in the bot."""
-        error = context.error
-        try:
-            if update:
-                user_id = update.effective_user.id if update.effective_user else "Unknown"
-            else:
-                user_id = "Unknown"
-            
-            error_msg = f"An error occurred:\nError: {str(error)}\nUser ID: {user_id}"
-            await notify_owner_error(context, error_msg, user_id if isinstance(user_id, int) else None)
-            
-            if update and update.effective_message:
-                await update.effective_message.reply_text(
-                    "Sorry, an error occurred while processing your request. The bot owner has been notified."
-                )
-        except Exception as e:
-            print(f"Error in error handler: {str(e)}")
-
-    main()
\ No newline at end of file
+    main()
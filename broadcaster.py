@@ -0,0 +1,269 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError, TimedOut
+
+from uploader import TokenBucket
+
+
+class BroadcastJob:
+    """
+    One broadcast and how far it got. done counts the leading recipients that are finished;
+    completed_ahead holds finished positions past it, so a resumed job skips exactly those.
+    """
+
+    def __init__(self, job_id: str, text: str, user_ids: List[int], progress_chat_id: Optional[int] = None,
+                 key: Optional[str] = None, done: int = 0, completed_ahead: Optional[List[int]] = None,
+                 sent: int = 0, failed: int = 0, blocked: int = 0):
+        self.job_id = job_id
+        self.text = text
+        self.user_ids = user_ids
+        self.progress_chat_id = progress_chat_id
+        self.key = key
+        self.done = done
+        self.completed_ahead = set(completed_ahead or ())
+        self.sent = sent
+        self.failed = failed
+        self.blocked = blocked
+
+    @property
+    def finished(self) -> int:
+        return self.done + len(self.completed_ahead)
+
+    def complete(self, position: int, status: str) -> None:
+        setattr(self, status, getattr(self, status) + 1)
+        self.completed_ahead.add(position)
+        while self.done in self.completed_ahead:
+            self.completed_ahead.remove(self.done)
+            self.done += 1
+
+    def pending(self):
+        """Positions still to send, in order."""
+        return (position for position in range(self.done, len(self.user_ids))
+                if position not in self.completed_ahead)
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            'job_id': self.job_id, 'text': self.text, 'user_ids': self.user_ids,
+            'progress_chat_id': self.progress_chat_id, 'key': self.key, 'done': self.done,
+            'completed_ahead': sorted(self.completed_ahead), 'sent': self.sent, 'failed': self.failed,
+            'blocked': self.blocked,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, object]) -> "BroadcastJob":
+        return cls(**data)
+
+
+class Broadcaster:
+    """
+    Sends broadcasts in the background, one job at a time, with concurrency workers paced
+    by a shared token bucket of rate messages per second. A RetryAfter stops every worker
+    for the requested time and slows the bucket down. Users who blocked the bot (or whose
+    chat is gone) are passed to on_blocked. Queued and running jobs are checkpointed to
+    checkpoint_file, so resume() picks up an interrupted broadcast after a restart.
+    """
+
+    def __init__(self, checkpoint_file: str = "data/broadcast.json", concurrency: int = 8, rate: float = 20.0,
+                 progress_interval: float = 3.0, max_retries: int = 5,
+                 on_blocked: Optional[Callable[[int], None]] = None):
+        self.checkpoint_file = checkpoint_file
+        self.concurrency = concurrency
+        self.rate = rate
+        self.progress_interval = progress_interval
+        self.max_retries = max_retries
+        self.on_blocked = on_blocked
+        self._jobs: List[BroadcastJob] = []
+        self._bucket = TokenBucket(rate, capacity=rate)
+        self._task: Optional[asyncio.Task] = None
+        self._bot = None
+        self._next_id = 0
+
+    @property
+    def jobs(self) -> List[BroadcastJob]:
+        return list(self._jobs)
+
+    async def submit(self, bot, text: str, user_ids: List[int], progress_chat_id: Optional[int] = None,
+                     key: Optional[str] = None) -> BroadcastJob:
+        """
+        Queue a broadcast and return without waiting for it.
+        A job with the same key that has not finished yet is dropped in favour of this one.
+        """
+        self._next_id += 1
+        job = BroadcastJob(f"{int(time.time())}-{self._next_id}", text, [int(user_id) for user_id in user_ids],
+                           progress_chat_id, key)
+        if key is not None:
+            stale = [old for old in self._jobs if old.key == key]
+            if stale and stale[0] is self._current_job() and self._task is not None:
+                # Restart the runner without the replaced job
+                self._task.cancel()
+                await asyncio.gather(self._task, return_exceptions=True)
+                self._task = None
+            self._jobs = [old for old in self._jobs if old.key != key]
+        self._jobs.append(job)
+        await self._save()
+        self._start(bot)
+        return job
+
+    async def resume(self, bot) -> int:
+        """Load unfinished jobs from the checkpoint and continue them. Returns the number of jobs."""
+        if not os.path.exists(self.checkpoint_file):
+            return 0
+        try:
+            jobs = await asyncio.to_thread(self._load)
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Ignoring unreadable broadcast checkpoint: {str(e)}")
+            return 0
+        self._jobs = jobs + self._jobs
+        if self._jobs:
+            self._start(bot)
+        return len(jobs)
+
+    async def stop(self) -> None:
+        """Stop sending and checkpoint whatever is left."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self._save()
+
+    def _current_job(self) -> Optional[BroadcastJob]:
+        return self._jobs[0] if self._jobs else None
+
+    def _start(self, bot) -> None:
+        self._bot = bot
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        while self._jobs:
+            job = self._jobs[0]
+            try:
+                await self._run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Broadcast {job.job_id} stopped: {str(e)}")
+            if self._jobs and self._jobs[0] is job:
+                self._jobs.pop(0)
+            await self._save()
+
+    async def _run_job(self, job: BroadcastJob) -> None:
+        bot = self._bot
+        started = time.monotonic()
+        finished_before = job.finished
+        progress_message = await self._send_progress(bot, job, None, "Broadcast started", attempts=self.max_retries)
+        pending = job.pending()
+
+        async def worker():
+            for position in pending:
+                status = await self._send(bot, job.user_ids[position], job.text)
+                job.complete(position, status)
+                if status == 'blocked' and self.on_blocked is not None:
+                    try:
+                        self.on_blocked(job.user_ids[position])
+                    except Exception as e:
+                        print(f"Failed to prune user {job.user_ids[position]}: {str(e)}")
+
+        workers = asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(asyncio.shield(workers), self.progress_interval)
+                    break
+                except asyncio.TimeoutError:
+                    await self._save()
+                    rate = (job.finished - finished_before) / max(time.monotonic() - started, 1e-6)
+                    progress_message = await self._send_progress(bot, job, progress_message, "Broadcasting", rate)
+        except BaseException:
+            workers.cancel()
+            await asyncio.gather(workers, return_exceptions=True)
+            raise
+        await self._send_progress(bot, job, progress_message, "Broadcast finished",
+                                  attempts=self.max_retries)
+        print(f"Broadcast {job.job_id} finished: {job.sent} sent, {job.failed} failed, {job.blocked} blocked")
+
+    async def _send(self, bot, user_id: int, text: str) -> str:
+        """Send one message. Returns 'sent', 'failed' or 'blocked'."""
+        for attempt in range(self.max_retries):
+            await self._bucket.acquire()
+            try:
+                await bot.send_message(chat_id=user_id, text=text)
+            except RetryAfter as e:
+                self._bucket.penalize(e.retry_after)
+                continue
+            except Forbidden:
+                return 'blocked'
+            except BadRequest as e:
+                if 'chat not found' in str(e).lower():
+                    return 'blocked'
+                print(f"Failed to send broadcast to user {user_id}: {str(e)}")
+                return 'failed'
+            except (TimedOut, NetworkError):
+                await asyncio.sleep(2 ** attempt)
+                continue
+            except Exception as e:
+                print(f"Failed to send broadcast to user {user_id}: {str(e)}")
+                return 'failed'
+            self._bucket.reward()
+            return 'sent'
+        return 'failed'
+
+    async def _send_progress(self, bot, job: BroadcastJob, message, title: str, rate: float = 0.0,
+                             attempts: int = 1):
+        """Post or update the progress message; best effort, the broadcast goes on without it."""
+        if job.progress_chat_id is None:
+            return None
+        total = len(job.user_ids)
+        text = (f"{title}: {job.finished}/{total} users\n"
+                f"Sent: {job.sent}, failed: {job.failed}, blocked (removed): {job.blocked}")
+        if rate > 0 and job.finished < total:
+            text += f"\n{rate:.1f} msg/s, about {int((total - job.finished) / rate)}s left"
+        for _ in range(attempts):
+            # Progress counts against the same flood limit as the broadcast itself
+            await self._bucket.acquire()
+            try:
+                if message is None:
+                    return await bot.send_message(chat_id=job.progress_chat_id, text=text)
+                await bot.edit_message_text(chat_id=job.progress_chat_id, message_id=message.message_id,
+                                            text=text)
+                break
+            except RetryAfter as e:
+                self._bucket.penalize(e.retry_after)
+            except TelegramError as e:
+                print(f"Failed to update broadcast progress: {str(e)}")
+                break
+        return message
+
+    async def _save(self) -> None:
+        data = {'jobs': [job.to_dict() for job in self._jobs]}
+        try:
+            await asyncio.to_thread(self._write, data)
+        except OSError as e:
+            print(f"Failed to save broadcast checkpoint: {str(e)}")
+
+    def _write(self, data: Dict[str, object]) -> None:
+        if not data['jobs']:
+            if os.path.exists(self.checkpoint_file):
+                os.remove(self.checkpoint_file)
+            return
+        directory = os.path.dirname(self.checkpoint_file) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".broadcast-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.replace(temp_path, self.checkpoint_file)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _load(self) -> List[BroadcastJob]:
+        with open(self.checkpoint_file, 'r') as f:
+            data = json.load(f)
+        return [BroadcastJob.from_dict(job) for job in data.get('jobs', [])]
@@ -0,0 +1,99 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+
+def content_digest(reader: Callable[[str], object], path: str) -> str:
+    """SHA-256 of an output, read through reader(path) in 1MB blocks."""
+    digest = hashlib.sha256()
+    with reader(path) as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FileIdCache:
+    """
+    Telegram file_ids of documents the bot already uploaded, keyed by content hash and
+    filename (a document re-sent by file_id keeps the name it was uploaded with).
+    Entries expire ttl seconds after the upload; beyond max_entries the least recently
+    used ones are dropped. Stored in SQLite so they survive restarts.
+    """
+
+    def __init__(self, db_file: str = "data/file_ids.db", ttl: float = 7 * 24 * 3600, max_entries: int = 10_000):
+        self.db_file = db_file
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(db_file) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS file_ids (
+                digest TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                file_id TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (digest, filename)
+            );
+            CREATE INDEX IF NOT EXISTS idx_file_ids_last_used ON file_ids (last_used);
+        """)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM file_ids WHERE created < ?", (time.time() - self.ttl,))
+
+    def get(self, digest: str, filename: str) -> Optional[str]:
+        """The file_id of an earlier upload of this content under this name, if it has not expired."""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT file_id FROM file_ids WHERE digest = ? AND filename = ? AND created >= ?",
+                (digest, filename, now - self.ttl)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE file_ids SET last_used = ? WHERE digest = ? AND filename = ?",
+                               (now, digest, filename))
+            self.hits += 1
+            return row[0]
+
+    def put(self, digest: str, filename: str, file_id: str) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO file_ids VALUES (?, ?, ?, ?, ?)",
+                               (digest, filename, file_id, now, now))
+            self._conn.execute("""
+                DELETE FROM file_ids WHERE rowid IN (
+                    SELECT rowid FROM file_ids ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )""", (self.max_entries,))
+
+    def forget(self, digest: str, filename: str) -> None:
+        """Drop an entry Telegram no longer accepts."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM file_ids WHERE digest = ? AND filename = ?", (digest, filename))
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM file_ids").fetchone()[0]
+            return {'hits': self.hits, 'misses': self.misses, 'entries': entries}
+
+    def render_prometheus(self) -> str:
+        stats = self.snapshot()
+        return "\n".join([
+            "# TYPE vcfbot_file_id_cache_hits_total counter",
+            f"vcfbot_file_id_cache_hits_total {stats['hits']}",
+            "# TYPE vcfbot_file_id_cache_misses_total counter",
+            f"vcfbot_file_id_cache_misses_total {stats['misses']}",
+            "# TYPE vcfbot_file_id_cache_entries gauge",
+            f"vcfbot_file_id_cache_entries {stats['entries']}",
+        ]) + "\n"
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
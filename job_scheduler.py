@@ -0,0 +1,149 @@
+import asyncio
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Deque, List, Optional
+
+PositionCallback = Callable[[int], Awaitable[None]]
+
+
+class QueueFullError(Exception):
+    """Raised when the conversion queue cannot accept more jobs."""
+
+
+class _Job:
+    def __init__(self, user_id: str, func: Callable, args: tuple, future: asyncio.Future,
+                 on_position: Optional[PositionCallback]):
+        self.user_id = user_id
+        self.func = func
+        self.args = args
+        self.future = future
+        self.on_position = on_position
+        self.last_position: Optional[int] = None
+
+
+class JobScheduler:
+    """
+    Long-lived scheduler for CPU-heavy conversion jobs.
+
+    Jobs run on a shared thread pool with a fixed number of workers. Waiting jobs
+    are kept per user and dispatched round-robin, so one user with many (or huge)
+    files cannot starve everybody else. When the queue is full new jobs are
+    rejected with QueueFullError instead of piling up threads.
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue_size: int = 20):
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="conversion")
+        self._queues: "OrderedDict[str, Deque[_Job]]" = OrderedDict()
+        self._running = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of jobs waiting for a worker."""
+        return sum(len(jobs) for jobs in self._queues.values())
+
+    @property
+    def running(self) -> int:
+        """Number of jobs currently executing."""
+        return self._running
+
+    async def run(self, user_id: int, func: Callable, *args: Any,
+                  on_position: Optional[PositionCallback] = None) -> Any:
+        """
+        Queue func(*args) for user_id and wait for its result.
+        on_position is awaited with the 1-based queue position while the job waits,
+        and with 0 once a job that had to wait starts running.
+        """
+        if self.queue_depth >= self.max_queue_size:
+            raise QueueFullError(f"Conversion queue is full ({self.max_queue_size} jobs)")
+
+        loop = asyncio.get_running_loop()
+        job = _Job(str(user_id), func, args, loop.create_future(), on_position)
+        self._queues.setdefault(job.user_id, deque()).append(job)
+        self._dispatch()
+        self._notify_positions()
+
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            self._discard(job)
+            raise
+
+    def shutdown(self) -> None:
+        """Stop accepting work and release the worker threads."""
+        for jobs in self._queues.values():
+            for job in jobs:
+                job.future.cancel()
+        self._queues.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _ordered_jobs(self) -> List[_Job]:
+        """Waiting jobs in the order they will be dispatched (round-robin over users)."""
+        ordered = []
+        queues = [list(jobs) for jobs in self._queues.values()]
+        depth = max((len(jobs) for jobs in queues), default=0)
+        for round_index in range(depth):
+            for jobs in queues:
+                if round_index < len(jobs):
+                    ordered.append(jobs[round_index])
+        return ordered
+
+    def _pop_next(self) -> _Job:
+        user_id, jobs = next(iter(self._queues.items()))
+        job = jobs.popleft()
+        # Move the user to the back of the rotation, or drop them if they have nothing left
+        del self._queues[user_id]
+        if jobs:
+            self._queues[user_id] = jobs
+        return job
+
+    def _dispatch(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._running < self.max_workers and self._queues:
+            job = self._pop_next()
+            if job.future.done():
+                continue
+            self._running += 1
+            if job.last_position is not None:
+                self._notify(job, 0)
+            exec_future = loop.run_in_executor(self._executor, job.func, *job.args)
+            exec_future.add_done_callback(lambda f, job=job: self._on_done(job, f))
+
+    def _on_done(self, job: _Job, exec_future: asyncio.Future) -> None:
+        self._running -= 1
+        if not job.future.done():
+            if exec_future.cancelled():
+                job.future.cancel()
+            elif exec_future.exception() is not None:
+                job.future.set_exception(exec_future.exception())
+            else:
+                job.future.set_result(exec_future.result())
+        self._dispatch()
+        self._notify_positions()
+
+    def _discard(self, job: _Job) -> None:
+        jobs = self._queues.get(job.user_id)
+        if jobs and job in jobs:
+            jobs.remove(job)
+            if not jobs:
+                del self._queues[job.user_id]
+            self._notify_positions()
+
+    def _notify_positions(self) -> None:
+        for position, job in enumerate(self._ordered_jobs(), start=1):
+            if job.last_position != position:
+                self._notify(job, position)
+
+    def _notify(self, job: _Job, position: int) -> None:
+        job.last_position = position
+        if job.on_position is None:
+            return
+
+        async def notify():
+            try:
+                await job.on_position(position)
+            except Exception as e:
+                print(f"Failed to report queue position for user {job.user_id}: {str(e)}")
+
+        asyncio.get_running_loop().create_task(notify())
@@ -0,0 +1,170 @@
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Stages of a conversion job, in the order they happen
+STAGES = ('download', 'parse', 'render', 'write', 'upload', 'cleanup')
+PERCENTILES = (50, 95, 99)
+
+
+def _stage_order(stage: str) -> int:
+    return STAGES.index(stage) if stage in STAGES else len(STAGES)
+
+
+class LatencyHistogram:
+    """
+    Fixed log-spaced buckets from min_seconds up, each factor times wider than the last,
+    so recording is O(1), memory is constant and percentiles are within one bucket width.
+    """
+
+    def __init__(self, min_seconds: float = 0.001, factor: float = 2 ** 0.25, buckets: int = 96):
+        self.min_seconds = min_seconds
+        self.factor = factor
+        self.counts = [0] * buckets
+        self.count = 0
+        self.sum = 0.0
+        self._log_factor = math.log(factor)
+
+    def record(self, seconds: float) -> None:
+        if seconds <= self.min_seconds:
+            bucket = 0
+        else:
+            bucket = min(math.ceil(math.log(seconds / self.min_seconds) / self._log_factor), len(self.counts) - 1)
+        self.counts[bucket] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def upper_bound(self, bucket: int) -> float:
+        return self.min_seconds * self.factor ** bucket
+
+    def percentile(self, percent: float) -> float:
+        """Upper bound of the bucket holding the given percentile, 0 when nothing was recorded."""
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * percent / 100)
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.upper_bound(bucket)
+        return self.upper_bound(len(self.counts) - 1)
+
+
+class JobTrace:
+    """Timings and counters of one job; stage times add up when a stage runs more than once."""
+
+    def __init__(self, job_id: str, kind: str, user_id: Optional[int] = None):
+        self.job_id = job_id
+        self.kind = kind
+        self.user_id = user_id
+        self.started_at = time.time()
+        self.stages: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.status = 'ok'
+        self._start = time.perf_counter()
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def stage(self, stage: str) -> "_StageTimer":
+        """Context manager timing a block as part of stage."""
+        return _StageTimer(self, stage)
+
+    def to_record(self) -> Dict[str, object]:
+        return {
+            'job_id': self.job_id,
+            'kind': self.kind,
+            'user_id': self.user_id,
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.started_at)),
+            'status': self.status,
+            'total': round(time.perf_counter() - self._start, 6),
+            'stages': {stage: round(self.stages[stage], 6)
+                       for stage in sorted(self.stages, key=_stage_order)},
+            'counts': self.counts,
+        }
+
+
+class _StageTimer:
+    def __init__(self, trace: JobTrace, stage: str):
+        self.trace = trace
+        self.stage = stage
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.trace.add_time(self.stage, time.perf_counter() - self._start)
+        return False
+
+
+class JobTracer:
+    """
+    Collects finished job traces: stage latencies go into one histogram per
+    (stage, job kind), and every trace is appended as a JSON line to trace_file
+    (None disables the file). The file is rotated to "<trace_file>.1" once it
+    reaches max_bytes.
+    """
+
+    def __init__(self, trace_file: Optional[str] = "data/job_trace.jsonl", max_bytes: int = 10 * 1024 * 1024):
+        self.trace_file = trace_file
+        self.max_bytes = max_bytes
+        self._histograms: Dict[Tuple[str, str], LatencyHistogram] = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._next_id = 0
+        if trace_file:
+            os.makedirs(os.path.dirname(trace_file) or '.', exist_ok=True)
+
+    def start(self, kind: str, user_id: Optional[int] = None) -> JobTrace:
+        with self._lock:
+            self._next_id += 1
+            job_id = f"{int(time.time())}-{self._next_id}"
+        return JobTrace(job_id, kind, user_id)
+
+    async def finish(self, trace: JobTrace) -> None:
+        """Record the stage latencies and append the trace, off the event loop."""
+        record = trace.to_record()
+        with self._lock:
+            for stage, seconds in trace.stages.items():
+                key = (stage, trace.kind)
+                if key not in self._histograms:
+                    self._histograms[key] = LatencyHistogram()
+                self._histograms[key].record(seconds)
+        if self.trace_file:
+            try:
+                await asyncio.to_thread(self._append, json.dumps(record, separators=(',', ':')))
+            except OSError as e:
+                print(f"Failed to write job trace: {str(e)}")
+
+    def _append(self, line: str) -> None:
+        with self._write_lock:
+            if self.max_bytes and os.path.exists(self.trace_file) \
+                    and os.path.getsize(self.trace_file) >= self.max_bytes:
+                os.replace(self.trace_file, self.trace_file + '.1')
+            with open(self.trace_file, 'a', encoding='utf-8') as file:
+                file.write(line + '\n')
+
+    def percentiles(self) -> List[Tuple[str, str, int, Dict[int, float]]]:
+        """(stage, kind, jobs, {percentile: seconds}) for every histogram, in stage order."""
+        with self._lock:
+            items = sorted(self._histograms.items(), key=lambda item: (_stage_order(item[0][0]), item[0]))
+            return [(stage, kind, histogram.count, {p: histogram.percentile(p) for p in PERCENTILES})
+                    for (stage, kind), histogram in items]
+
+    def render_prometheus(self) -> str:
+        """Stage latencies as Prometheus summaries."""
+        lines = ["# TYPE vcfbot_stage_seconds summary"]
+        with self._lock:
+            for (stage, kind), histogram in self._histograms.items():
+                labels = f'stage="{stage}",kind="{kind}"'
+                for p in PERCENTILES:
+                    lines.append(f'vcfbot_stage_seconds{{{labels},quantile="{p / 100}"}} '
+                                 f'{histogram.percentile(p):.6f}')
+                lines.append(f'vcfbot_stage_seconds_sum{{{labels}}} {histogram.sum:.6f}')
+                lines.append(f'vcfbot_stage_seconds_count{{{labels}}} {histogram.count}')
+        return "\n".join(lines) + "\n"
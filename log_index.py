@@ -0,0 +1,203 @@
+import csv
+import gzip
+import os
+import sqlite3
+import threading
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from usage_logger import LOG_HEADER
+
+IMPORT_BATCH_ROWS = 10_000
+
+
+class LogQuery:
+    """Filters for a usage log query. Every field is optional."""
+
+    def __init__(self, user_id: Optional[int] = None, since: Optional[str] = None,
+                 command: Optional[str] = None):
+        self.user_id = user_id
+        self.since = since
+        self.command = command
+
+    def where(self) -> Tuple[List[str], List]:
+        """SQL conditions for the user filter; LogIndex adds the others."""
+        clauses, params = [], []
+        if self.user_id is not None:
+            clauses.append("user_id = ?")
+            params.append(self.user_id)
+        return clauses, params
+
+    def describe(self) -> str:
+        parts = []
+        if self.user_id is not None:
+            parts.append(f"user={self.user_id}")
+        if self.since:
+            parts.append(f"since={self.since}")
+        if self.command:
+            parts.append(f"cmd={self.command}")
+        return ' '.join(parts)
+
+
+class LogIndex:
+    """
+    SQLite copy of the usage log, indexed by user, command and time, for fast
+    filtered and paginated queries. The CSV segments stay the primary log: the
+    index is filled from them when it is empty and then kept current by adding
+    every batch the UsageLogger writes.
+    """
+
+    def __init__(self, db_file: str = "data/usage_log.db"):
+        self.db_file = db_file
+        os.makedirs(os.path.dirname(db_file) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS logs (
+                id INTEGER PRIMARY KEY,
+                timestamp TEXT NOT NULL,
+                user_id INTEGER,
+                username TEXT,
+                command TEXT,
+                message TEXT
+            );
+            CREATE INDEX IF NOT EXISTS logs_user ON logs (user_id, id);
+            CREATE INDEX IF NOT EXISTS logs_command ON logs (command, id);
+            CREATE INDEX IF NOT EXISTS logs_timestamp ON logs (timestamp);
+        """)
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def add_rows(self, rows: Iterable[Sequence]) -> None:
+        """Index rows in the CSV column order; rows that do not have five columns are skipped."""
+        rows = [tuple(row) for row in rows if len(row) == 5]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO logs (timestamp, user_id, username, command, message) VALUES (?, ?, ?, ?, ?)", rows)
+
+    def build_if_empty(self, segments: List[str]) -> int:
+        """Import every CSV segment (gzipped or not) into an empty index. Returns the rows imported."""
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM logs LIMIT 1").fetchone():
+                return 0
+        imported = 0
+        for segment in segments:
+            if not os.path.exists(segment):
+                continue
+            opener = gzip.open if segment.endswith('.gz') else open
+            with opener(segment, 'rt', newline='') as file:
+                reader = csv.reader(file)
+                next(reader, None)  # header
+                batch = []
+                for row in reader:
+                    batch.append(row)
+                    if len(batch) == IMPORT_BATCH_ROWS:
+                        self.add_rows(batch)
+                        imported += len(batch)
+                        batch = []
+                self.add_rows(batch)
+                imported += len(batch)
+        return imported
+
+    def page(self, query: LogQuery, page_size: int, before_id: Optional[int] = None,
+             after_id: Optional[int] = None) -> Tuple[List[tuple], bool, bool]:
+        """
+        One page of matching rows, newest first, paging by row id so every page is an index seek.
+        before_id gives the next (older) page, after_id the previous (newer) one.
+        Returns: (rows as (id, timestamp, user_id, username, command, message), has_older, has_newer)
+        """
+        clauses, params = self._where(query, before_id, after_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        order = "ASC" if after_id is not None else "DESC"
+        sql = (f"SELECT id, timestamp, user_id, username, command, message FROM logs {where} "
+               f"ORDER BY id {order} LIMIT ?")
+        with self._lock:
+            rows = self._conn.execute(sql, params + [page_size + 1]).fetchall()
+        more = len(rows) > page_size
+        rows = rows[:page_size]
+        if after_id is not None:
+            rows.reverse()
+        if not rows:
+            return rows, False, False
+        has_older = more if after_id is None else self._exists(query, before_id=rows[-1][0])
+        has_newer = more if after_id is not None else self._exists(query, after_id=rows[0][0])
+        return rows, has_older, has_newer
+
+    def _where(self, query: LogQuery, before_id: Optional[int] = None,
+               after_id: Optional[int] = None) -> Tuple[List[str], List]:
+        clauses, params = query.where()
+        if query.command:
+            # Commands are logged both as "/start" and as handler names like "ask_split".
+            # A single "command = ?" keeps the (command, id) index usable for ordering
+            command = query.command.lstrip('/')
+            with self._lock:
+                forms = [form for form in ('/' + command, command) if self._conn.execute(
+                    "SELECT 1 FROM logs WHERE command = ? LIMIT 1", (form,)).fetchone()]
+            if len(forms) == 2:
+                clauses.append("command IN (?, ?)")
+                params.extend(forms)
+            else:
+                clauses.append("command = ?")
+                params.append(forms[0] if forms else command)
+
+        # At most one lower and one upper id bound, so SQLite can seek a single id range
+        lowest = after_id + 1 if after_id is not None else None
+        if query.since:
+            # Rows are appended in time order, so "since" becomes the id of the first row at or after it
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT id FROM logs WHERE timestamp >= ? ORDER BY timestamp LIMIT 1", (query.since,)
+                ).fetchone()
+            since_id = row[0] if row else 2 ** 62  # nothing that recent: match no row
+            lowest = since_id if lowest is None else max(lowest, since_id)
+        if lowest is not None:
+            clauses.append("id >= ?")
+            params.append(lowest)
+        if before_id is not None:
+            clauses.append("id < ?")
+            params.append(before_id)
+        return clauses, params
+
+    def _exists(self, query: LogQuery, before_id: Optional[int] = None, after_id: Optional[int] = None) -> bool:
+        clauses, params = self._where(query, before_id, after_id)
+        sql = f"SELECT 1 FROM logs WHERE {' AND '.join(clauses)} LIMIT 1"
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone() is not None
+
+    def iter_rows(self) -> Iterator[tuple]:
+        """Every row in log order as (timestamp, user_id, username, command, message), read in batches."""
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, timestamp, user_id, username, command, message FROM logs "
+                    "WHERE id > ? ORDER BY id LIMIT ?", (last_id, IMPORT_BATCH_ROWS)).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            for row in rows:
+                yield row[1:]
+
+    def export_csv(self, query: LogQuery, output_file: str) -> int:
+        """Write every matching row, oldest first, to a CSV file. Returns the number of rows."""
+        clauses, params = self._where(query)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = f"SELECT timestamp, user_id, username, command, message FROM logs {where} ORDER BY id"
+        written = 0
+        with open(output_file, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(LOG_HEADER)
+            with self._lock:
+                cursor = self._conn.execute(sql, params)
+                while True:
+                    rows = cursor.fetchmany(IMPORT_BATCH_ROWS)
+                    if not rows:
+                        break
+                    writer.writerows(rows)
+                    written += len(rows)
+        return written
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,186 @@
+import contextlib
+import os
+import tempfile
+import threading
+from typing import Dict, Tuple
+
+
+class DiskOutputStore:
+    """Output files are plain files on disk."""
+
+    def open(self, path: str, binary: bool = False):
+        """Open path for writing."""
+        if binary:
+            return open(path, 'wb')
+        return open(path, 'w', encoding='utf-8')
+
+    def reader(self, path: str):
+        """Open a finished output for reading."""
+        return open(path, 'rb')
+
+    def size(self, path: str) -> int:
+        return os.path.getsize(path)
+
+    def rename(self, src: str, dst: str) -> None:
+        os.replace(src, dst)
+
+    def discard(self, path: str) -> None:
+        if os.path.exists(path):
+            os.remove(path)
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryBudget:
+    """Thread-safe byte budget shared by every in-memory output."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._used = 0
+        self._lock = threading.Lock()
+
+    @property
+    def used(self) -> int:
+        return self._used
+
+    def reserve(self, size: int) -> int:
+        """Reserve up to size bytes and return how many were granted."""
+        with self._lock:
+            granted = max(0, min(size, self.max_bytes - self._used))
+            self._used += granted
+            return granted
+
+    def release(self, size: int) -> None:
+        with self._lock:
+            self._used = max(0, self._used - size)
+
+
+class _SpooledOutput:
+    """Write handle for a spooled buffer; closing it hands the buffer back to the store."""
+
+    def __init__(self, buffer, on_close):
+        self._buffer = buffer
+        self._on_close = on_close
+        self.closed = False
+
+    def write(self, data) -> int:
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        return self._buffer.write(data)
+
+    def writelines(self, lines) -> None:
+        for line in lines:
+            self.write(line)
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self._buffer.flush()
+            self._on_close(self._buffer)
+
+    def __getattr__(self, name):
+        # tell, seek, flush... are needed when a ZipFile writes through this handle
+        return getattr(self._buffer, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _BufferReader:
+    """
+    Read-only view of a finished buffer. SpooledTemporaryFile reports name None while it is
+    in memory, which python-telegram-bot would try to turn into a filename.
+    """
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+
+    def read(self, size: int = -1) -> bytes:
+        return self._buffer.read(size)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self._buffer.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._buffer.tell()
+
+
+class MemoryOutputStore:
+    """
+    Output files kept in spooled temporary buffers instead of OUTPUT_DIR.
+
+    Each buffer stays in memory up to max_file_size bytes and only while the shared
+    budget allows it; beyond that it spills to an anonymous temporary file, which
+    the OS removes as soon as it is closed. Paths are only used as keys.
+    """
+
+    def __init__(self, budget: MemoryBudget, max_file_size: int):
+        self.budget = budget
+        self.max_file_size = max_file_size
+        self._files: Dict[str, Tuple[object, int]] = {}
+        self._writing: Dict[str, Tuple[object, int]] = {}
+        self._lock = threading.Lock()
+
+    def open(self, path: str, binary: bool = False) -> _SpooledOutput:
+        """Open a buffer for path. Text and bytes can both be written to it."""
+        reserved = self.budget.reserve(self.max_file_size)
+        if reserved:
+            buffer = tempfile.SpooledTemporaryFile(max_size=reserved)
+        else:
+            buffer = tempfile.TemporaryFile()
+        with self._lock:
+            self._writing[path] = (buffer, reserved)
+
+        def on_close(buffer):
+            size = buffer.seek(0, os.SEEK_END)
+            if size > reserved:
+                # Spilled to disk, the memory reservation is no longer needed
+                self.budget.release(reserved)
+                kept = 0
+            else:
+                self.budget.release(reserved - size)
+                kept = size
+            with self._lock:
+                self._writing.pop(path, None)
+                self._files[path] = (buffer, kept)
+
+        return _SpooledOutput(buffer, on_close)
+
+    def reader(self, path: str):
+        """Return the finished buffer for path, rewound, without closing it afterwards."""
+        with self._lock:
+            buffer, _ = self._files[path]
+        buffer.seek(0)
+        return contextlib.nullcontext(_BufferReader(buffer))
+
+    def size(self, path: str) -> int:
+        with self._lock:
+            buffer, _ = self._files[path]
+        return buffer.seek(0, os.SEEK_END)
+
+    def rename(self, src: str, dst: str) -> None:
+        with self._lock:
+            self._files[dst] = self._files.pop(src)
+
+    def discard(self, path: str) -> None:
+        with self._lock:
+            entry = self._files.pop(path, None)
+        if entry is not None:
+            buffer, kept = entry
+            buffer.close()
+            self.budget.release(kept)
+
+    def close(self) -> None:
+        """Discard every buffer still held, including ones left open by a failed conversion."""
+        with self._lock:
+            paths = list(self._files)
+            writing, self._writing = self._writing, {}
+        for path in paths:
+            self.discard(path)
+        for buffer, reserved in writing.values():
+            buffer.close()
+            self.budget.release(reserved)
@@ -0,0 +1,208 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from phone_normalizer import RejectedRows
+
+MANIFEST = "manifest.json"
+# Part of every key: bump it when the rendered output changes, so old entries are no longer hit
+FORMAT_VERSION = 1
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file's content, read in 1MB blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class CachedResult:
+    """A cache hit: the output files in delivery order and what the conversion reported."""
+
+    def __init__(self, files: List[str], contacts: int, rejected: RejectedRows):
+        self.files = files
+        self.contacts = contacts
+        self.rejected = rejected
+
+    def restore(self, output_dir: str, on_file: Optional[Callable[[str], None]] = None) -> List[str]:
+        """
+        Copy the cached files into output_dir under their original names, calling on_file for each.
+        Copies, not hard links: a later job writing the same output name would truncate the entry.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        restored = []
+        for cached in self.files:
+            path = os.path.join(output_dir, os.path.basename(cached))
+            if os.path.exists(path):
+                os.remove(path)
+            shutil.copyfile(cached, path)
+            restored.append(path)
+            if on_file is not None:
+                on_file(path)
+        return restored
+
+
+class CacheEntryWriter:
+    """Collects the outputs of one conversion in a staging directory until commit() or abort()."""
+
+    def __init__(self, cache: "ResultCache", key: str):
+        self.cache = cache
+        self.key = key
+        self.staging = tempfile.mkdtemp(prefix=".tmp-", dir=cache.directory)
+
+    def add(self, path: str, reader: Optional[Callable[[str], object]] = None) -> None:
+        """
+        Keep a copy of an output. Without reader, path is a file on disk; with reader, its
+        content is read from reader(path). Never hard-linked, the output name gets reused.
+        """
+        target = os.path.join(self.staging, os.path.basename(path))
+        if reader is None:
+            shutil.copyfile(path, target)
+            return
+        with reader(path) as source, open(target, 'wb') as f:
+            shutil.copyfileobj(source, f, 1024 * 1024)
+
+    def commit(self, files: List[str], contacts: int, rejected: RejectedRows) -> None:
+        """Publish the entry; files are the outputs in delivery order, all of them added before."""
+        manifest = {
+            'files': [os.path.basename(path) for path in files],
+            'contacts': contacts,
+            'rejected': {'count': rejected.count, 'samples': rejected.samples},
+        }
+        with open(os.path.join(self.staging, MANIFEST), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        self.cache._publish(self.key, self.staging)
+
+    def abort(self) -> None:
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+
+class ResultCache:
+    """
+    Conversion outputs on disk, keyed by the input (Telegram file_unique_id or content hash)
+    plus the conversion parameters. Entries are directories under directory; the least
+    recently used ones are evicted once all entries together exceed max_bytes.
+    """
+
+    def __init__(self, directory: str = "data/result_cache", max_bytes: int = 512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def make_key(source_id: str, **params) -> str:
+        payload = json.dumps({'source': source_id, 'format': FORMAT_VERSION, **params}, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _load(self) -> None:
+        """Index the existing entries, oldest use first, and drop unfinished staging directories."""
+        found: List[Tuple[float, str, int]] = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith('.tmp-'):
+                shutil.rmtree(path, ignore_errors=True)
+                continue
+            manifest = os.path.join(path, MANIFEST)
+            if not os.path.isfile(manifest):
+                continue
+            found.append((os.path.getmtime(manifest), name, self._entry_size(path)))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._bytes += size
+
+    @staticmethod
+    def _entry_size(path: str) -> int:
+        return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        """Look up an entry and mark it as used. Counts a hit or a miss."""
+        path = os.path.join(self.directory, key)
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+        try:
+            manifest_path = os.path.join(path, MANIFEST)
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            files = [os.path.join(path, name) for name in manifest['files']]
+            if not all(os.path.isfile(file) for file in files):
+                raise ValueError("missing output file")
+            os.utime(manifest_path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Dropping broken result cache entry {key}: {str(e)}")
+            self._remove(key)
+            with self._lock:
+                self.misses += 1
+            return None
+        rejected = RejectedRows()
+        rejected.count = manifest['rejected']['count']
+        rejected.samples = [tuple(sample) for sample in manifest['rejected']['samples']]
+        with self._lock:
+            self.hits += 1
+        return CachedResult(files, manifest['contacts'], rejected)
+
+    def writer(self, key: str) -> CacheEntryWriter:
+        return CacheEntryWriter(self, key)
+
+    def _publish(self, key: str, staging: str) -> None:
+        size = self._entry_size(staging)
+        if size > self.max_bytes:
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+        path = os.path.join(self.directory, key)
+        self._remove(key)  # The same conversion finished twice, keep the newer copy
+        os.replace(staging, path)
+        with self._lock:
+            self._entries[key] = size
+            self._bytes += size
+            evict = []
+            while self._bytes > self.max_bytes and self._entries:
+                old_key, old_size = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+                evict.append(old_key)
+        for old_key in evict:
+            shutil.rmtree(os.path.join(self.directory, old_key), ignore_errors=True)
+
+    def _remove(self, key: str) -> None:
+        with self._lock:
+            size = self._entries.pop(key, None)
+            if size is not None:
+                self._bytes -= size
+        shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self._entries), 'bytes': self._bytes}
+
+    def render_prometheus(self) -> str:
+        stats = self.snapshot()
+        return "\n".join([
+            "# TYPE vcfbot_result_cache_hits_total counter",
+            f"vcfbot_result_cache_hits_total {stats['hits']}",
+            "# TYPE vcfbot_result_cache_misses_total counter",
+            f"vcfbot_result_cache_misses_total {stats['misses']}",
+            "# TYPE vcfbot_result_cache_evictions_total counter",
+            f"vcfbot_result_cache_evictions_total {stats['evictions']}",
+            "# TYPE vcfbot_result_cache_entries gauge",
+            f"vcfbot_result_cache_entries {stats['entries']}",
+            "# TYPE vcfbot_result_cache_bytes gauge",
+            f"vcfbot_result_cache_bytes {stats['bytes']}",
+        ]) + "\n"
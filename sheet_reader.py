@@ -0,0 +1,148 @@
+import csv
+import os
+from concurrent.futures import Executor
+from itertools import islice
+from typing import Iterable, List, Optional, Sequence
+
+import pandas as pd
+
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:  # Optional: the openpyxl read-only engine is used instead
+    CalamineWorkbook = None
+
+# Only the name and phone columns are read, the rest of a sheet is skipped
+CONTACT_COLUMNS = 2
+EXCEL_SUFFIXES = ('.xlsx', '.xlsm', '.xls', '.ods')
+CSV_SUFFIXES = ('.csv',)
+SPREADSHEET_SUFFIXES = EXCEL_SUFFIXES + CSV_SUFFIXES
+ENGINES = ('auto', 'calamine', 'openpyxl', 'pandas')
+
+
+def resolve_engine(input_file: str, engine: str = 'auto') -> str:
+    """
+    The engine that reads input_file. 'auto' prefers calamine (Rust, reads .xlsx, .xls
+    and .ods), then openpyxl in read-only mode for .xlsx, then pandas.read_excel,
+    which needs xlrd or odfpy for the older formats. CSV files always use pandas' C parser.
+    """
+    suffix = os.path.splitext(input_file)[1].lower()
+    if suffix in CSV_SUFFIXES:
+        return 'csv'
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown spreadsheet engine: {engine}")
+    if engine != 'auto':
+        return engine
+    if CalamineWorkbook is not None:
+        return 'calamine'
+    if suffix in ('.xlsx', '.xlsm'):
+        return 'openpyxl'
+    return 'pandas'
+
+
+def _cell(value):
+    # Same conversions as pandas.read_excel: blanks are missing, whole floats become ints
+    if value is None or value == '':
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _rows_to_frame(rows: Iterable[Sequence]) -> pd.DataFrame:
+    """Contacts frame from raw sheet rows: the first row is the header, only the first columns are kept."""
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        return pd.DataFrame()
+    width = max(1, min(CONTACT_COLUMNS, len(header)))
+    data = [[_cell(value) for value in islice(row, width)] for row in rows]
+    # Trailing empty rows are dropped like pandas does, empty rows in between keep their number
+    while data and all(value is None for value in data[-1]):
+        data.pop()
+    frame = pd.DataFrame(data, columns=range(width)) if data else pd.DataFrame(columns=range(width))
+    # Columns pandas would have read as numbers get the same dtype
+    return frame.infer_objects()
+
+
+def sheet_count(input_file: str, engine: str = 'auto') -> int:
+    engine = resolve_engine(input_file, engine)
+    if engine == 'csv':
+        return 1
+    if engine == 'calamine':
+        return len(CalamineWorkbook.from_path(input_file).sheet_names)
+    if engine == 'openpyxl':
+        import openpyxl
+        workbook = openpyxl.load_workbook(input_file, read_only=True)
+        try:
+            return len(workbook.sheetnames)
+        finally:
+            workbook.close()
+    with pd.ExcelFile(input_file) as workbook:
+        return len(workbook.sheet_names)
+
+
+def read_sheet(input_file: str, sheet: int = 0, engine: str = 'auto') -> pd.DataFrame:
+    """
+    The name and phone columns of one sheet (by position) as a DataFrame with columns 0 and 1,
+    one row per sheet row below the header, like pandas.read_excel(input_file, usecols=[0, 1]).
+    """
+    engine = resolve_engine(input_file, engine)
+    if engine == 'csv':
+        return _read_csv(input_file)
+    if engine == 'calamine':
+        workbook = CalamineWorkbook.from_path(input_file)
+        try:
+            return _rows_to_frame(workbook.get_sheet_by_index(sheet).iter_rows())
+        finally:
+            workbook.close()
+    if engine == 'openpyxl':
+        import openpyxl
+        # read_only streams the sheet XML instead of building every cell and style
+        workbook = openpyxl.load_workbook(input_file, read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[sheet].iter_rows(max_col=CONTACT_COLUMNS, values_only=True)
+            return _rows_to_frame(rows)
+        finally:
+            workbook.close()
+    frame = pd.read_excel(input_file, sheet_name=sheet, header=None,
+                          usecols=lambda column: column < CONTACT_COLUMNS)
+    return _rows_to_frame(frame.itertuples(index=False, name=None))
+
+
+def _read_csv(input_file: str) -> pd.DataFrame:
+    with open(input_file, 'r', encoding='utf-8-sig', newline='') as f:
+        sample = f.read(64 * 1024)
+    try:
+        # Spreadsheets exported with a comma decimal separator use ";"
+        delimiter = csv.Sniffer().sniff(sample, delimiters=',;\t|').delimiter
+    except csv.Error:
+        delimiter = ','
+    header = next(csv.reader(sample.splitlines()[:1], delimiter=delimiter), [])
+    width = max(1, min(CONTACT_COLUMNS, len(header)))
+    # Read as text so phone numbers keep their leading zero and "+"
+    frame = pd.read_csv(input_file, sep=delimiter, header=0, usecols=range(width), dtype=str,
+                        keep_default_na=False, na_values=[''], skip_blank_lines=False, encoding='utf-8-sig')
+    frame.columns = range(width)
+    while len(frame) and frame.iloc[-1].isna().all():
+        frame = frame.iloc[:-1]
+    return frame
+
+
+def read_contacts(input_file: str, engine: str = 'auto', all_sheets: bool = False,
+                  executor: Optional[Executor] = None) -> pd.DataFrame:
+    """
+    The name and phone columns of the first sheet, or of every sheet one after another.
+    With an executor, sheets are read in parallel on it.
+    """
+    count = sheet_count(input_file, engine) if all_sheets else 1
+    if count == 1:
+        return read_sheet(input_file, 0, engine)
+    if executor is not None:
+        frames: List[pd.DataFrame] = list(executor.map(read_sheet, [input_file] * count, range(count),
+                                                       [engine] * count))
+    else:
+        frames = [read_sheet(input_file, sheet, engine) for sheet in range(count)]
+    frames = [frame for frame in frames if len(frame)]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,256 @@
+import asyncio
+import heapq
+import os
+import random
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+from file_id_cache import FileIdCache, content_digest
+
+
+class TokenBucket:
+    """
+    Async token bucket. Waiters are served in arrival order.
+    The rate halves on every flood-control hit and recovers gradually on success.
+    """
+
+    def __init__(self, rate: float, capacity: float, min_rate: Optional[float] = None):
+        self.base_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate if min_rate is not None else rate / 8
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def penalize(self, retry_after: float) -> None:
+        """Block the bucket for retry_after seconds and slow it down."""
+        now = time.monotonic()
+        self._blocked_until = max(self._blocked_until, now + retry_after)
+        self._refill(now)
+        self._tokens = 0
+        self.rate = max(self.min_rate, self.rate / 2)
+
+    def reward(self) -> None:
+        """Recover a little of the rate lost to earlier penalties."""
+        if self.rate < self.base_rate:
+            self.rate = min(self.base_rate, self.rate + self.base_rate / 10)
+
+
+class StartOrder:
+    """
+    Lets requests start one at a time in ticket order. A request holds its turn only until
+    it is sent, so the uploads themselves still overlap. A ticket waits for every lower one to
+    have started or finished, and a retry of an earlier ticket goes before the later ones.
+    """
+
+    def __init__(self):
+        self.users = 0
+        self._next_ticket = 0
+        # Every ticket below _started has started or finished, _passed holds the higher ones that did
+        self._started = 0
+        self._passed: Set[int] = set()
+        self._busy = False
+        self._waiters: List[Tuple[int, asyncio.Future]] = []
+
+    def ticket(self) -> int:
+        ticket = self._next_ticket
+        self._next_ticket += 1
+        return ticket
+
+    async def acquire(self, ticket: int) -> None:
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (ticket, waiter))
+        self._wake()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The turn was handed over just before the cancellation, pass it on
+                self.release(ticket)
+            raise
+
+    def release(self, ticket: int) -> None:
+        """Give up the turn once ticket's request has been sent."""
+        self._busy = False
+        self.done(ticket)
+
+    def done(self, ticket: int) -> None:
+        """ticket will not start (again), the tickets after it need not wait for it."""
+        if ticket >= self._started:
+            self._passed.add(ticket)
+            while self._started in self._passed:
+                self._passed.remove(self._started)
+                self._started += 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self._waiters[0][1].done():
+            heapq.heappop(self._waiters)
+        if self._busy or not self._waiters or self._waiters[0][0] > self._started:
+            return
+        _, waiter = heapq.heappop(self._waiters)
+        self._busy = True
+        waiter.set_result(None)
+
+
+class Uploader:
+    """
+    Sends Telegram requests with bounded concurrency, per-chat and global token
+    buckets, RetryAfter handling and exponential backoff on network errors.
+    With a file_id_cache, documents already uploaded once are re-sent by file_id.
+    Documents for one chat start uploading in the order send_document was called, so split
+    files arrive in order, and up to max_concurrency of them upload at the same time.
+    A failed upload is retried before the chat's documents that have not started yet;
+    only those already uploading when it failed can arrive ahead of it.
+    """
+
+    MAX_CHAT_BUCKETS = 1000
+
+    def __init__(self, max_concurrency: int = 4, global_rate: float = 25.0, chat_rate: float = 1.0,
+                 chat_burst: float = 3.0, max_retries: int = 5, backoff_base: float = 1.0,
+                 file_id_cache: Optional[FileIdCache] = None):
+        self.max_concurrency = max_concurrency
+        self.file_id_cache = file_id_cache
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._global_bucket = TokenBucket(global_rate, capacity=global_rate)
+        self._chat_buckets: "OrderedDict[int, TokenBucket]" = OrderedDict()
+        # Per chat: the order its documents start in, kept while any of them is being sent
+        self._chat_turns: Dict[int, StartOrder] = {}
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.pop(chat_id, None)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, capacity=self.chat_burst)
+        self._chat_buckets[chat_id] = bucket
+        # Forget the least recently used chats
+        while len(self._chat_buckets) > self.MAX_CHAT_BUCKETS:
+            self._chat_buckets.popitem(last=False)
+        return bucket
+
+    async def run(self, chat_id: int, request: Callable[[], Awaitable[Any]],
+                  max_retries: Optional[int] = None, chat_limit: bool = True,
+                  turn: Optional[Tuple[StartOrder, int]] = None) -> Any:
+        """
+        Run request() under the rate limits, retrying on flood control and network errors.
+        request must build a fresh API call on every invocation.
+        chat_limit=False leaves the chat's bucket alone, for requests such as message edits
+        that should not hold back the chat's uploads. turn (order, ticket) makes every attempt,
+        including its backoff, wait until the requests with lower tickets have started.
+        """
+        attempts = max_retries if max_retries is not None else self.max_retries
+        delay = 0.0
+        for attempt in range(attempts):
+            chat_bucket = self._chat_bucket(chat_id) if chat_limit else None
+            if turn is not None:
+                await turn[0].acquire(turn[1])
+            try:
+                if delay:
+                    # Back off outside the semaphore so other uploads can proceed,
+                    # documents for the chat queued after this one wait for it
+                    await asyncio.sleep(delay + random.uniform(0, delay / 2))
+                # Wait for the chat outside the semaphore so a throttled chat does not hold a slot
+                if chat_bucket is not None:
+                    await chat_bucket.acquire()
+                await self._semaphore.acquire()
+            finally:
+                if turn is not None:
+                    turn[0].release(turn[1])
+            try:
+                await self._global_bucket.acquire()
+                result = await request()
+            except RetryAfter as e:
+                # The bucket itself waits out the flood-control period
+                if chat_bucket is not None:
+                    chat_bucket.penalize(e.retry_after)
+                if attempt == attempts - 1:
+                    raise
+                continue
+            except (BadRequest, Forbidden):
+                raise
+            except (TimedOut, NetworkError):
+                if attempt == attempts - 1:
+                    raise
+                delay = self.backoff_base * (2 ** attempt)
+            else:
+                if chat_bucket is not None:
+                    chat_bucket.reward()
+                return result
+            finally:
+                self._semaphore.release()
+
+    async def send_document(self, bot, chat_id: int, file_path: str,
+                            reader: Optional[Callable[[str], Any]] = None, **kwargs) -> Any:
+        """
+        Upload file_path as a document, reopening it on every attempt.
+        reader opens the document for reading (defaults to the file on disk).
+        Identical content sent under the same filename before is re-sent by file_id instead.
+        A retried document goes ahead of the documents for the same chat that have not started.
+        """
+        # The ticket is taken before the first await, in the order the sends were started
+        order = self._chat_turns.get(chat_id)
+        if order is None:
+            order = self._chat_turns[chat_id] = StartOrder()
+        order.users += 1
+        ticket = order.ticket()
+        try:
+            return await self._send_document(bot, chat_id, file_path, reader, (order, ticket), **kwargs)
+        finally:
+            order.done(ticket)
+            order.users -= 1
+            if not order.users:
+                del self._chat_turns[chat_id]
+
+    async def _send_document(self, bot, chat_id: int, file_path: str, reader: Optional[Callable[[str], Any]],
+                             turn: Tuple[StartOrder, int], **kwargs) -> Any:
+        kwargs.setdefault('filename', os.path.basename(file_path))
+        reader = reader or (lambda path: open(path, 'rb'))
+        filename = kwargs['filename']
+
+        digest = None
+        if self.file_id_cache is not None:
+            digest = await asyncio.to_thread(content_digest, reader, file_path)
+            file_id = await asyncio.to_thread(self.file_id_cache.get, digest, filename)
+            if file_id is not None:
+                try:
+                    return await self.run(chat_id, lambda: bot.send_document(chat_id=chat_id, document=file_id,
+                                                                             **kwargs), turn=turn)
+                except BadRequest:
+                    # Expired or unknown to this bot, upload it again
+                    await asyncio.to_thread(self.file_id_cache.forget, digest, filename)
+
+        async def request():
+            with reader(file_path) as f:
+                return await bot.send_document(chat_id=chat_id, document=f, **kwargs)
+
+        message = await self.run(chat_id, request, turn=turn)
+        document = getattr(message, 'document', None)
+        if digest is not None and document is not None:
+            await asyncio.to_thread(self.file_id_cache.put, digest, filename, document.file_id)
+        return message
@@ -0,0 +1,199 @@
+import asyncio
+import calendar
+import csv
+import glob
+import gzip
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Callable, List, Optional, Sequence
+
+LOG_HEADER = ['timestamp', 'user_id', 'username', 'command', 'message']
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Rotated segment suffix: -<date>-<time>[-<n>]
+_SEGMENT_STAMP = re.compile(r'-(\d{8})-(\d{6})(?:-(\d+))?$')
+
+
+class UsageLogger:
+    """
+    Buffers usage log rows in memory and appends them to the CSV in batches from
+    a background task, so handlers never touch the disk.
+
+    The log is rotated once it reaches max_bytes or its first row is older than
+    max_age seconds (0 disables either check), checked before each batch is
+    written. Rotated segments are renamed to "<name>-<YYYYmmdd-HHMMSS>.csv"
+    and gzipped when compress is set.
+
+    on_batch is called from the writer thread with every batch once it is on disk.
+    """
+
+    def __init__(self, log_file: str, max_bytes: int = 10 * 1024 * 1024, max_age: float = 0,
+                 compress: bool = True, flush_interval: float = 1.0, batch_size: int = 1000,
+                 max_pending: int = 100_000, on_batch: Optional[Callable[[List[Sequence]], None]] = None):
+        self.log_file = log_file
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compress = compress
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.on_batch = on_batch
+        self.dropped = 0
+        self._dropped_reported = 0
+        self._pending: List[Sequence] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._write_lock = threading.Lock()
+        self._segment_started: Optional[float] = None
+        os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+        self._ensure_header()
+
+    def log(self, row: Sequence) -> None:
+        """Queue a row. Never blocks; rows beyond max_pending are dropped and counted."""
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending.append(row)
+        if self._wakeup is not None and len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        """Start the background flush task on the running event loop."""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            self._report_dropped()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Failed to write usage log: {str(e)}")
+
+    def _report_dropped(self) -> None:
+        dropped = self.dropped
+        if dropped > self._dropped_reported:
+            print(f"Usage log queue full: dropped {dropped - self._dropped_reported} rows "
+                  f"({dropped} since start)")
+            self._dropped_reported = dropped
+
+    def render_prometheus(self) -> str:
+        return "\n".join([
+            "# TYPE vcfbot_usage_log_dropped_total counter",
+            f"vcfbot_usage_log_dropped_total {self.dropped}",
+        ]) + "\n"
+
+    async def flush(self) -> None:
+        """Write every queued row, off the event loop."""
+        rows, self._pending = self._pending, []
+        if rows:
+            try:
+                await asyncio.to_thread(self._write_rows, rows)
+            except Exception:
+                # Keep the rows for the next attempt
+                self._pending[:0] = rows
+                raise
+
+    def flush_now(self) -> int:
+        """
+        Write every queued row in the calling thread, e.g. right before the process is replaced.
+        Returns the number of rows written.
+        """
+        rows, self._pending = self._pending, []
+        if rows:
+            try:
+                self._write_rows(rows)
+            except Exception:
+                self._pending[:0] = rows
+                raise
+        return len(rows)
+
+    def _write_rows(self, rows: List[Sequence]) -> None:
+        with self._write_lock:
+            self._rotate_if_needed()
+            with open(self.log_file, 'a', newline='') as file:
+                csv.writer(file).writerows(rows)
+        if self.on_batch is not None:
+            try:
+                self.on_batch(rows)
+            except Exception as e:
+                # The rows are in the log already, do not queue them again
+                print(f"Usage log batch hook failed: {str(e)}")
+
+    async def close(self) -> None:
+        """Stop the flush task and write whatever is still queued."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def segments(self) -> List[str]:
+        """Every log segment, oldest first; the active log file comes last."""
+        base, ext = os.path.splitext(self.log_file)
+        rotated = []
+        for path in glob.glob(f"{glob.escape(base)}-*{ext}") + glob.glob(f"{glob.escape(base)}-*{ext}.gz"):
+            name = path[:-3] if path.endswith('.gz') else path
+            match = _SEGMENT_STAMP.search(name[len(base):-len(ext)] if ext else name[len(base):])
+            if match:
+                date, clock, number = match.groups()
+                rotated.append(((date, clock, int(number or 0)), path))
+        return [path for _, path in sorted(rotated)] + [self.log_file]
+
+    def _ensure_header(self) -> None:
+        if not os.path.exists(self.log_file) or os.path.getsize(self.log_file) == 0:
+            with open(self.log_file, 'w', newline='') as file:
+                csv.writer(file).writerow(LOG_HEADER)
+            self._segment_started = time.time()
+
+    def _first_row_time(self) -> float:
+        """When the active segment started, taken from its first row."""
+        try:
+            with open(self.log_file, 'r', newline='') as file:
+                reader = csv.reader(file)
+                next(reader, None)
+                row = next(reader, None)
+            if row:
+                return calendar.timegm(time.strptime(row[0], TIMESTAMP_FORMAT))
+        except (OSError, ValueError, IndexError):
+            pass
+        return time.time()
+
+    def _rotate_if_needed(self) -> None:
+        self._ensure_header()
+        too_big = self.max_bytes and os.path.getsize(self.log_file) >= self.max_bytes
+        if not too_big and self.max_age:
+            if self._segment_started is None:
+                self._segment_started = self._first_row_time()
+            too_old = time.time() - self._segment_started >= self.max_age
+        else:
+            too_old = False
+        if too_big or too_old:
+            self._rotate()
+
+    def _rotate(self) -> None:
+        base, ext = os.path.splitext(self.log_file)
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.gmtime())
+        rotated = f"{base}-{stamp}{ext}"
+        suffix = 1
+        while os.path.exists(rotated) or os.path.exists(rotated + '.gz'):
+            rotated = f"{base}-{stamp}-{suffix}{ext}"
+            suffix += 1
+        os.replace(self.log_file, rotated)
+        self._segment_started = None
+        self._ensure_header()
+        if self.compress:
+            with open(rotated, 'rb') as src, gzip.open(rotated + '.gz', 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
@@ -0,0 +1,153 @@
+import calendar
+import re
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Iterable, Optional, Sequence
+
+from usage_logger import TIMESTAMP_FORMAT
+
+# Usage log command recorded for every finished conversion, its message holds the counters
+CONVERSION_COMMAND = 'conversion'
+_COUNTER_FIELD = re.compile(r'(\w+)=(\d+)')
+
+
+def format_conversion_message(contacts: int, bytes_in: int, bytes_out: int) -> str:
+    return f"contacts={contacts} bytes_in={bytes_in} bytes_out={bytes_out}"
+
+
+class UsageStats:
+    """
+    Rolling usage aggregates, updated as events happen so reading them is cheap.
+
+    Command rates are kept in per-minute buckets covering the last window_minutes;
+    totals cover everything since the aggregates were (re)built from the usage log.
+    """
+
+    def __init__(self, window_minutes: int = 60, queue_depth: Optional[Callable[[], int]] = None,
+                 running_jobs: Optional[Callable[[], int]] = None):
+        self.window_minutes = window_minutes
+        self.queue_depth = queue_depth
+        self.running_jobs = running_jobs
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._minutes: Dict[int, int] = {}
+        self.commands: Counter = Counter()
+        self.conversions_by_user: Counter = Counter()
+        self.contacts_by_user: Counter = Counter()
+        self.conversions = 0
+        self.contacts = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def record_command(self, command: str, timestamp: Optional[float] = None) -> None:
+        now_minute = self._current_minute()
+        minute = int(timestamp // 60) if timestamp is not None else now_minute
+        with self._lock:
+            self.commands[command] += 1
+            if minute > now_minute - self.window_minutes:
+                self._minutes[minute] = self._minutes.get(minute, 0) + 1
+                if len(self._minutes) > self.window_minutes + 1:
+                    self._prune(now_minute)
+
+    def record_conversion(self, user_id: int, contacts: int, bytes_in: int, bytes_out: int) -> None:
+        with self._lock:
+            self.conversions += 1
+            self.contacts += contacts
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.conversions_by_user[str(user_id)] += 1
+            self.contacts_by_user[str(user_id)] += contacts
+
+    def rebuild(self, rows: Iterable[Sequence]) -> int:
+        """Replay usage log rows (timestamp, user_id, username, command, message). Returns rows read."""
+        count = 0
+        # Timestamps sort as strings, so only rows inside the rate window need parsing
+        window_start = time.strftime(TIMESTAMP_FORMAT,
+                                     time.gmtime((self._current_minute() - self.window_minutes) * 60))
+        for row in rows:
+            if len(row) != 5:
+                continue
+            timestamp, user_id, _, command, message = row
+            if command == CONVERSION_COMMAND:
+                fields = {key: int(value) for key, value in _COUNTER_FIELD.findall(message or '')}
+                self.record_conversion(user_id, fields.get('contacts', 0),
+                                       fields.get('bytes_in', 0), fields.get('bytes_out', 0))
+            elif timestamp >= window_start:
+                try:
+                    self.record_command(command, calendar.timegm(time.strptime(timestamp, TIMESTAMP_FORMAT)))
+                except ValueError:
+                    continue
+            else:
+                with self._lock:
+                    self.commands[command] += 1
+            count += 1
+        return count
+
+    def _current_minute(self) -> int:
+        return int(time.time() // 60)
+
+    def _prune(self, now_minute: int) -> None:
+        oldest = now_minute - self.window_minutes
+        for minute in [minute for minute in self._minutes if minute <= oldest]:
+            del self._minutes[minute]
+
+    def snapshot(self) -> Dict[str, object]:
+        """Current aggregates as plain values."""
+        now_minute = self._current_minute()
+        with self._lock:
+            self._prune(now_minute)
+            # The current minute is still filling up, so the rate comes from the last full one
+            last_minute = self._minutes.get(now_minute - 1, 0)
+            window_total = sum(count for minute, count in self._minutes.items() if minute < now_minute)
+            return {
+                'uptime_seconds': time.time() - self.started_at,
+                'commands_last_minute': last_minute,
+                'commands_per_minute_avg': window_total / self.window_minutes,
+                'commands_total': sum(self.commands.values()),
+                'top_commands': self.commands.most_common(5),
+                'conversions': self.conversions,
+                'contacts': self.contacts,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'top_users': self.conversions_by_user.most_common(10),
+                'contacts_by_user': dict(self.contacts_by_user),
+                'queue_depth': self.queue_depth() if self.queue_depth else 0,
+                'running_jobs': self.running_jobs() if self.running_jobs else 0,
+            }
+
+    def render_prometheus(self) -> str:
+        """Aggregates in the Prometheus text exposition format."""
+        stats = self.snapshot()
+        lines = ["# TYPE vcfbot_commands_total counter"]
+        with self._lock:
+            commands = list(self.commands.items())
+            by_user = list(self.conversions_by_user.items())
+        for command, count in commands:
+            lines.append(f'vcfbot_commands_total{{command="{_escape_label(command)}"}} {count}')
+        lines += [
+            "# TYPE vcfbot_commands_last_minute gauge",
+            f"vcfbot_commands_last_minute {stats['commands_last_minute']}",
+            "# TYPE vcfbot_conversions_total counter",
+            f"vcfbot_conversions_total {stats['conversions']}",
+            "# TYPE vcfbot_user_conversions_total counter",
+        ]
+        for user_id, count in by_user:
+            lines.append(f'vcfbot_user_conversions_total{{user_id="{_escape_label(user_id)}"}} {count}')
+        lines += [
+            "# TYPE vcfbot_contacts_total counter",
+            f"vcfbot_contacts_total {stats['contacts']}",
+            "# TYPE vcfbot_bytes_in_total counter",
+            f"vcfbot_bytes_in_total {stats['bytes_in']}",
+            "# TYPE vcfbot_bytes_out_total counter",
+            f"vcfbot_bytes_out_total {stats['bytes_out']}",
+            "# TYPE vcfbot_queue_depth gauge",
+            f"vcfbot_queue_depth {stats['queue_depth']}",
+            "# TYPE vcfbot_running_jobs gauge",
+            f"vcfbot_running_jobs {stats['running_jobs']}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -1,10 +1,28 @@
-import json
+import copy
 import os
+import threading
 from typing import Dict, List, Optional
 
+from user_storage import JsonUserStorage
+
+
 class UserManager:
-    def __init__(self, data_file: str = "data/users.json"):
+    def __init__(self, data_file: str = "data/users.json", storage=None, flush_interval: float = 0):
+        """
+        storage: backend with load()/save(users)/close(), JSON at data_file by default.
+        flush_interval: 0 saves on every change; otherwise changes only mark the users
+        dirty and a background thread, started by start(), saves them at most once per
+        flush_interval seconds.
+        """
         self.data_file = data_file
+        self.storage = storage or JsonUserStorage(data_file)
+        self.flush_interval = flush_interval
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._dirty = False
+        self._version = self._saved_version = 0
+        self._closed = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
         self.users: Dict[str, dict] = self._load_users()
         # Initialize owners list if not exists
         if not self._get_owners():
@@ -12,59 +30,102 @@ class UserManager:
             if owner_id:
                 self._add_owner(owner_id)
 
+    def start(self) -> None:
+        """Start the periodic flush thread in write-behind mode. Safe to call more than once."""
+        if self.flush_interval > 0 and self._flusher is None and not self._closed.is_set():
+            self._flusher = threading.Thread(target=self._flush_periodically, name="user-flush", daemon=True)
+            self._flusher.start()
+
     def _load_users(self) -> Dict[str, dict]:
-        """Load users from JSON file."""
-        if os.path.exists(self.data_file):
-            with open(self.data_file, 'r') as f:
-                return json.load(f)
-        return {}
+        """Load users from storage."""
+        return self.storage.load()
 
     def _save_users(self) -> None:
-        """Save users to JSON file."""
-        os.makedirs(os.path.dirname(self.data_file), exist_ok=True)
-        with open(self.data_file, 'w') as f:
-            json.dump(self.users, f, indent=4)
+        """Mark users as changed; saved now, or by the next periodic flush in write-behind mode."""
+        self._dirty = True
+        if self.flush_interval <= 0:
+            self.flush()
+
+    def _flush_periodically(self) -> None:
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Failed to save users: {str(e)}")
+
+    def flush(self) -> None:
+        """Save pending changes. Changes made meanwhile are picked up by the next flush."""
+        with self._lock:
+            if not self._dirty:
+                return
+            snapshot = copy.deepcopy(self.users)
+            self._dirty = False
+            self._version += 1
+            version = self._version
+        # Saved outside _lock so the flush thread never holds up changes with disk I/O
+        with self._flush_lock:
+            if version < self._saved_version:
+                return  # a newer snapshot was saved already
+            try:
+                self.storage.save(snapshot)
+            except BaseException:
+                self._dirty = True
+                raise
+            self._saved_version = version
+
+    def close(self) -> None:
+        """Stop the flush thread, save pending changes and close the storage."""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self.flush()
+        self.storage.close()
 
     def _get_owners(self) -> List[str]:
         """Get list of owner IDs."""
-        if "owners" not in self.users:
-            self.users["owners"] = []
-            self._save_users()
-        return self.users["owners"]
+        with self._lock:
+            if "owners" not in self.users:
+                self.users["owners"] = []
+                self._save_users()
+            return self.users["owners"]
 
     def _add_owner(self, user_id: str) -> None:
         """Add a user to owners list."""
-        owners = self._get_owners()
-        if str(user_id) not in owners:
-            owners.append(str(user_id))
-            self.users["owners"] = owners
-            self._save_users()
+        with self._lock:
+            owners = self._get_owners()
+            if str(user_id) not in owners:
+                owners.append(str(user_id))
+                self.users["owners"] = owners
+                self._save_users()
 
     def _remove_owner(self, user_id: str) -> bool:
         """Remove a user from owners list."""
-        owners = self._get_owners()
-        user_id_str = str(user_id)
-        if user_id_str in owners:
-            owners.remove(user_id_str)
-            self.users["owners"] = owners
-            self._save_users()
-            return True
-        return False
+        with self._lock:
+            owners = self._get_owners()
+            user_id_str = str(user_id)
+            if user_id_str in owners:
+                owners.remove(user_id_str)
+                self.users["owners"] = owners
+                self._save_users()
+                return True
+            return False
 
     def add_user(self, user_id: int, access_limit: Optional[int] = None) -> None:
         """Add a user to the whitelist."""
-        self.users[str(user_id)] = {
-            "access_limit": access_limit
-        }
-        self._save_users()
+        with self._lock:
+            self.users[str(user_id)] = {
+                "access_limit": access_limit
+            }
+            self._save_users()
 
     def remove_user(self, user_id: int) -> bool:
         """Remove a user from the whitelist."""
-        if str(user_id) in self.users:
-            del self.users[str(user_id)]
-            self._save_users()
-            return True
-        return False
+        with self._lock:
+            if str(user_id) in self.users:
+                del self.users[str(user_id)]
+                self._save_users()
+                return True
+            return False
 
     def is_whitelisted(self, user_id: int) -> bool:
         """Check if a user is whitelisted."""
@@ -77,22 +138,25 @@ class UserManager:
 
     def set_access_limit(self, user_id: int, limit: int) -> None:
         """Set user's access limit."""
-        if str(user_id) in self.users:
-            self.users[str(user_id)]["access_limit"] = limit
-            self._save_users()
+        with self._lock:
+            if str(user_id) in self.users:
+                self.users[str(user_id)]["access_limit"] = limit
+                self._save_users()
 
     def decrement_access_limit(self, user_id: int) -> None:
         """Decrement user's access limit."""
         user_id_str = str(user_id)
-        if user_id_str in self.users and self.users[user_id_str]["access_limit"] is not None:
-            self.users[user_id_str]["access_limit"] -= 1
-            if self.users[user_id_str]["access_limit"] <= 0:
-                self.users[user_id_str]["access_limit"] = 0
-            self._save_users()
+        with self._lock:
+            if user_id_str in self.users and self.users[user_id_str]["access_limit"] is not None:
+                self.users[user_id_str]["access_limit"] -= 1
+                if self.users[user_id_str]["access_limit"] <= 0:
+                    self.users[user_id_str]["access_limit"] = 0
+                self._save_users()
 
     def get_all_users(self) -> Dict[str, dict]:
         """Get all users and their limits."""
-        users_copy = self.users.copy()
+        with self._lock:
+            users_copy = self.users.copy()
         if "owners" in users_copy:
             del users_copy["owners"]
         return users_copy
@@ -0,0 +1,104 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from typing import Dict
+
+
+class JsonUserStorage:
+    """Users kept in a single JSON file, replaced atomically on every save."""
+
+    def __init__(self, data_file: str = "data/users.json"):
+        self.data_file = data_file
+
+    def load(self) -> Dict[str, object]:
+        if os.path.exists(self.data_file):
+            with open(self.data_file, 'r') as f:
+                return json.load(f)
+        return {}
+
+    def save(self, users: Dict[str, object]) -> None:
+        """Write to a temporary file, fsync it and rename it over the old file."""
+        directory = os.path.dirname(self.data_file) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".users-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(users, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.data_file)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        _fsync_directory(directory)
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteUserStorage:
+    """
+    Users kept in an SQLite database in WAL mode, one row per entry
+    (every user, plus the "owners" list). Saves only write the rows that changed.
+    An empty database is seeded from legacy_json_file when it exists.
+    """
+
+    def __init__(self, db_file: str = "data/users.db", legacy_json_file: str = "data/users.json"):
+        self.db_file = db_file
+        self.legacy_json_file = legacy_json_file
+        os.makedirs(os.path.dirname(db_file) or ".", exist_ok=True)
+        # Saves may come from the write-behind thread
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS users (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._saved: Dict[str, str] = {}
+
+    def load(self) -> Dict[str, object]:
+        with self._lock, self._conn:
+            # Check and seed in one write transaction so the import happens exactly once
+            self._conn.execute("BEGIN IMMEDIATE")
+            rows = self._conn.execute("SELECT key, value FROM users").fetchall()
+            if not rows and self.legacy_json_file and os.path.exists(self.legacy_json_file):
+                # First start on SQLite, import the JSON whitelist right away
+                rows = [(key, json.dumps(value))
+                        for key, value in JsonUserStorage(self.legacy_json_file).load().items()]
+                self._conn.executemany("INSERT INTO users (key, value) VALUES (?, ?)", rows)
+        self._saved = dict(rows)
+        return {key: json.loads(value) for key, value in rows}
+
+    def save(self, users: Dict[str, object]) -> None:
+        encoded = {key: json.dumps(value) for key, value in users.items()}
+        changed = [(key, value) for key, value in encoded.items() if self._saved.get(key) != value]
+        removed = [(key,) for key in self._saved if key not in encoded]
+        if not changed and not removed:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO users (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value", changed)
+            self._conn.executemany("DELETE FROM users WHERE key = ?", removed)
+        self._saved = encoded
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _fsync_directory(directory: str) -> None:
+    """Make a rename in directory durable. Not every platform allows opening a directory."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
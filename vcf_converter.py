@@ -0,0 +1,621 @@
+import contextlib
+import io
+import multiprocessing
+import os
+import pickle
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from phone_normalizer import DEFAULT_NORMALIZER, PhoneNormalizer, RejectedRows
+from sheet_reader import read_contacts
+
+VCARD_TEMPLATE = "BEGIN:VCARD\nVERSION:3.0\nFN:{name}\nTEL;TYPE=CELL:{phone}\nEND:VCARD\n\n"
+
+# Inputs at least this large are rendered on the process pool when parallel=None
+PARALLEL_THRESHOLD_BYTES = 8 * 1024 * 1024
+# Rows per worker task when the output is a single file
+PARALLEL_SHARD_ROWS = 100_000
+# Lines normalized together in the TXT path
+TXT_BATCH_LINES = 65_536
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_workers = os.cpu_count() or 1
+
+
+class ConversionStats:
+    """
+    Filled in by a conversion: how many contacts were written and the seconds spent
+    per stage ("parse", "render", "write"). Stages are timed per batch, not per contact.
+    With the process pool, "render" is the time waiting for the workers, which also write their shards.
+    """
+
+    def __init__(self):
+        self.contacts = 0
+        self.stages = {}
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def timed(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+
+def _timed(stats: Optional[ConversionStats], stage: str):
+    return stats.timed(stage) if stats is not None else contextlib.nullcontext()
+
+
+class NamePattern:
+    """Contact name pattern where every "{index}" is replaced by the contact number."""
+
+    def __init__(self, pattern: str):
+        self.pattern = pattern
+        self._parts = pattern.split("{index}")
+
+    def __call__(self, index: int) -> str:
+        return self.pattern.replace("{index}", str(index))
+
+    def render_many(self, index_strings: pd.Series) -> pd.Series:
+        """Render the pattern for a whole Series of index strings at once."""
+        names = pd.Series(self._parts[0], index=index_strings.index, dtype=object)
+        for part in self._parts[1:]:
+            names = names + index_strings + part
+        return names
+
+
+# Process pool
+def configure_process_pool(max_workers: int) -> None:
+    """Set the number of worker processes used for large inputs."""
+    global _process_pool_workers
+    shutdown_process_pool()
+    _process_pool_workers = max(1, max_workers)
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """
+    Return the shared process pool, starting it on first use.
+    Workers are forked so they do not re-import the bot's main module; call this
+    once at startup, before other threads exist, to fork from a clean process.
+    """
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(
+            max_workers=_process_pool_workers,
+            mp_context=multiprocessing.get_context('fork')
+        )
+        # Fork all workers now instead of on the first large job
+        _process_pool.submit(os.getpid).result()
+    return _process_pool
+
+
+def shutdown_process_pool() -> None:
+    """Stop the shared process pool if it is running."""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
+def _use_process_pool(input_file, custom_name_func, parallel, parallel_threshold) -> bool:
+    if parallel is False:
+        return False
+    if parallel is None and os.path.getsize(input_file) < parallel_threshold:
+        return False
+    try:
+        pickle.dumps(custom_name_func)
+    except Exception:
+        # Lambdas and closures cannot be sent to worker processes
+        return False
+    return True
+
+
+def _run_on_process_pool(tasks, on_result: Optional[Callable[[str], None]] = None) -> List[str]:
+    """
+    Run (func, *args) tasks on the process pool and return their results in order.
+    on_result is called with each result as soon as it and all earlier ones are done.
+    """
+    pool = get_process_pool()
+    futures = [pool.submit(*task) for task in tasks]
+    results = []
+    for future in futures:
+        results.append(future.result())
+        if on_result is not None:
+            on_result(results[-1])
+    return results
+
+
+def _concat_files(part_files: List[str], output_file: str) -> None:
+    with open(output_file, 'wb') as out:
+        for part_file in part_files:
+            with open(part_file, 'rb') as part:
+                shutil.copyfileobj(part, out)
+            os.remove(part_file)
+
+
+def _finish_parallel(tasks, output_files, output_dir, split_size, custom_filename,
+                     on_file=None, stats=None) -> Optional[List[str]]:
+    """Run shard tasks and join unsplit parts. Returns None to fall back to in-process conversion."""
+    emitted = []
+
+    def on_result(output_file):
+        emitted.append(output_file)
+        if split_size and on_file is not None:
+            on_file(output_file)
+
+    try:
+        with _timed(stats, 'render'):
+            _run_on_process_pool(tasks, on_result)
+    except BrokenProcessPool:
+        shutdown_process_pool()
+        if split_size and emitted and on_file is not None:
+            # Files were already handed out, converting again would duplicate them
+            raise
+        _remove_files(output_files)
+        return None
+
+    if split_size or not output_files:
+        return output_files
+    output_file = os.path.join(output_dir, f"{custom_filename}.vcf")
+    with _timed(stats, 'write'):
+        _concat_files(output_files, output_file)
+    if on_file is not None:
+        on_file(output_file)
+    return [output_file]
+
+
+def _open_output(path):
+    return open(path, 'w', encoding='utf-8')
+
+
+def _remove_files(paths: Iterable[str]) -> None:
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# TXT conversion
+def _txt_phone(line: str) -> str:
+    """The phone field of a "name,phone" line, or the whole line when there is no phone."""
+    name, _, rest = line.partition(',')
+    return rest.partition(',')[0] or name
+
+
+def _parse_txt_lines(lines: Iterable[str], first_index: int = 1,
+                     normalizer: Optional[PhoneNormalizer] = None, rejected: Optional[RejectedRows] = None):
+    """
+    Yield (index, phone) for every non-empty line with a valid phone number.
+    Lines are normalized in batches; rejected lines still use up their index.
+    """
+    normalizer = normalizer or DEFAULT_NORMALIZER
+    index = first_index - 1
+    lines = iter(lines)
+    while True:
+        batch = [line.strip() for line in islice(lines, TXT_BATCH_LINES)]
+        if not batch:
+            return
+        batch = [line for line in batch if line]
+        phones = normalizer.normalize_many([_txt_phone(line) for line in batch])
+        for line, phone in zip(batch, phones):
+            index += 1
+            if phone is None:
+                if rejected is not None:
+                    rejected.add(index, line)
+                continue
+            yield index, phone
+
+
+class _ChunkReader(io.RawIOBase):
+    """
+    Binary stream over an iterable of byte chunks, pulled only when the reader needs more.
+    With stats, the time spent waiting for chunks is recorded as "download".
+    """
+
+    def __init__(self, chunks: Iterable[bytes], stats: Optional[ConversionStats] = None):
+        self._chunks = iter(chunks)
+        self._stats = stats
+        self._pending = memoryview(b'')
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending:
+            start = time.perf_counter()
+            chunk = next(self._chunks, None)
+            if self._stats is not None:
+                self._stats.add_time('download', time.perf_counter() - start)
+            if chunk is None:
+                return 0
+            self._pending = memoryview(chunk)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+    def close(self) -> None:
+        # Lets a download feeding the chunks stop early
+        if hasattr(self._chunks, 'close'):
+            self._chunks.close()
+        super().close()
+
+
+def _is_path(input_file) -> bool:
+    return isinstance(input_file, (str, os.PathLike))
+
+
+def _iter_txt_contacts(input_file, normalizer=None, rejected=None, stats=None):
+    """Yield (index, phone) for every valid line, reading the file (or the byte chunks) lazily."""
+    if _is_path(input_file):
+        txt_file = open(input_file, 'r', encoding='utf-8')
+    else:
+        # Decoded exactly like open(): UTF-8 with universal newlines
+        txt_file = io.TextIOWrapper(io.BufferedReader(_ChunkReader(input_file, stats)), encoding='utf-8')
+    with txt_file:
+        yield from _parse_txt_lines(txt_file, normalizer=normalizer, rejected=rejected)
+
+
+def _render_vcards(contacts, custom_name_func):
+    """Render (index, phone) pairs into vCard strings one at a time."""
+    for index, phone in contacts:
+        # Use the custom name pattern and add sequence number
+        yield VCARD_TEMPLATE.format(name=f"{custom_name_func(index)} {index}", phone=phone)
+
+
+def _render_vcard_batches(contacts, custom_name_func, stats=None):
+    """
+    Render (index, phone) pairs into vCard strings a batch at a time.
+    With stats, counts the contacts and times each batch: pulling it from the parser ("parse"),
+    rendering it ("render") and the consumer writing it out while it is yielded ("write").
+    """
+    contacts = iter(contacts)
+    while True:
+        start = time.perf_counter()
+        waited = stats.stages.get('download', 0.0) if stats is not None else 0.0
+        batch = list(islice(contacts, TXT_BATCH_LINES))
+        parsed = time.perf_counter()
+        if stats is not None:
+            # A streamed input records its wait for the network as "download", keep it out of "parse"
+            stats.add_time('parse', parsed - start - (stats.stages.get('download', 0.0) - waited))
+        if not batch:
+            return
+        vcards = [VCARD_TEMPLATE.format(name=f"{custom_name_func(index)} {index}", phone=phone)
+                  for index, phone in batch]
+        if stats is None:
+            yield from vcards
+            continue
+        rendered = time.perf_counter()
+        stats.contacts += len(batch)
+        stats.add_time('render', rendered - parsed)
+        yield from vcards
+        stats.add_time('write', time.perf_counter() - rendered)
+
+
+def _write_split_files(vcards, output_dir, split_size, custom_filename, sequence_start=1, on_file=None,
+                       opener=_open_output):
+    """
+    Write vCards straight into the current split file, rolling over every split_size cards.
+    Only one vCard is held in memory at a time; on_file is called with each finished file.
+    Returns: list of created files
+    """
+    output_files = []
+    vcf_file = None
+    written = 0
+    try:
+        for vcard in vcards:
+            if vcf_file is None:
+                if split_size:
+                    filename = f"{custom_filename}{sequence_start + len(output_files)}.vcf"
+                else:
+                    filename = f"{custom_filename}.vcf"
+                output_file = os.path.join(output_dir, filename)
+                vcf_file = opener(output_file)
+                output_files.append(output_file)
+
+            vcf_file.write(vcard)
+            written += 1
+
+            if split_size and written == split_size:
+                vcf_file.close()
+                vcf_file = None
+                written = 0
+                if on_file is not None:
+                    on_file(output_file)
+    except BaseException:
+        if vcf_file is not None:
+            vcf_file.close()
+        raise
+
+    if vcf_file is not None:
+        vcf_file.close()
+        if on_file is not None:
+            on_file(output_file)
+    return output_files
+
+
+def _scan_txt_shards(input_file, rows_per_shard, normalizer=None,
+                     rejected=None) -> Optional[List[Tuple[int, int, int, int]]]:
+    """
+    Cut the file into byte ranges holding rows_per_shard valid contacts each,
+    recording rejected lines on the way.
+    Returns: list of (start_offset, end_offset, first_index, contacts), or None when the file
+    uses bare CR line breaks that a byte-level scan cannot number like text mode does.
+    """
+    normalizer = normalizer or DEFAULT_NORMALIZER
+    shards = []
+    shard_start = offset = 0
+    first_index = 1
+    index = 0
+    rows = 0
+    with open(input_file, 'rb') as f:
+        while True:
+            raw_lines = list(islice(f, TXT_BATCH_LINES))
+            if not raw_lines:
+                break
+            lines, ends = [], []
+            for raw in raw_lines:
+                if b'\r' in raw.rstrip(b'\r\n'):
+                    return None
+                offset += len(raw)
+                line = raw.decode('utf-8').strip()
+                if line:
+                    lines.append(line)
+                    ends.append(offset)
+
+            phones = normalizer.normalize_many([_txt_phone(line) for line in lines])
+            for line, end, phone in zip(lines, ends, phones):
+                index += 1
+                if phone is None:
+                    if rejected is not None:
+                        rejected.add(index, line)
+                    continue
+                rows += 1
+                if rows == rows_per_shard:
+                    shards.append((shard_start, end, first_index, rows))
+                    first_index = index + 1
+                    shard_start = end
+                    rows = 0
+    if rows:
+        shards.append((shard_start, offset, first_index, rows))
+    return shards
+
+
+def _render_txt_shard(input_file, start, end, first_index, custom_name_func, normalizer, output_file) -> str:
+    """Worker task: render one byte range of a TXT file into output_file."""
+    with open(input_file, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    contacts = _parse_txt_lines(data.decode('utf-8').split('\n'), first_index, normalizer)
+    with open(output_file, 'w', encoding='utf-8') as vcf_file:
+        vcf_file.writelines(_render_vcards(contacts, custom_name_func))
+    return output_file
+
+
+def _txt_to_vcf_parallel(input_file, output_dir, custom_name_func, split_size, custom_filename,
+                         sequence_start=1, on_file=None, normalizer=None,
+                         rejected=None, stats=None) -> Optional[List[str]]:
+    """Render a TXT file on the process pool, one split file per task. Returns None to fall back."""
+    if split_size is not None and split_size < 0:
+        return None
+    scan_rejected = RejectedRows()
+    with _timed(stats, 'parse'):
+        shards = _scan_txt_shards(input_file, split_size or PARALLEL_SHARD_ROWS, normalizer, scan_rejected)
+    if shards is None:
+        return None
+
+    if split_size:
+        output_files = [os.path.join(output_dir, f"{custom_filename}{sequence_start + i}.vcf")
+                         for i in range(len(shards))]
+    else:
+        output_files = [os.path.join(output_dir, f"{custom_filename}.vcf.part{i}")
+                        for i in range(len(shards))]
+
+    tasks = [(_render_txt_shard, input_file, start, end, first_index, custom_name_func, normalizer, output_file)
+             for (start, end, first_index, _), output_file in zip(shards, output_files)]
+    output_files = _finish_parallel(tasks, output_files, output_dir, split_size, custom_filename, on_file, stats)
+    if output_files is not None:
+        if rejected is not None:
+            rejected.merge(scan_rejected)
+        if stats is not None:
+            stats.contacts += sum(shard[3] for shard in shards)
+    return output_files
+
+
+def txt_to_vcf(input_file, output_dir, custom_name_func, split_size, custom_filename, sequence_start=1,
+               parallel=None, parallel_threshold=PARALLEL_THRESHOLD_BYTES, on_file=None, opener=None,
+               normalizer=None, rejected=None, stats=None):
+    """
+    Convert a TXT contact list to VCF files.
+    input_file: path of the TXT file, or an iterable of its bytes in chunks (such as a download
+    in progress), which is parsed as the chunks arrive and always converted in-process.
+    parallel: True forces the process pool, False forces in-process conversion,
+    None uses the process pool for files of at least parallel_threshold bytes.
+    on_file: called with each output file as soon as it is complete, in order.
+    opener: opens a writable text stream for an output path instead of a plain file;
+    outputs are then always rendered in-process.
+    normalizer: PhoneNormalizer to clean phone numbers with (DEFAULT_NORMALIZER by default).
+    rejected: RejectedRows collecting the lines whose phone number was rejected.
+    stats: ConversionStats to fill in.
+    """
+    try:
+        normalizer = normalizer or DEFAULT_NORMALIZER
+        os.makedirs(output_dir, exist_ok=True)
+        if opener is None and _is_path(input_file) \
+                and _use_process_pool(input_file, custom_name_func, parallel, parallel_threshold):
+            output_files = _txt_to_vcf_parallel(input_file, output_dir, custom_name_func, split_size,
+                                                custom_filename, sequence_start, on_file, normalizer, rejected,
+                                                stats)
+            if output_files is not None:
+                return output_files
+
+        contacts = _iter_txt_contacts(input_file, normalizer, rejected, stats)
+        vcards = _render_vcard_batches(contacts, custom_name_func, stats)
+        return _write_split_files(vcards, output_dir, split_size, custom_filename, sequence_start, on_file,
+                                  opener or _open_output)
+    except Exception as e:
+        raise Exception(f"Error in txt_to_vcf: {str(e)}")
+
+
+# Excel conversion
+def _normalize_dataframe(df, normalizer=None, rejected=None) -> Tuple[np.ndarray, pd.Series]:
+    """
+    Pick the contacts out of a sheet with column-wise operations.
+    The first column is the name, the second the phone (falls back to the name when missing).
+    Rows with an empty name or an invalid phone are skipped but still consume their sequence number.
+    Returns: (sequence numbers, normalized phones) of the kept rows
+    """
+    if df.empty:
+        return np.array([], dtype=np.int64), pd.Series([], dtype=object)
+
+    normalizer = normalizer or DEFAULT_NORMALIZER
+    names = df.iloc[:, 0]
+    phones = df.iloc[:, 1] if df.shape[1] > 1 else names
+    keep = names.notna().to_numpy()
+    if not keep.any():
+        return np.array([], dtype=np.int64), pd.Series([], dtype=object)
+
+    names = names[keep].astype(str).str.strip().reset_index(drop=True)
+    phones = phones[keep].reset_index(drop=True)
+    if pd.api.types.is_float_dtype(phones):
+        # Numbers read as floats would otherwise keep their ".0"
+        phones = phones.map('{:.0f}'.format, na_action='ignore')
+    # Take the mask first: astype(str) may convert an unpickled object column in place
+    phone_missing = phones.isna().to_numpy()
+    raw_phones = phones.astype(str).str.strip().mask(phone_missing, names)
+    phones = normalizer.normalize_series(raw_phones)
+
+    # Excel rows are 0-based, add 1 for consistency with the TXT numbering
+    indices = np.flatnonzero(keep) + 1
+    valid = phones.notna().to_numpy()
+    if rejected is not None and not valid.all():
+        rejected.extend(indices[~valid], raw_phones[~valid])
+    return indices[valid], phones[valid].reset_index(drop=True)
+
+
+def _render_contacts(indices, phones, custom_name_func):
+    """Render sequence numbers and phones into an array of vCard strings using column-wise operations."""
+    if len(indices) == 0:
+        return np.array([], dtype=object)
+
+    index_strings = pd.Series(indices).astype(str)
+    if isinstance(custom_name_func, NamePattern):
+        formatted_names = custom_name_func.render_many(index_strings)
+    else:
+        formatted_names = pd.Series([custom_name_func(int(i)) for i in indices], dtype=object)
+
+    vcards = ("BEGIN:VCARD\nVERSION:3.0\nFN:" + formatted_names + " " + index_strings
+              + "\nTEL;TYPE=CELL:" + phones.reset_index(drop=True) + "\nEND:VCARD\n\n")
+    return vcards.to_numpy(dtype=object)
+
+
+def _write_vcard_chunks(vcards, output_dir, split_size, custom_filename, sequence_start=1, on_file=None,
+                        opener=_open_output):
+    """
+    Write an array of rendered vCards by slicing it into split_size chunks.
+    on_file is called with each finished file.
+    Returns: list of created files
+    """
+    output_files = []
+    if len(vcards) == 0:
+        return output_files
+
+    chunk_size = split_size if split_size and split_size > 0 else len(vcards)
+    for file_index, start in enumerate(range(0, len(vcards), chunk_size), start=sequence_start):
+        if split_size:
+            output_file = os.path.join(output_dir, f"{custom_filename}{file_index}.vcf")
+        else:
+            output_file = os.path.join(output_dir, f"{custom_filename}.vcf")
+        with opener(output_file) as vcf_file:
+            vcf_file.write(''.join(vcards[start:start + chunk_size]))
+        output_files.append(output_file)
+        if on_file is not None:
+            on_file(output_file)
+    return output_files
+
+
+def _render_contacts_shard(indices, phones, custom_name_func, output_file) -> str:
+    """Worker task: render a slice of the normalized contacts into output_file."""
+    vcards = _render_contacts(indices, phones, custom_name_func)
+    with open(output_file, 'w', encoding='utf-8') as vcf_file:
+        vcf_file.write(''.join(vcards))
+    return output_file
+
+
+def _excel_to_vcf_parallel(indices, phones, output_dir, custom_name_func, split_size, custom_filename,
+                           sequence_start=1, on_file=None, stats=None) -> Optional[List[str]]:
+    """Render normalized contacts on the process pool, one split file per task. Returns None to fall back."""
+    if split_size is not None and split_size < 0:
+        return None
+    rows_per_shard = split_size or PARALLEL_SHARD_ROWS
+
+    tasks, output_files = [], []
+    for i, start in enumerate(range(0, len(indices), rows_per_shard)):
+        end = start + rows_per_shard
+        if split_size:
+            output_file = os.path.join(output_dir, f"{custom_filename}{sequence_start + i}.vcf")
+        else:
+            output_file = os.path.join(output_dir, f"{custom_filename}.vcf.part{i}")
+        tasks.append((_render_contacts_shard, indices[start:end], phones[start:end], custom_name_func, output_file))
+        output_files.append(output_file)
+
+    return _finish_parallel(tasks, output_files, output_dir, split_size, custom_filename, on_file, stats)
+
+
+def _read_spreadsheet(input_file, engine, all_sheets, parallel, parallel_threshold) -> pd.DataFrame:
+    if not all_sheets or not _use_process_pool(input_file, None, parallel, parallel_threshold):
+        return read_contacts(input_file, engine, all_sheets)
+    try:
+        return read_contacts(input_file, engine, all_sheets, get_process_pool())
+    except BrokenProcessPool:
+        shutdown_process_pool()
+        return read_contacts(input_file, engine, all_sheets)
+
+
+def excel_to_vcf(input_file, output_dir, custom_name_func, split_size, custom_filename, sequence_start=1,
+                 parallel=None, parallel_threshold=PARALLEL_THRESHOLD_BYTES, on_file=None, opener=None,
+                 normalizer=None, rejected=None, stats=None, engine='auto', all_sheets=False):
+    """
+    Convert a spreadsheet contact list (.xlsx, .xls, .ods or .csv) to VCF files.
+    parallel: True forces the process pool, False forces in-process conversion,
+    None uses the process pool for files of at least parallel_threshold bytes.
+    on_file: called with each output file as soon as it is complete, in order.
+    opener: opens a writable text stream for an output path instead of a plain file;
+    outputs are then always rendered in-process.
+    normalizer: PhoneNormalizer to clean phone numbers with (DEFAULT_NORMALIZER by default).
+    rejected: RejectedRows collecting the rows whose phone number was rejected.
+    stats: ConversionStats to fill in.
+    engine: spreadsheet reader, see sheet_reader.resolve_engine.
+    all_sheets: read the contacts of every sheet instead of only the first; sheets are
+    read in parallel on the process pool under the same rules as rendering.
+    """
+    try:
+        with _timed(stats, 'parse'):
+            df = _read_spreadsheet(input_file, engine, all_sheets, parallel, parallel_threshold)
+            # Normalization is vectorized and cheap, only rendering is spread over the process pool
+            indices, phones = _normalize_dataframe(df, normalizer, rejected)
+        os.makedirs(output_dir, exist_ok=True)
+        if stats is not None:
+            stats.contacts += len(indices)
+        if opener is None and _use_process_pool(input_file, custom_name_func, parallel, parallel_threshold):
+            output_files = _excel_to_vcf_parallel(indices, phones, output_dir, custom_name_func,
+                                                  split_size, custom_filename, sequence_start, on_file, stats)
+            if output_files is not None:
+                return output_files
+
+        with _timed(stats, 'render'):
+            vcards = _render_contacts(indices, phones, custom_name_func)
+        with _timed(stats, 'write'):
+            return _write_vcard_chunks(vcards, output_dir, split_size, custom_filename, sequence_start, on_file,
+                                       opener or _open_output)
+    except Exception as e:
+        raise Exception(f"Error in excel_to_vcf: {str(e)}")
@@ -0,0 +1,137 @@
+import hashlib
+import re
+from typing import List, NamedTuple, Set
+
+MERGE_CHUNK_SIZE = 1024 * 1024
+VCARD_BEGIN = b'BEGIN:VCARD'
+VCARD_END = b'END:VCARD'
+_NON_DIGITS = re.compile(rb'\D')
+
+
+class MergeResult(NamedTuple):
+    merged: int
+    duplicates: int
+
+
+def normalize_tel(value: bytes) -> bytes:
+    """Digits of a TEL value, so '+62 812-3456' and '628123456' compare equal."""
+    return _NON_DIGITS.sub(b'', value)
+
+
+class PhoneIndex:
+    """
+    Set of phone numbers seen so far. Only a 64-bit hash of each number is kept,
+    which keeps millions of numbers in memory cheaply.
+    """
+
+    def __init__(self):
+        self._hashes: Set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    @staticmethod
+    def _key(number: bytes) -> int:
+        return int.from_bytes(hashlib.blake2b(number, digest_size=8).digest(), 'little')
+
+    def add(self, number: bytes) -> bool:
+        """Add number and return True if it was not in the index yet."""
+        key = self._key(number)
+        if key in self._hashes:
+            return False
+        self._hashes.add(key)
+        return True
+
+
+def _tel_value(line: bytes):
+    """Return the value of a TEL property line (e.g. 'item1.TEL;TYPE=CELL:+62...'), or None."""
+    name, sep, value = line.partition(b':')
+    if not sep:
+        return None
+    name = name.split(b';', 1)[0].rsplit(b'.', 1)[-1]
+    if name.strip().upper() != b'TEL':
+        return None
+    return value.strip()
+
+
+def _copy_counting(infile, outfile) -> int:
+    """Copy infile to outfile in chunks and return the number of vCards copied."""
+    count = 0
+    tail = b''
+    overlap = len(VCARD_BEGIN) - 1
+    while True:
+        chunk = infile.read(MERGE_CHUNK_SIZE)
+        if not chunk:
+            return count
+        outfile.write(chunk)
+        # Keep the end of the previous chunk so markers split across chunks are counted
+        window = (tail + chunk).upper()
+        count += window.count(VCARD_BEGIN)
+        tail = window[-overlap:]
+
+
+def _copy_deduplicated(infile, outfile, index: PhoneIndex) -> tuple:
+    """
+    Copy infile to outfile card by card, dropping cards whose phone numbers were all
+    seen before. Cards without a TEL are kept. Returns (kept, duplicates).
+    """
+    kept = duplicates = 0
+    card: List[bytes] = []
+    for line in infile:
+        stripped = line.strip()
+        if not card:
+            if stripped.upper() == VCARD_BEGIN:
+                card.append(line)
+            else:
+                # Text outside a vCard is copied as is
+                outfile.write(line)
+            continue
+
+        card.append(line)
+        if stripped.upper() != VCARD_END:
+            continue
+
+        numbers = set()
+        for card_line in card:
+            value = _tel_value(card_line)
+            if value is not None:
+                number = normalize_tel(value)
+                if number:
+                    numbers.add(number)
+        new_numbers = [number for number in numbers if index.add(number)]
+        if numbers and not new_numbers:
+            duplicates += 1
+        else:
+            kept += 1
+            outfile.writelines(card)
+        card = []
+
+    if card:
+        # Unterminated card at the end of the file
+        kept += 1
+        outfile.writelines(card)
+    return kept, duplicates
+
+
+def merge_vcf(input_files: List[str], output_file: str, dedupe: bool = False) -> MergeResult:
+    """
+    Merge VCF files into output_file without loading them into memory.
+    With dedupe, vCards whose phone numbers (normalized TEL) already appeared are dropped.
+    """
+    try:
+        merged = duplicates = 0
+        index = PhoneIndex() if dedupe else None
+        with open(output_file, 'wb') as outfile:
+            for file_path in input_files:
+                with open(file_path, 'rb') as infile:
+                    if dedupe:
+                        kept, dropped = _copy_deduplicated(infile, outfile, index)
+                        duplicates += dropped
+                    else:
+                        kept = _copy_counting(infile, outfile)
+                merged += kept
+                outfile.write(b'\n')  # Ensure new line between files
+        return MergeResult(merged, duplicates)
+    except Exception as e:
+        raise Exception(f"Error in merge_vcf: {str(e)}")
+
@@ -0,0 +1,77 @@
+import hmac
+from typing import Callable, Dict, Optional
+
+from aiohttp import web
+from telegram import Update
+
+# Header Telegram sends the secret_token given to setWebhook in
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """
+    Receives the updates Telegram POSTs to path and puts them on application.update_queue,
+    where the handlers registered for polling pick them up unchanged. Requests without the
+    matching secret token are refused. GET /healthz answers 200 while the application is
+    running (503 otherwise) with queue figures, extended by health() when given.
+    """
+
+    def __init__(self, application, path: str = "/webhook", secret_token: Optional[str] = None,
+                 health: Optional[Callable[[], Dict[str, object]]] = None):
+        self.application = application
+        self.path = path
+        self.secret_token = secret_token
+        self.health = health
+        self.port: Optional[int] = None
+        self.received = 0
+        self.rejected = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self.path, self._handle_update)
+        app.router.add_get("/healthz", self._handle_health)
+        return app
+
+    async def start(self, listen: str = "0.0.0.0", port: int = 8443) -> None:
+        self._runner = web.AppRunner(self.make_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, listen, port)
+        await site.start()
+        # The bound port, when port 0 picked a free one
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _authorized(self, request: web.Request) -> bool:
+        if self.secret_token is None:
+            return True
+        received = request.headers.get(SECRET_HEADER, "").encode()
+        return hmac.compare_digest(received, self.secret_token.encode())
+
+    async def _handle_update(self, request: web.Request) -> web.Response:
+        if not self._authorized(request):
+            self.rejected += 1
+            return web.Response(status=403)
+        try:
+            update = Update.de_json(await request.json(), self.application.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            print(f"Ignoring malformed webhook update: {str(e)}")
+            return web.Response(status=400)
+        if update is None:
+            return web.Response(status=400)
+        self.received += 1
+        # Answer right away, Telegram waits for the reply before sending the chat's next update
+        await self.application.update_queue.put(update)
+        return web.Response()
+
+    async def _handle_health(self, request: web.Request) -> web.Response:
+        running = self.application.running
+        body = {'status': 'ok' if running else 'stopped', 'received': self.received, 'rejected': self.rejected,
+                'pending_updates': self.application.update_queue.qsize()}
+        if self.health is not None:
+            body.update(self.health())
+        return web.json_response(body, status=200 if running else 503)